@@ -36,17 +36,26 @@ def generate_text(prompt: str) -> str:
         logger.error(f"❌ Gemini Text Generation Error: {e}")
         return "AI Error: Failed to generate response."
 
-def analyze_image_with_text(image_bytes: bytes, prompt: str) -> str:
+def analyze_image_with_text(image_bytes, prompt: str) -> str:
     """
     Analyze an image using Gemini Pro Vision.
+
+    image_bytes may be a PreparedImage from app.utils.image_pool (sent as
+    is; preferred, since decoding already happened on the process pool),
+    bytes, or a readable binary file object (an open upload, or the mmap
+    from open_upload_buffer), which is decoded here.
     """
     try:
         model = get_gemini_model("gemini-1.5-flash")
         if not model: return "AI Error: Model not available"
 
-        import PIL.Image
-        import io
-        image = PIL.Image.open(io.BytesIO(image_bytes))
+        if hasattr(image_bytes, "as_part"):
+            image = image_bytes.as_part()
+        else:
+            import PIL.Image
+            import io
+            source = image_bytes if hasattr(image_bytes, "read") else io.BytesIO(image_bytes)
+            image = PIL.Image.open(source)
 
         response = model.generate_content([prompt, image])
         return response.text
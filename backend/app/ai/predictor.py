@@ -2,10 +2,11 @@
 AI Prediction functions for MediFusion backend.
 Uses Google Gemini API for fast, accurate medical analysis.
 """
-from typing import List, Union
+from typing import BinaryIO, List, Union
 import json
 import logging
 from app.ai.gemini_service import generate_text, analyze_image_with_text
+from app.utils.image_pool import PreparedImage
 
 logger = logging.getLogger(__name__)
 
@@ -71,9 +72,11 @@ def analyze_symptoms(symptoms_text: Union[str, List[str]]) -> dict:
 # --------------------------
 # X-ray Analysis
 # --------------------------
-def analyze_image_bytes(image_bytes: bytes) -> dict:
+def analyze_image_bytes(image_bytes: Union[bytes, BinaryIO, PreparedImage]) -> dict:
     """
     Analyze chest X-ray image using Gemini Vision.
+    Accepts a PreparedImage (see app.utils.image_pool), bytes, or a binary
+    file object / mmap of the stored upload. Blocks on the network call.
     """
     prompt = """
     Analyze this medical image (Chest X-Ray) as an expert radiologist.
@@ -118,7 +121,7 @@ def analyze_image_bytes(image_bytes: bytes) -> dict:
 # --------------------------
 # Prescription Analysis
 # --------------------------
-def analyze_prescription(image_bytes: bytes) -> dict:
+def analyze_prescription(image_bytes: Union[bytes, BinaryIO, PreparedImage]) -> dict:
     """
     Analyze prescription/medicine image using Gemini Vision.
     """
@@ -1,48 +1,105 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.core.database import get_db
+from app.core.database import get_read_db, ReplicaSessionLocal
 from app.models.patient_case import PatientCase
-from app.models.user import User
+from app.schemas.case_schema import CaseOut
+from app.services.stats_service import read_stats
+from app.services.export_service import EXPORT_FORMATS, MEDIA_TYPES, parquet_available, stream_export
+from app.utils.pagination import keyset_paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.serialization import parse_fields, project_columns, list_response
+from app.utils.etag import weak_etag, is_not_modified, not_modified, set_etag
 from app.utils.security import require_role
 
 router = APIRouter()
 
 @router.get("/stats", dependencies=[Depends(require_role("admin"))])
-def get_admin_stats(db: Session = Depends(get_db)):
+def get_admin_stats(request: Request, response: Response, db: Session = Depends(get_read_db)):
     """
     Get analytics for the admin dashboard.
+    Served from the case_stats_rollup counters, so cost is independent of table size.
+    The ETag is derived from the same counters (304 on If-None-Match when unchanged).
     """
-    # 1. Total Cases
-    total_cases = db.query(PatientCase).count()
-    
-    # 2. Cases by Status
-    status_counts = db.query(
-        PatientCase.status, func.count(PatientCase.status)
-    ).group_by(PatientCase.status).all()
-    
-    # 3. Disease Distribution (from X-ray results)
-    # This is a bit complex with JSON, so we'll do a simple approximation in Python for now
-    # In production, use JSON operators in SQL
-    cases_with_xray = db.query(PatientCase).filter(PatientCase.xray_result.isnot(None)).all()
-    disease_counts = {"pneumonia": 0, "normal": 0, "other": 0}
-    
-    for case in cases_with_xray:
-        if case.xray_result and "label" in case.xray_result:
-            label = case.xray_result["label"].lower()
-            if "pneumonia" in label:
-                disease_counts["pneumonia"] += 1
-            elif "normal" in label:
-                disease_counts["normal"] += 1
-            else:
-                disease_counts["other"] += 1
-                
-    # 4. Average Severity
-    avg_severity = db.query(func.avg(PatientCase.severity_score)).scalar() or 0.0
-    
-    return {
-        "total_cases": total_cases,
-        "status_breakdown": {s: c for s, c in status_counts},
-        "disease_distribution": disease_counts,
-        "average_severity": round(avg_severity, 2)
-    }
+    stats = read_stats(db)
+    etag = weak_etag(sorted(stats["status_breakdown"].items()), sorted(stats["disease_distribution"].items()),
+                     stats["total_cases"], stats["average_severity"])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return stats
+
+
+@router.get(
+    "/cases", response_model=None, responses={200: {"model": List[CaseOut]}},
+    dependencies=[Depends(require_role("admin"))]
+)
+def filter_cases_by_prediction(
+    label: Optional[str] = None,
+    min_prob: Optional[float] = Query(None, ge=0.0, le=1.0),
+    urgency: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated CaseOut fields to return"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Filter cases on the denormalized AI prediction columns,
+    e.g. ?label=pneumonia&min_prob=0.8&since=2026-10-12T00:00:00
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    Only the requested ?fields= columns are loaded from the database.
+    """
+    selected = parse_fields(fields, CaseOut)
+    query = db.query(*project_columns(PatientCase, selected, extra=("created_at", "id")))
+    if label:
+        query = query.filter(PatientCase.top_label == label.strip().lower())
+    if urgency:
+        query = query.filter(PatientCase.urgency == urgency.strip().lower())
+    if min_prob is not None:
+        query = query.filter(PatientCase.top_prob >= min_prob)
+    if since:
+        query = query.filter(PatientCase.created_at >= since)
+    if until:
+        query = query.filter(PatientCase.created_at < until)
+
+    cases, next_cursor = keyset_paginate(query, PatientCase.created_at, PatientCase.id, limit, cursor)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return list_response(CaseOut, selected, cases, headers=headers)
+
+
+@router.get("/export", dependencies=[Depends(require_role("admin"))])
+def export_cases(
+    format: str = Query("ndjson", pattern="^(" + "|".join(EXPORT_FORMATS) + ")$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[str] = None,
+    include_archived: bool = True,
+):
+    """
+    Stream every matching case (live and archived) as NDJSON, CSV or Parquet,
+    e.g. ?format=csv&since=2026-01-01T00:00:00&status=completed
+    Rows are read with a server-side cursor and sent in chunks as they are encoded.
+    """
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow on the server")
+
+    def body():
+        # The stream outlives the request's dependencies, so it owns its session
+        db = ReplicaSessionLocal()
+        try:
+            yield from stream_export(
+                db, format, since=since, until=until,
+                status=status, include_archived=include_archived
+            )
+        finally:
+            db.close()
+
+    filename = f"cases-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
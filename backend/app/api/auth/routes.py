@@ -2,13 +2,18 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm
 from typing import Dict, Union
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import random
 
 from app.schemas.user_schema import UserCreate, UserOut
 from app.models.user import User as UserModel
-from app.core.database import get_db
-from app.core.security import hash_password, verify_password, create_access_token
+from app.core.database import get_db, get_async_db
+from app.core.security import (
+    hash_password, verify_password_async, hash_password_async,
+    password_needs_rehash, create_access_token
+)
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -161,15 +166,17 @@ def verify_otp(email: str, otp: str, db: Session = Depends(get_db)):
 # Login (OAuth2 form)
 # -----------------------------
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     Login using form data (username + password).
     Returns JWT token and user info. Only verified users can login.
+    Hashes made with an outdated BCRYPT_ROUNDS are upgraded on successful login.
     """
     username = form_data.username
     password = form_data.password
 
-    db_user = get_user_by_username(db, username)
+    result = await db.execute(select(UserModel).where(UserModel.username == username))
+    db_user = result.scalars().first()
     if not db_user:
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
@@ -177,9 +184,13 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     if not db_user.is_verified:
         raise HTTPException(status_code=403, detail="Account not verified. Please verify OTP before login.")
 
-    if not verify_password(password, db_user.password):
+    if not await verify_password_async(password, db_user.password):
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
+    if password_needs_rehash(db_user.password):
+        db_user.password = await hash_password_async(password)
+        await db.commit()
+
     token = create_access_token({"sub": db_user.username, "role": db_user.role})
     return {"message": "Login successful", "access_token": token, "token_type": "bearer", "user": {"id": db_user.id, "username": db_user.username, "full_name": db_user.full_name, "role": db_user.role}}
 
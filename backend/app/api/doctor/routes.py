@@ -1,83 +1,238 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from typing import Dict, Optional
+import time
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, Response
 from pydantic import BaseModel
+from sqlalchemy import select, update, literal, union_all, func
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models.patient_case import PatientCase
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db, get_async_db, get_read_db
+from app.core.cache import (
+    open_pool_cache,
+    doctor_cases_cache,
+    invalidate_open_pool,
+    invalidate_doctor_dashboard,
+)
+from app.models.patient_case import PatientCase, ArchivedPatientCase
 from app.models.user import User
-from app.schemas.case_schema import CaseOut
+from app.schemas.case_schema import CaseOut, DoctorCaseOut
 from app.utils.security import require_role
 from app.core.security import get_current_user
+from app.utils.pagination import keyset_filter, split_page, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.etag import weak_etag, change_validator, is_not_modified, not_modified, set_etag
+from app.services.case_events import (
+    ASSIGNMENT_FIELDS,
+    LAB_FIELDS,
+    REVIEW_FIELDS,
+    emit_case_event,
+    emit_case_event_sync,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Assignments not reviewed within this window go back to the open pool
+ASSIGNMENT_TIMEOUT_MINUTES = 15
+# The reassignment sweep is a write; run it at most this often per worker
+EXPIRY_SWEEP_INTERVAL_SECONDS = 30
+_last_expiry_sweep = 0.0
+
+# Only the columns the dashboard cards and review panel render
+DASHBOARD_COLUMNS = [getattr(PatientCase, name) for name in DoctorCaseOut.model_fields]
+
 class DoctorDashboardData(BaseModel):
-    my_cases: list[CaseOut]
-    open_pool: list[CaseOut]
-    closed_cases: list[CaseOut]
+    my_cases: list[DoctorCaseOut]
+    open_pool: list[DoctorCaseOut]
+    closed_cases: list[DoctorCaseOut]
+    # Cursor for the next page of each list (None when exhausted)
+    next_cursors: Dict[str, Optional[str]] = {}
+
+
+def _release_expired_assignments(db: Session) -> int:
+    """
+    Auto-Reassignment Logic (Lazy Check): move cases assigned to ANY doctor
+    that have expired and are not reviewed back to the pool, in one UPDATE,
+    and push a case_released event for each to the patient and every doctor.
+    Returns the number of cases released. Always runs on the primary.
+    """
+    global _last_expiry_sweep
+    from datetime import datetime, timedelta
+
+    now = time.monotonic()
+    if now - _last_expiry_sweep < EXPIRY_SWEEP_INTERVAL_SECONDS:
+        return 0
+    _last_expiry_sweep = now
+
+    timeout_threshold = datetime.utcnow() - timedelta(minutes=ASSIGNMENT_TIMEOUT_MINUTES)
+    expired = [
+        PatientCase.assigned_doctor_id.isnot(None),
+        PatientCase.reviewed_by_doctor == False,
+        PatientCase.assigned_at < timeout_threshold
+    ]
+    released_ids = db.execute(select(PatientCase.id).where(*expired)).scalars().all()
+    if not released_ids:
+        return 0
+    db.execute(
+        update(PatientCase)
+        .where(PatientCase.id.in_(released_ids), *expired)
+        .values(assigned_doctor_id=None, assigned_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    invalidate_open_pool()
+    invalidate_doctor_dashboard()
+
+    # The whole case: it leaves its doctor's list and may rejoin the open pool
+    for case in db.query(PatientCase).filter(PatientCase.id.in_(released_ids), PatientCase.assigned_doctor_id == None):
+        emit_case_event_sync(db, "case_released", case, to_pool=True)
+    return len(released_ids)
+
+
+def _dashboard_branch(list_name: str, sort_col, criteria, cursor: Optional[str], limit: int):
+    """One page of one dashboard list, tagged with a discriminator column."""
+    seek = keyset_filter(sort_col, PatientCase.id, cursor)
+    if seek is not None:
+        criteria = criteria + [seek]
+    page = (
+        select(
+            literal(list_name).label("list_name"),
+            sort_col.label("sort_at"),
+            *DASHBOARD_COLUMNS
+        )
+        .where(*criteria)
+        .order_by(sort_col.desc(), PatientCase.id.desc())
+        .limit(limit + 1)
+        .subquery()
+    )
+    # Wrap in a subquery so each branch keeps its own ORDER BY / LIMIT inside the UNION
+    return select(page)
+
 
 @router.get("/assigned", response_model=DoctorDashboardData, dependencies=[Depends(require_role("doctor"))])
 def assigned_cases(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    my_cases_cursor: Optional[str] = None,
+    open_pool_cursor: Optional[str] = None,
+    closed_cases_cursor: Optional[str] = None,
     db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get cases assigned to the doctor AND open pool cases.
     Also handles auto-reassignment logic (lazy check).
+
+    Each list is keyset-paginated independently: pass the matching
+    *_cursor from next_cursors to fetch the following page of that list.
+    All lists that are not served from cache come back in a single UNION ALL query.
+    Supports If-None-Match: an unchanged dashboard returns 304 with no list queries.
     """
-    from datetime import datetime, timedelta
-    
-    # 1. Auto-Reassignment Logic (Lazy Check)
-    # Find cases assigned to ANY doctor that have expired (> 15 mins) and not reviewed
-    timeout_threshold = datetime.utcnow() - timedelta(minutes=15)
-    expired_cases = db.query(PatientCase).filter(
-        PatientCase.assigned_doctor_id.isnot(None),
-        PatientCase.reviewed_by_doctor == False,
-        PatientCase.assigned_at < timeout_threshold
-    ).all()
-    
-    for case in expired_cases:
-        case.assigned_doctor_id = None # Move back to pool
-        case.assigned_at = None
-    
-    if expired_cases:
-        db.commit()
-        
-    # 2. Fetch My Assignments
-    my_cases = db.query(PatientCase).filter(
-        PatientCase.assigned_doctor_id == current_user.id,
-        PatientCase.reviewed_by_doctor == False
-    ).order_by(PatientCase.created_at.desc()).all()
-    
-    # 3. Fetch Open Pool (Unassigned AND Submitted)
-    open_pool = db.query(PatientCase).filter(
-        PatientCase.assigned_doctor_id == None,
-        PatientCase.status == "submitted",
-        PatientCase.reviewed_by_doctor == False
-    ).order_by(PatientCase.created_at.desc()).all()
-    
-    # 4. Fetch Closed Cases (Reviewed by me)
-    closed_cases = db.query(PatientCase).filter(
-        PatientCase.assigned_doctor_id == current_user.id,
-        PatientCase.reviewed_by_doctor == True
-    ).order_by(PatientCase.updated_at.desc()).all()
-    
+    # The sweep writes to the primary; if it moved anything, read the lists
+    # from the primary too rather than a replica that may not have it yet.
+    if _release_expired_assignments(db):
+        read_db = db
+
+    # Validators for every row that can appear in the three lists:
+    # my cases + closed cases (ix_patient_cases_doctor_updated) and the pool (ix_patient_cases_pool_updated)
+    doctor_version = change_validator(read_db, PatientCase, PatientCase.assigned_doctor_id == current_user.id)
+    pool_version = change_validator(
+        read_db, PatientCase, PatientCase.status == "submitted", PatientCase.assigned_doctor_id == None
+    )
+    etag = weak_etag(
+        current_user.id, limit, my_cases_cursor, open_pool_cursor, closed_cases_cursor,
+        *doctor_version, *pool_version,
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    pages: Dict[str, dict] = {}
+
+    # First pages are cached: the open pool is shared by all doctors,
+    # my/closed cases are per doctor. Deeper pages always hit the database.
+    # Keyed by the same validators as the ETag, so a body is never sent
+    # under an ETag for newer data (which clients would then keep via 304s)
+    pool_key = (limit, *pool_version)
+    doctor_key = (current_user.id, limit, *doctor_version)
+    if not open_pool_cursor:
+        cached = open_pool_cache.get(pool_key)
+        if cached is not None:
+            pages["open_pool"] = cached
+    if not my_cases_cursor and not closed_cases_cursor:
+        cached = doctor_cases_cache.get(doctor_key)
+        if cached is not None:
+            pages.update(cached)
+
+    cached_lists = set(pages)
+    branches = []
+    if "my_cases" not in pages:
+        branches.append(_dashboard_branch(
+            "my_cases", PatientCase.created_at,
+            [PatientCase.assigned_doctor_id == current_user.id,
+             PatientCase.reviewed_by_doctor == False],
+            my_cases_cursor, limit
+        ))
+    if "open_pool" not in pages:
+        # Unassigned AND Submitted
+        branches.append(_dashboard_branch(
+            "open_pool", PatientCase.created_at,
+            [PatientCase.assigned_doctor_id == None,
+             PatientCase.status == "submitted",
+             PatientCase.reviewed_by_doctor == False],
+            open_pool_cursor, limit
+        ))
+    if "closed_cases" not in pages:
+        # Reviewed by me, most recently updated first
+        branches.append(_dashboard_branch(
+            "closed_cases", PatientCase.updated_at,
+            [PatientCase.assigned_doctor_id == current_user.id,
+             PatientCase.reviewed_by_doctor == True],
+            closed_cases_cursor, limit
+        ))
+
+    if branches:
+        grouped = {"my_cases": [], "open_pool": [], "closed_cases": []}
+        for row in read_db.execute(union_all(*branches)).all():
+            grouped[row.list_name].append(row)
+
+        for list_name, rows in grouped.items():
+            if list_name in cached_lists:
+                continue
+            rows, next_cursor = split_page(rows, limit, "sort_at")
+            pages[list_name] = {
+                "items": [DoctorCaseOut.model_validate(r).model_dump() for r in rows],
+                "next_cursor": next_cursor,
+            }
+
+        # Only cache what this request read from the database: re-setting a
+        # page served from cache would keep refreshing its TTL, and it would
+        # never pick up writes made by other workers or Celery
+        if not open_pool_cursor and "open_pool" not in cached_lists:
+            open_pool_cache.set(pool_key, pages["open_pool"])
+        if not my_cases_cursor and not closed_cases_cursor and "my_cases" not in cached_lists:
+            doctor_cases_cache.set(doctor_key, {
+                "my_cases": pages["my_cases"],
+                "closed_cases": pages["closed_cases"],
+            })
+
     return {
-        "my_cases": my_cases,
-        "open_pool": open_pool,
-        "closed_cases": closed_cases
+        "my_cases": pages["my_cases"]["items"],
+        "open_pool": pages["open_pool"]["items"],
+        "closed_cases": pages["closed_cases"]["items"],
+        "next_cursors": {name: page["next_cursor"] for name, page in pages.items()}
     }
 
 
 @router.post("/cases/{case_id}/accept", response_model=CaseOut, dependencies=[Depends(require_role("doctor"))])
 async def accept_case(
     case_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Accept a case from the open pool."""
-    case = db.query(PatientCase).filter(PatientCase.id == case_id).first()
+    case = await db.get(PatientCase, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
         
@@ -88,56 +243,49 @@ async def accept_case(
     case.assigned_doctor_id = current_user.id
     case.assigned_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(case)
+    await db.commit()
+    await db.refresh(case)
+    invalidate_open_pool()
+    invalidate_doctor_dashboard(current_user.id)
     
-    # Send WebSocket notification to patient
-    from app.core.websocket_manager import manager
-    try:
-        # Find patient user by name
-        logger.info(f"Looking for patient user with username: '{case.patient_name}'")
-        patient_user = db.query(User).filter(User.username == case.patient_name).first()
-        if patient_user:
-            logger.info(f"Found patient user: {patient_user.username} (ID: {patient_user.id})")
-            await manager.send_personal_message({
-                "type": "case_update",
-                "message": f"Your case has been accepted by Dr. {current_user.full_name or current_user.username}"
-            }, patient_user.id)
-            logger.info(f"✅ WebSocket notification sent to patient {patient_user.id}")
-        else:
-            logger.warning(f"❌ Patient user not found for case {case.id}, patient_name='{case.patient_name}'")
-            # Try to find by full_name as fallback
-            patient_user = db.query(User).filter(User.full_name == case.patient_name).first()
-            if patient_user:
-                logger.info(f"Found patient by full_name: {patient_user.username} (ID: {patient_user.id})")
-                await manager.send_personal_message({
-                    "type": "case_update",
-                    "message": f"Your case has been accepted by Dr. {current_user.full_name or current_user.username}"
-                }, patient_user.id)
-                logger.info(f"✅ WebSocket notification sent to patient {patient_user.id}")
-    except Exception as e:
-        logger.error(f"❌ WebSocket notification failed: {e}", exc_info=True)
+    # Patient: accepted; every doctor: drop it from the open pool
+    await emit_case_event(
+        db, "case_accepted", case, ASSIGNMENT_FIELDS,
+        message=f"Your case has been accepted by Dr. {current_user.full_name or current_user.username}",
+        to_pool=True,
+    )
     
     return case
 
 
 @router.get("/stats", dependencies=[Depends(require_role("doctor"))])
 def get_stats(
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get doctor statistics."""
+    """Get doctor statistics. Supports If-None-Match (304 when unchanged)."""
     print(f"\n=== STATS ENDPOINT CALLED ===")
     print(f"Current user: {current_user.username}, Role: {current_user.role}")
     
-    # Total cases reviewed by THIS doctor
-    closed_count = db.query(PatientCase).filter(
-        PatientCase.assigned_doctor_id == current_user.id,
-        PatientCase.reviewed_by_doctor == True
-    ).count()
+    # Total cases reviewed by THIS doctor, including archived ones
+    # (count over the doctor's index range, no table rows read)
+    closed_count = sum(
+        db.query(func.count(model.id)).filter(
+            model.assigned_doctor_id == current_user.id,
+            model.reviewed_by_doctor == True
+        ).scalar()
+        for model in (PatientCase, ArchivedPatientCase)
+    )
     
     print(f"Closed count: {closed_count}")
     print(f"=== STATS ENDPOINT COMPLETE ===\n")
+
+    etag = weak_etag(current_user.id, closed_count)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     
     return {"total_cases_closed": closed_count}
 
@@ -148,10 +296,10 @@ async def review_case(
     notes: str = Body(...), 
     diagnosis: str = Body(None),
     severity_score: float = Body(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    case = db.query(PatientCase).filter(PatientCase.id == case_id).first()
+    case = await db.get(PatientCase, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="case not found")
     
@@ -181,33 +329,19 @@ async def review_case(
         case.status = "completed"
     
     db.add(case)
-    db.commit()
-    db.refresh(case)
+    await db.commit()
+    await db.refresh(case)
+    invalidate_open_pool()
+    invalidate_doctor_dashboard(current_user.id)
     
-    # Send WebSocket notification to patient
-    from app.core.websocket_manager import manager
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    try:
-        # Find patient user by name
-        patient_user = db.query(User).filter(User.username == case.patient_name).first()
-        if patient_user:
-            if case.reviewed_by_doctor:
-                await manager.send_personal_message({
-                    "type": "case_update",
-                    "message": f"Your case has been reviewed. Diagnosis: {case.diagnosis or 'See details'}"
-                }, patient_user.id)
-            else:
-                await manager.send_personal_message({
-                    "type": "case_update",
-                    "message": "Your case review is pending lab results"
-                }, patient_user.id)
-            logger.info(f"WebSocket notification sent to patient {patient_user.id}")
-        else:
-            logger.warning(f"Patient user not found for case {case.id}")
-    except Exception as e:
-        logger.error(f"WebSocket notification failed: {e}")
+    if case.reviewed_by_doctor:
+        message = f"Your case has been reviewed. Diagnosis: {case.diagnosis or 'See details'}"
+    else:
+        message = "Your case review is pending lab results"
+    # The doctor's own stream too, so their other tabs move the case to closed
+    await emit_case_event(
+        db, "case_reviewed", case, REVIEW_FIELDS, message=message, to_doctor=current_user.id
+    )
     
     return case
 
@@ -234,4 +368,6 @@ def order_test(
     
     db.commit()
     db.refresh(case)
+    invalidate_doctor_dashboard(current_user.id)
+    emit_case_event_sync(db, "lab_status_changed", case, LAB_FIELDS)
     return case
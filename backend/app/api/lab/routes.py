@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body, UploadFile, File, Form, Query
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 
-from app.core.database import get_db
-from app.models.patient_case import PatientCase
+from app.core.database import get_db, get_async_db, get_read_db
+from app.models.patient_case import PatientCase, ArchivedPatientCase
 from app.models.user import User
 from app.models.lab_models import LabComment, LabReport
 from app.schemas.case_schema import CaseOut
 from app.core.security import get_current_user
 from app.utils.security import require_role
 from app.utils.security import require_role
-from app.utils.file_handler import save_upload_file
+from starlette.concurrency import run_in_threadpool
+from app.utils.file_handler import StoredUpload, stream_upload_to_disk
+from app.utils.image_pool import prepare_image_async
+from app.utils.dicom import DICOM_CONTENT_TYPE
+from app.services.blob_store import store_upload, release_blob
+from app.services.media_service import generate_derivatives_for_ref
+from app.services.case_events import LAB_FIELDS, emit_case_event, emit_case_event_sync
+from app.core.cache import invalidate_doctor_dashboard
+from app.utils.pagination import keyset_paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.serialization import parse_fields, project_columns, list_response
+from app.services.search_service import search_patients, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
 from app.ai.predictor import analyze_image_bytes
 
 router = APIRouter()
@@ -23,80 +35,79 @@ router = APIRouter()
 @router.get("/patients", response_model=List[CaseOut], dependencies=[Depends(require_role("lab_tech"))])
 def get_all_patients(
     search: Optional[str] = None,
-    db: Session = Depends(get_db),
+    limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get all patients/cases for the lab dashboard.
-    If search is provided, searches Users by username/name and returns their cases.
-    If a user is found but has no cases, returns a placeholder case.
+    If search is provided, runs an indexed prefix search over patient
+    usernames/names (best matches first) and returns each patient as a
+    placeholder case the lab can upload against.
     """
     if search:
-        search_term = f"%{search}%"
-        # Find matching patients (Users)
-        users = db.query(User).filter(
-            User.role == "patient",
-            (User.username.ilike(search_term)) | (User.full_name.ilike(search_term))
-        ).all()
-        
-        # Return user info as virtual cases for display
-        results = []
-        for user in users:
-            virtual_case = PatientCase(
-                id=0,  # Virtual ID (not saved to DB)
-                patient_name=f"{user.full_name or user.username} ({user.username})",  # Include username for frontend
-                patient_contact=user.email,
-                status="search_result",
-                test_status="Ready for Upload",
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow(),
-                test_ordered=False,
-                uploaded_file=None,
-                symptoms=None,
-                xray_result=None,
-                symptom_result=None,
-                severity_score=0.0,
-                doctor_notes=None,
-                diagnosis=None,
-                reviewed_by_doctor=False,
-                assigned_doctor_id=None,
-                assigned_at=None,
-                assigned_lab_tech_id=None,
-                lab_notes=None,
-                report_file=None,
-                ordered_test_type=None,
-                scheduled_date=None
-            )
-            # Store username in a custom attribute for upload
-            virtual_case.username = user.username
-            results.append(virtual_case)
-                
-        return results
+        now = datetime.utcnow()
+        return [
+            {
+                "id": 0,  # Virtual ID (not saved to DB)
+                "patient_name": f"{patient['full_name'] or patient['username']} ({patient['username']})",  # Include username for frontend
+                "patient_contact": patient["email"],
+                "uploaded_file": None,
+                "symptoms": None,
+                "xray_result": None,
+                "symptom_result": None,
+                "status": "search_result",
+                "created_at": now,
+                "severity_score": 0.0,
+                "doctor_notes": None,
+                "diagnosis": None,
+                "reviewed_by_doctor": False,
+                "assigned_doctor_id": None,
+                "assigned_at": None,
+                "test_status": "Ready for Upload",
+                "assigned_lab_tech_id": None,
+            }
+            for patient in search_patients(db, search, limit)
+        ]
         
     else:
         # Default: Show empty state (user must search)
         return []
 
-@router.get("/my-tasks", response_model=List[CaseOut], dependencies=[Depends(require_role("lab_tech"))])
+@router.get(
+    "/my-tasks", response_model=None, responses={200: {"model": List[CaseOut]}},
+    dependencies=[Depends(require_role("lab_tech"))]
+)
 def get_my_tasks(
-    db: Session = Depends(get_db),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated CaseOut fields to return"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Get cases assigned specifically to this lab technician.
+    Get cases assigned specifically to this lab technician, newest first.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    Only the requested ?fields= columns are loaded from the database.
     """
-    cases = db.query(PatientCase).filter(
+    selected = parse_fields(fields, CaseOut)
+    query = db.query(*project_columns(PatientCase, selected, extra=("created_at", "id"))).filter(
         PatientCase.assigned_lab_tech_id == current_user.id
-    ).order_by(PatientCase.created_at.desc()).all()
-    return cases
+    )
+    cases, next_cursor = keyset_paginate(
+        query, PatientCase.created_at, PatientCase.id, limit, cursor
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return list_response(CaseOut, selected, cases, headers=headers)
 
 @router.post("/upload-document")
 async def upload_document(
+    background_tasks: BackgroundTasks,
     username: str = Form(...),
     doc_type: str = Form(...),
     notes: str = Form(None),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Upload a document for a patient (creates a new case if needed)."""
@@ -104,20 +115,46 @@ async def upload_document(
     if current_user.role not in ["lab_tech", "admin", "lab", "labor"]:
          raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Find patient
-    patient = db.query(User).filter(User.username == username, User.role == "patient").first()
+    patient = await find_patient(db, username)
+
+    # Save file
+    stored = await stream_upload_to_disk(file)
+    try:
+        return await create_document_case(db, stored, background_tasks, current_user, patient, doc_type, notes)
+    finally:
+        stored.discard()  # no-op once it is in the blob store
+
+
+async def find_patient(db: AsyncSession, username: str) -> User:
+    patient = (await db.execute(
+        select(User).where(User.username == username, User.role == "patient")
+    )).scalars().first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
+    return patient
 
-    # Save file
-    file_path = save_upload_file(file)
+
+async def create_document_case(
+    db: AsyncSession,
+    stored: StoredUpload,
+    background_tasks: BackgroundTasks,
+    current_user: User,
+    patient: User,
+    doc_type: str,
+    notes: Optional[str] = None,
+) -> dict:
+    """
+    Open a completed lab case for a document already on disk, running the
+    AI on X-rays. Shared by upload-document and the resumable /uploads
+    finalize step; the file ends up in the blob store.
+    """
+    file_path = stored.path
+    content_type = stored.content_type or ""
 
     # Create Case
     new_case = PatientCase(
         patient_name=patient.full_name or patient.username,
         patient_contact=patient.email,
-        uploaded_file=file_path if doc_type == "xray" else None,
-        report_file=file_path if doc_type != "xray" else None,
         status="completed",
         test_status="completed",
         test_ordered=True,
@@ -128,16 +165,16 @@ async def upload_document(
     )
     
     # If X-ray, run AI
-    if doc_type == "xray" or file.content_type.startswith("image/"):
+    if doc_type == "xray" or content_type.startswith("image/") or content_type == DICOM_CONTENT_TYPE:
         try:
-            # Read file from disk
+            # Decode on the process pool, AI call on a worker thread
             import os
             if os.path.exists(file_path):
-                with open(file_path, "rb") as f:
-                    file_bytes = f.read()
-                
-                prediction = analyze_image_bytes(file_bytes)
+                image = await prepare_image_async(file_path)
+                prediction = await run_in_threadpool(analyze_image_bytes, image)
                 new_case.xray_result = prediction
+                for field, value in image.case_fields().items():
+                    setattr(new_case, field, value)
                 
                 # Calculate severity
                 prob = float(prediction.get('top_prob') or prediction.get('prob') or 0)
@@ -155,9 +192,16 @@ async def upload_document(
         except Exception as e:
             print(f"Error running AI on upload: {e}")
 
+    # Move the upload into the blob store; the case keeps its content hash
+    file_ref = await store_upload(db, stored)
+    new_case.uploaded_file = file_ref if doc_type == "xray" else None
+    new_case.report_file = file_ref if doc_type != "xray" else None
+    background_tasks.add_task(generate_derivatives_for_ref, file_ref)  # thumbnail + preview
+
     db.add(new_case)
-    db.commit()
-    db.refresh(new_case)
+    await db.commit()
+    await db.refresh(new_case)
+    await emit_case_event(db, "case_created", new_case)
     
     return {"status": "success", "case_id": new_case.id}
 
@@ -183,10 +227,9 @@ def update_test_status(
     
     case.test_status = status
     
-    # If completed, maybe notify doctor? (Future feature)
-    
     db.commit()
     db.refresh(case)
+    emit_case_event_sync(db, "lab_status_changed", case, LAB_FIELDS, to_doctor=case.assigned_doctor_id)
     return {"status": "success", "case_id": case.id, "new_status": case.test_status}
 
 @router.post("/cases/{case_id}/assign")
@@ -210,6 +253,7 @@ def assign_test(
     
     db.commit()
     db.refresh(case)
+    emit_case_event_sync(db, "lab_status_changed", case, LAB_FIELDS, to_doctor=case.assigned_doctor_id)
     return {"status": "success", "assigned_to": lab_tech_id}
 
 # --------------------------
@@ -250,68 +294,79 @@ def add_lab_notes(
 @router.post("/cases/{case_id}/upload-report")
 async def upload_lab_report(
     case_id: int,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     report_type: str = Form("pdf"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Upload a formal lab report file."""
     if current_user.role not in ["lab_tech", "admin", "lab", "labor"]:
          raise HTTPException(status_code=403, detail="Not authorized")
 
-    case = db.query(PatientCase).filter(PatientCase.id == case_id).first()
+    case = await db.get(PatientCase, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
     
     # Save file
-    file_path = save_upload_file(file)
+    stored = await stream_upload_to_disk(file)
+    try:
+        file_path = stored.path
     
-    # Update case
-    case.report_file = file_path
-    case.test_status = "completed" # Auto-complete
+        # Update case
+        case.test_status = "completed" # Auto-complete
     
-    # TRIGGER AI if it is an image
-    if report_type == "xray" or file.content_type.startswith("image/"):
-        try:
-            # Read file again (save_upload_file might have closed it, or we need to read from path)
-            # Since save_upload_file saves it to disk, let's read from disk or seek 0 if possible.
-            # Ideally we should have read bytes before saving.
-            # Let's read from the saved path.
-            import os
-            if os.path.exists(file_path):
-                with open(file_path, "rb") as f:
-                    file_bytes = f.read()
-                
-                prediction = analyze_image_bytes(file_bytes)
-                case.xray_result = prediction
+        # TRIGGER AI if it is an image
+        if report_type == "xray" or file.content_type.startswith("image/") or file.content_type == DICOM_CONTENT_TYPE:
+            try:
+                # Decode on the process pool, AI call on a worker thread
+                import os
+                if os.path.exists(file_path):
+                    image = await prepare_image_async(file_path)
+                    prediction = await run_in_threadpool(analyze_image_bytes, image)
+                    case.xray_result = prediction
+                    for field, value in image.case_fields().items():
+                        setattr(case, field, value)
                 
-                # Calculate severity (reusing logic from patient routes - ideally refactor to util)
-                prob = float(prediction.get('top_prob') or prediction.get('prob') or 0)
-                label = (prediction.get('top_label') or prediction.get('label') or '').lower()
-                severity = 0.0
-                if 'normal' in label:
-                    severity = prob * 2.0
-                elif any(word in label for word in ['pneumonia', 'covid', 'tuberculosis']):
-                    severity = 5.0 + (prob * 5.0)
-                else:
-                    severity = 3.0 + (prob * 4.0)
+                    # Calculate severity (reusing logic from patient routes - ideally refactor to util)
+                    prob = float(prediction.get('top_prob') or prediction.get('prob') or 0)
+                    label = (prediction.get('top_label') or prediction.get('label') or '').lower()
+                    severity = 0.0
+                    if 'normal' in label:
+                        severity = prob * 2.0
+                    elif any(word in label for word in ['pneumonia', 'covid', 'tuberculosis']):
+                        severity = 5.0 + (prob * 5.0)
+                    else:
+                        severity = 3.0 + (prob * 4.0)
                 
-                case.severity_score = round(severity, 2)
-                case.lab_notes = (case.lab_notes or "") + f"\n[AI Analysis]: {label} ({prob}%)"
-        except Exception as e:
-            print(f"Error running AI on lab upload: {e}")
+                    case.severity_score = round(severity, 2)
+                    case.lab_notes = (case.lab_notes or "") + f"\n[AI Analysis]: {label} ({prob}%)"
+            except Exception as e:
+                print(f"Error running AI on lab upload: {e}")
 
-    # Add to report history
-    new_report = LabReport(
-        case_id=case_id,
-        report_type=report_type,
-        file_path=file_path,
-        uploaded_by=current_user.id
-    )
-    db.add(new_report)
+        # Move the upload into the blob store: one reference from the case, one
+        # from the report history. The case's previous report stays in history.
+        file_ref = await store_upload(db, stored, refs=2)
+        await db.run_sync(release_blob, case.report_file)
+        case.report_file = file_ref
+        background_tasks.add_task(generate_derivatives_for_ref, file_ref)  # thumbnail + preview
+
+        # Add to report history
+        new_report = LabReport(
+            case_id=case_id,
+            report_type=report_type,
+            file_path=file_ref,
+            uploaded_by=current_user.id
+        )
+        db.add(new_report)
     
-    db.commit()
-    return {"status": "success", "file_path": file_path, "ai_triggered": True}
+        await db.commit()
+        if case.assigned_doctor_id:
+            invalidate_doctor_dashboard(case.assigned_doctor_id)
+        await emit_case_event(db, "lab_status_changed", case, LAB_FIELDS, to_doctor=case.assigned_doctor_id)
+        return {"status": "success", "file_path": file_ref, "ai_triggered": True}
+    finally:
+        stored.discard()  # no-op once it is in the blob store
 
 @router.post("/reports/manual")
 def submit_manual_report(
@@ -342,22 +397,31 @@ def submit_manual_report(
     case.lab_notes = f"Manual Result: {data[:50]}..." # Preview in notes
     
     db.commit()
+    emit_case_event_sync(db, "lab_status_changed", case, LAB_FIELDS, to_doctor=case.assigned_doctor_id)
     return {"status": "success", "report_id": new_report.id}
 
 @router.get("/patients/{patient_id}/history")
 def get_patient_history(
     patient_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get detailed history for a patient."""
     if current_user.role not in ["lab_tech", "admin", "lab", "labor"]:
          raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Assuming patient_id refers to the User ID of the patient? 
-    # Or do we filter by patient_name? 
-    # In this simple app, we don't have a separate Patient table, just Users with role='patient'.
-    # But PatientCase has 'patient_id' which is the User ID.
-    
-    cases = db.query(PatientCase).filter(PatientCase.patient_id == patient_id).order_by(PatientCase.created_at.desc()).all()
+    # There is no separate Patient table: patient_id is the patient's User ID,
+    # and cases are linked by name (as in /patient/my-cases).
+    patient = db.get(User, patient_id)
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    names = [patient.username, patient.full_name]
+
+    # Live and archived cases, newest first
+    cases = [
+        case
+        for model in (PatientCase, ArchivedPatientCase)
+        for case in db.query(model).filter(model.patient_name.in_(names))
+    ]
+    cases.sort(key=lambda case: (case.created_at, case.id), reverse=True)
     return cases
@@ -0,0 +1,121 @@
+import mimetypes
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response
+from fastapi.responses import RedirectResponse
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.database import get_read_db
+from app.core.security import get_current_user
+from app.models.blob import StoredBlob
+from app.models.patient_case import ArchivedPatientCase, PatientCase
+from app.models.user import User
+from app.services.blob_store import BLOB_REF_PREFIX, LocalStorage, blob_key, blob_ref, get_storage, is_blob_ref
+from app.services.media_service import ensure_derivative
+from app.utils.etag import is_not_modified
+from app.utils.file_response import file_response
+
+router = APIRouter()
+
+# Blob URLs name immutable content, so the browser may reuse them for a year
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+PRESIGNED_URL_SECONDS = 300
+STAFF_ROLES = {"doctor", "admin", "lab_tech", "lab", "labor"}
+CASE_FILE_COLUMNS = {"xray": "uploaded_file", "report": "report_file"}
+
+Variant = Literal["original", "preview", "thumb"]
+
+
+def _safe_media_type(content_type: Optional[str]) -> str:
+    """Uploads are user-supplied: only images and PDFs are served as themselves."""
+    if content_type and (content_type.startswith("image/") or content_type == "application/pdf"):
+        return content_type
+    return "application/octet-stream"
+
+
+def _can_view(db: Session, user: User, ref: str) -> bool:
+    """Staff see every case's files; patients only files attached to their own cases."""
+    if user.role in STAFF_ROLES:
+        return True
+    names = [user.username, user.full_name]
+    return any(
+        db.query(model.id)
+        .filter(model.patient_name.in_(names), or_(model.uploaded_file == ref, model.report_file == ref))
+        .first()
+        for model in (PatientCase, ArchivedPatientCase)
+    )
+
+
+@router.api_route("/blobs/{sha256}", methods=["GET", "HEAD"])
+def get_blob(
+    request: Request,
+    sha256: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    variant: Variant = "original",
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Serve a stored upload by content hash, or its preview / thumb JPEG.
+
+    Supports Range and If-None-Match; responses are cacheable for a year
+    since the URL names the content. With the S3 backend originals are a
+    redirect to a short-lived presigned URL.
+    """
+    blob = db.get(StoredBlob, sha256)
+    # 404 rather than 403, so hashes of other patients' files can't be probed
+    if not blob or not _can_view(db, current_user, blob_ref(sha256)):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = f'"{sha256}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    if variant != "original":
+        path = ensure_derivative(sha256, variant)
+        if not path:
+            raise HTTPException(status_code=404, detail="No preview available for this file")
+        return file_response(request, path, media_type="image/jpeg", headers=headers)
+
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        url = storage.presigned_url(blob_key(sha256), PRESIGNED_URL_SECONDS)
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "private, no-store"})
+    return file_response(
+        request, storage.path(blob_key(sha256)), media_type=_safe_media_type(blob.content_type), headers=headers
+    )
+
+
+@router.get("/cases/{case_id}/{kind}")
+def get_case_file(
+    request: Request,
+    case_id: int,
+    kind: Literal["xray", "report"],
+    variant: Variant = "original",
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    A case's X-ray or report. Redirects to the cacheable /media/blobs URL;
+    files uploaded before the blob store are served from their path.
+    """
+    case = db.get(PatientCase, case_id) or db.get(ArchivedPatientCase, case_id)
+    ref = getattr(case, CASE_FILE_COLUMNS[kind]) if case else None
+    if not ref or not _can_view(db, current_user, ref):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if is_blob_ref(ref):
+        url = request.url_for("get_blob", sha256=ref[len(BLOB_REF_PREFIX):]).include_query_params(variant=variant)
+        return RedirectResponse(str(url), status_code=307, headers={"Cache-Control": "private, no-cache"})
+
+    if variant != "original":
+        raise HTTPException(status_code=404, detail="No preview available for this file")
+    try:
+        return file_response(
+            request, ref,
+            media_type=_safe_media_type(mimetypes.guess_type(ref)[0]),
+            headers={"Cache-Control": "private, no-cache", "X-Content-Type-Options": "nosniff"},
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
@@ -1,14 +1,25 @@
 # app/api/patient/routes.py
 
-from fastapi import APIRouter, UploadFile, File, Depends, Form, HTTPException, Body
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Depends, Form, HTTPException, Body, Query, Request
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models.patient_case import PatientCase
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db, get_async_db, get_read_db
+from app.models.patient_case import PatientCase, ArchivedPatientCase
 from app.models.user import User
 from app.schemas.case_schema import CaseCreate, CaseOut
-from app.utils.file_handler import save_upload_file
+from starlette.concurrency import run_in_threadpool
+from app.utils.file_handler import StoredUpload, stream_upload_to_disk
+from app.utils.image_pool import InvalidImageError, prepare_image_async
+from app.services.blob_store import store_upload, release_blob
+from app.services.media_service import generate_derivatives_for_ref
+from app.services.case_events import LAB_FIELDS, emit_case_event, emit_case_event_sync
 from app.workers.tasks import process_case_task
 from app.core.security import get_current_user
+from app.core.cache import invalidate_open_pool, invalidate_doctor_dashboard
+from app.utils.pagination import keyset_paginate_union, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.serialization import parse_fields, project_columns, list_response
+from app.utils.etag import weak_etag, change_validator, is_not_modified, not_modified, set_etag
 
 # Import Real AI functions
 from app.ai.predictor import (
@@ -22,22 +33,48 @@ router = APIRouter()
 
 @router.post("/upload-image", response_model=CaseOut)
 async def upload_image(
+    background_tasks: BackgroundTasks,
     patient_name: str = Form(None),
     patient_contact: str = Form(None),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
+    # 1. Stream file to disk (chunked, hashed, size-limited)
+    stored = await stream_upload_to_disk(file)
     try:
-        # 1. Read file bytes for AI
-        file_bytes = await file.read()
-        
-        # 2. Save file to disk
-        await file.seek(0)
-        saved_path = save_upload_file(file)
+        return await create_xray_case(db, stored, background_tasks, current_user, patient_name, patient_contact)
+    finally:
+        stored.discard()  # no-op once it is in the blob store
+
+
+async def create_xray_case(
+    db: AsyncSession,
+    stored: StoredUpload,
+    background_tasks: BackgroundTasks,
+    current_user: User,
+    patient_name: Optional[str] = None,
+    patient_contact: Optional[str] = None,
+) -> PatientCase:
+    """
+    Analyze an X-ray already on disk and open a case for it. Shared by
+    upload-image and the resumable /uploads finalize step. The file is
+    moved into the blob store, or removed if it is not an image; on other
+    failures (e.g. 503 from a busy image pool) it is left for the caller.
+    """
+    try:
+        # 2. Validate, decode and downscale on the process pool, then run
+        #    the AI call on a worker thread; the event loop only awaits
+        try:
+            image = await prepare_image_async(stored.path)
+        except InvalidImageError as e:
+            stored.discard()
+            raise HTTPException(status_code=422, detail=str(e))
+        prediction = await run_in_threadpool(analyze_image_bytes, image)
 
-        # 3. Run AI prediction
-        prediction = analyze_image_bytes(file_bytes)
+        # 3. Move it into the content-addressed store (deduplicated by hash)
+        saved_path = await store_upload(db, stored)
+        background_tasks.add_task(generate_derivatives_for_ref, saved_path)  # thumbnail + preview
         
         # 4. Calculate severity score from AI prediction (0-10 scale)
         severity = 0.0
@@ -61,11 +98,13 @@ async def upload_image(
             uploaded_file=saved_path,
             status="new",
             xray_result=prediction,
-            severity_score=round(severity, 2)
+            severity_score=round(severity, 2),
+            **image.case_fields(),  # modality, body part, study date for DICOM
         )
         db.add(new_case)
-        db.commit()
-        db.refresh(new_case)
+        await db.commit()
+        await db.refresh(new_case)
+        await emit_case_event(db, "case_created", new_case)
         
         # 5. Dispatch background worker (optional)
         try:
@@ -75,6 +114,8 @@ async def upload_image(
             pass
         
         return new_case
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -129,6 +170,7 @@ def submit_symptoms(
         db.add(new_case)
         db.commit()
         db.refresh(new_case)
+        emit_case_event_sync(db, "case_created", new_case)
 
         # Dispatch background worker
         try:
@@ -146,19 +188,51 @@ def submit_symptoms(
         raise HTTPException(status_code=500, detail=f"Error processing symptoms: {str(e)}")
 
 
-@router.get("/my-cases", response_model=list[CaseOut])
+@router.get("/my-cases", response_model=None, responses={200: {"model": list[CaseOut]}})
 def my_cases(
-    db: Session = Depends(get_db),
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated CaseOut fields to return, e.g. id,status,created_at"),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    Get the logged-in patient's cases, newest first, one page at a time.
+    Archived (long-closed) cases are merged in, so the history is complete.
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    Only the requested ?fields= columns are loaded from the database.
+    Supports If-None-Match: unchanged pages return 304 before any case is loaded.
+    """
     try:
+        selected = parse_fields(fields, CaseOut)
+
         # Fetch cases matching the logged-in user's name
-        cases = db.query(PatientCase).filter(
-            (PatientCase.patient_name == current_user.username) | 
-            (PatientCase.patient_name == current_user.full_name)
-        ).order_by(PatientCase.created_at.desc()).all()
+        names = [current_user.username, current_user.full_name]
+
+        etag = weak_etag(
+            current_user.id, limit, cursor, ",".join(selected),
+            *change_validator(db, PatientCase, PatientCase.patient_name.in_(names)),
+            *change_validator(db, ArchivedPatientCase, ArchivedPatientCase.patient_name.in_(names)),
+        )
+        if is_not_modified(request, etag):
+            return not_modified(etag)
+        cases, next_cursor = keyset_paginate_union(
+            [
+                (
+                    db.query(*project_columns(model, selected, extra=("created_at", "id")))
+                    .filter(model.patient_name.in_(names)),
+                    model.created_at, model.id
+                )
+                for model in (PatientCase, ArchivedPatientCase)
+            ],
+            limit, cursor
+        )
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
         
-        return cases
+        return set_etag(list_response(CaseOut, selected, cases, headers=headers), etag)
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -167,7 +241,7 @@ def my_cases(
 
 @router.get("/doctors", response_model=list[dict])
 def get_doctors(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get list of all doctors for assignment."""
@@ -182,7 +256,7 @@ def get_doctors(
 async def assign_case(
     case_id: int,
     doctor_id: int = Body(None, embed=True), # Optional, if None -> Open Pool
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Assign a case to a specific doctor or the open pool."""
@@ -191,7 +265,7 @@ async def assign_case(
     print(f"Doctor ID: {doctor_id}")
     print(f"Current User: {current_user.username}")
     
-    case = db.query(PatientCase).filter(PatientCase.id == case_id).first()
+    case = await db.get(PatientCase, case_id)
     if not case:
         print(f"ERROR: Case {case_id} not found")
         raise HTTPException(status_code=404, detail="Case not found")
@@ -220,13 +294,18 @@ async def assign_case(
         case.status = "submitted"
     
     print(f"Before commit - Status: {case.status}, Assigned to: {case.assigned_doctor_id}")
-    db.commit()
-    db.refresh(case)
+    await db.commit()
+    await db.refresh(case)
+    invalidate_open_pool()
+    if case.assigned_doctor_id:
+        invalidate_doctor_dashboard(case.assigned_doctor_id)
     print(f"After commit - Status: {case.status}, Assigned to: {case.assigned_doctor_id}")
     print(f"=== ASSIGN CASE COMPLETE ===\n")
     
-    # WebSocket notifications disabled for now due to routing issues
-    # TODO: Fix WebSocket endpoint and re-enable notifications
+    # The whole case: it is new to the chosen doctor's list or the open pool
+    await emit_case_event(
+        db, "case_submitted", case, to_doctor=case.assigned_doctor_id, to_pool=not case.assigned_doctor_id
+    )
     
     return case
 
@@ -285,8 +364,14 @@ def delete_case(
     if current_user.role != "patient":
         raise HTTPException(status_code=403, detail="Only patients can delete their own cases")
     
+    assigned_doctor_id = case.assigned_doctor_id
+    release_blob(db, case.uploaded_file)
+    release_blob(db, case.report_file)
     db.delete(case)
     db.commit()
+    invalidate_open_pool()
+    if assigned_doctor_id:
+        invalidate_doctor_dashboard(assigned_doctor_id)
     
     return {"message": "Case deleted successfully", "case_id": case_id}
 
@@ -321,6 +406,7 @@ def schedule_test(
         
         db.commit()
         db.refresh(case)
+        emit_case_event_sync(db, "lab_status_changed", case, LAB_FIELDS, to_doctor=case.assigned_doctor_id)
         return {"message": "Test scheduled successfully", "scheduled_date": case.scheduled_date}
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use ISO 8601")
@@ -352,4 +438,5 @@ def book_test(
     
     db.commit()
     db.refresh(case)
+    emit_case_event_sync(db, "lab_status_changed", case, LAB_FIELDS, to_doctor=case.assigned_doctor_id)
     return {"message": "Test booked successfully", "test_status": case.test_status}
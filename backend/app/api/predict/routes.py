@@ -2,11 +2,16 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db, get_async_db
+from app.core.security import get_current_user
 from app.models.patient_case import PatientCase
-from app.ai.predictor import deterministic_image_predict, symptoms_to_prediction
-from app.api.auth.routes import get_current_user
+from app.ai.predictor import analyze_image_bytes, analyze_symptoms
+from starlette.concurrency import run_in_threadpool
+from app.utils.file_handler import spool_upload
+from app.utils.image_pool import InvalidImageError, prepare_image_async
 from app.models.user import User
+from app.services.case_events import emit_case_event, emit_case_event_sync
 
 router = APIRouter(prefix="/predict", tags=["Predict"])
 
@@ -24,7 +29,7 @@ def predict_from_symptoms(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    prediction = symptoms_to_prediction(data.symptoms)
+    prediction = analyze_symptoms(data.symptoms)
     
     # Save to DB
     case = PatientCase(
@@ -36,43 +41,48 @@ def predict_from_symptoms(
     db.add(case)
     db.commit()
     db.refresh(case)
+    emit_case_event_sync(db, "case_created", case)
     
     return {"input": data.symptoms, "prediction": prediction, "case_id": case.id}
 
 # ---------------------------
 # Predict from image
 # ---------------------------
-import tempfile
-
 @router.post("/image")
 async def predict_from_image(
     file: UploadFile = File(..., description="Upload a chest X-ray image"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    One-off X-ray analysis. The image is analyzed from a spooled buffer
+    (in memory, spilling to an unlinked temp file for large uploads) and
+    is not stored; use /patient/upload-image to keep it with the case.
+    """
     try:
-        # Save to temp file
-        temp = tempfile.NamedTemporaryFile(delete=False, suffix=file.filename)
-        content = await file.read()
-        temp.write(content)
-        temp.close()
-
-        # Pass file path to predictor
-        prediction = deterministic_image_predict(temp.name)
+        async with spool_upload(file) as spool:
+            # Process pool workers can't share the spool, so they get its bytes
+            image = await prepare_image_async(spool.read())
+        prediction = await run_in_threadpool(analyze_image_bytes, image)
 
         # Save to DB
         case = PatientCase(
             patient_name=current_user.username,
-            uploaded_file=file.filename,
             xray_result=prediction,
-            status="predicted"
+            status="predicted",
+            **image.case_fields(),
         )
         db.add(case)
-        db.commit()
-        db.refresh(case)
+        await db.commit()
+        await db.refresh(case)
+        await emit_case_event(db, "case_created", case)
 
         return {"filename": file.filename, "prediction": prediction, "case_id": case.id}
 
+    except HTTPException:
+        raise
+    except InvalidImageError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
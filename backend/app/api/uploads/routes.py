@@ -0,0 +1,164 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.lab.routes import create_document_case, find_patient
+from app.api.patient.routes import create_xray_case
+from app.core.database import get_async_db
+from app.core.security import get_current_user
+from app.models.upload_session import UploadSession
+from app.models.user import User
+from app.schemas.case_schema import CaseOut
+from app.services import upload_sessions
+from app.services.upload_sessions import UPLOAD_MAX_CHUNK_BYTES, UPLOAD_SESSION_CHUNK_BYTES
+
+router = APIRouter()
+
+LAB_ROLES = {"lab_tech", "admin", "lab", "labor"}
+# Who may start a session for each purpose, i.e. which upload route it finalizes into
+PURPOSE_ROLES = {"xray": None, "lab_document": LAB_ROLES}
+
+
+class UploadCreate(BaseModel):
+    purpose: Literal["xray", "lab_document"]
+    size: int = Field(..., ge=1)
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+
+
+class UploadFinalize(BaseModel):
+    # xray (as /patient/upload-image)
+    patient_name: Optional[str] = None
+    patient_contact: Optional[str] = None
+    # lab_document (as /lab/upload-document)
+    username: Optional[str] = None
+    doc_type: Optional[str] = None
+    notes: Optional[str] = None
+
+
+def _progress(session: UploadSession) -> dict:
+    return {
+        "upload_id": session.id,
+        "offset": session.offset,
+        "size": session.size,
+        "chain_hash": session.chain_hash,
+        "status": session.status,
+        "case_id": session.case_id,
+        "chunk_size": UPLOAD_SESSION_CHUNK_BYTES,
+        "max_chunk_size": UPLOAD_MAX_CHUNK_BYTES,
+        "expires_at": session.expires_at,
+    }
+
+
+def _progress_headers(session: UploadSession) -> dict:
+    return {"Upload-Offset": str(session.offset), "Upload-Length": str(session.size), "Cache-Control": "no-store"}
+
+
+@router.post("", status_code=201)
+async def create_upload(
+    data: UploadCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Start a resumable upload; send chunks with PUT /uploads/{upload_id}."""
+    roles = PURPOSE_ROLES[data.purpose]
+    if roles is not None and current_user.role not in roles:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    session = await upload_sessions.create_session(
+        db, current_user.id, data.purpose, data.size, data.filename, data.content_type, data.sha256
+    )
+    response.headers["Location"] = f"/uploads/{session.id}"
+    response.headers.update(_progress_headers(session))
+    return _progress(session)
+
+
+@router.api_route("/{upload_id}", methods=["GET", "HEAD"])
+async def get_upload(
+    upload_id: str,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """How many bytes the server holds; resume the upload from offset."""
+    session = await upload_sessions.get_session(db, upload_id, current_user.id)
+    response.headers.update(_progress_headers(session))
+    return _progress(session)
+
+
+@router.put("/{upload_id}")
+async def put_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    upload_checksum: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Write one chunk (the raw request body) at Upload-Offset. A 409 carries
+    the server's Upload-Offset to resume from; a 422 means the chunk did not
+    match its Upload-Checksum and should be resent.
+    """
+    session = await upload_sessions.write_chunk(
+        db, upload_id, current_user.id, upload_offset, request.stream(), upload_checksum
+    )
+    response.headers.update(_progress_headers(session))
+    return _progress(session)
+
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    data: UploadFinalize = UploadFinalize(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create the case from the assembled file, exactly as the one-shot upload
+    route would. Safe to repeat: a completed upload returns its case_id.
+    """
+    session = await upload_sessions.get_session(db, upload_id, current_user.id)
+    if session.status == "completed":
+        return {"status": "success", "upload_id": session.id, "case_id": session.case_id}
+
+    patient = None
+    if session.purpose == "lab_document":
+        if not data.username or not data.doc_type:
+            raise HTTPException(status_code=422, detail="username and doc_type are required")
+        patient = await find_patient(db, data.username)
+
+    stored, token = await upload_sessions.begin_finalize(db, upload_id, current_user.id)
+    try:
+        if session.purpose == "xray":
+            created = await create_xray_case(
+                db, stored, background_tasks, current_user, data.patient_name, data.patient_contact
+            )
+            case_id, case = created.id, CaseOut.model_validate(created, from_attributes=True)
+        else:
+            result = await create_document_case(
+                db, stored, background_tasks, current_user, patient, data.doc_type, data.notes
+            )
+            case_id, case = result["case_id"], None
+    except BaseException:
+        await upload_sessions.reopen_after_failure(db, upload_id, token)
+        raise
+
+    await upload_sessions.complete_finalize(db, upload_id, case_id)
+    return {"status": "success", "upload_id": upload_id, "case_id": case_id, "case": case}
+
+
+@router.delete("/{upload_id}", status_code=204)
+async def abort_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    await upload_sessions.get_session(db, upload_id, current_user.id)
+    await upload_sessions.cancel_session(db, upload_id, current_user.id)
+    return Response(status_code=204)
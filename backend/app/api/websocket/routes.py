@@ -1,11 +1,39 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from sqlalchemy import select
+from app.core.database import AsyncSessionLocal
 from app.core.websocket_manager import manager
+from app.core.ws_backplane import group_topic, user_topic
 from app.core.security import decode_access_token
+from app.models.user import User
+from app.services.case_events import DOCTORS_GROUP
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+
+async def _token_user(token: str):
+    """(id, role) of the user a valid access token belongs to, else (None, None)."""
+    payload = decode_access_token(token)
+    username = payload.get("sub") if payload else None
+    if not username:
+        return None, None
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(select(User.id, User.role).where(User.username == username))).first()
+    return tuple(row) if row else (None, None)
+
+
+def _is_ping(data: str) -> bool:
+    if data == "ping":
+        return True
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return False
+    return isinstance(message, dict) and message.get("type") == "ping"
+
+
 @router.websocket("/ws/{user_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -14,55 +42,60 @@ async def websocket_endpoint(
 ):
     """
     WebSocket endpoint for real-time notifications.
-    
+
     Connect via: ws://localhost:8000/ws/{user_id}?token={jwt_token}
+
+    The server sends {"type": "ping"} periodically; answer {"type": "pong"}
+    (any message counts) or the connection is closed as idle. Sending
+    {"type": "ping"} gets a {"type": "pong"} back on this connection.
+
+    Case changes arrive as {"type": "case_event", ...} deltas on the user's
+    stream and, for doctors, the shared doctors stream (see
+    app.services.case_events). The welcome message carries the current
+    sequence number of each stream: a client whose last seen numbers differ
+    missed events while disconnected and should refetch its lists.
     """
-    # MUST accept connection first before any other operations
-    await websocket.accept()
-    
-    # Authenticate user
+    # Authenticate user: the token must belong to the user in the URL
     try:
-        payload = decode_access_token(token)
-        token_username = payload.get("sub")
-        
-        if not token_username:
-            await websocket.close(code=1008, reason="Invalid token")
-            return
-            
-        # Note: We accept the connection if token is valid
-        # The user_id in URL is just for routing, token validates identity
-        
+        token_user_id, role = await _token_user(token)
     except Exception as e:
         logger.error(f"WebSocket auth failed: {e}")
+        token_user_id, role = None, None
+
+    if token_user_id != user_id:
+        # Accept first so the client sees the close code instead of a failed handshake
+        await websocket.accept()
         await websocket.close(code=1008, reason="Invalid token")
         return
-    
-    # Register connection with manager
-    manager.active_connections[user_id] = manager.active_connections.get(user_id, [])
-    manager.active_connections[user_id].append(websocket)
-    logger.info(f"WebSocket connected for user {user_id}")
-    
+
+    groups = (DOCTORS_GROUP,) if role == "doctor" else ()
+    # Read before subscribing: anything published later is delivered with a
+    # higher number, so the client never skips an event it has not seen
+    topics = [user_topic(user_id)] + [group_topic(name) for name in groups]
+    seq = await manager.backplane.current_sequences(topics)
+
+    # Register connection with manager (limits, send queue, heartbeat)
+    connection = await manager.connect(websocket, user_id, groups=groups)
+    if connection is None:
+        return
+
     try:
-        # Send welcome message
-        await manager.send_personal_message({
+        # Send welcome message, with where each stream is up to
+        manager.send_to(connection, {
             "type": "connection",
-            "message": "Connected to MediFusion real-time notifications"
-        }, user_id)
-        
-        # Keep connection alive and handle incoming messages
+            "message": "Connected to MediFusion real-time notifications",
+            "seq": seq
+        })
+
         while True:
             data = await websocket.receive_text()
-            logger.info(f"Received from user {user_id}: {data}")
-            
-            # Echo back for now (can add message handling logic here)
-            await manager.send_personal_message({
-                "type": "echo",
-                "message": f"Received: {data}"
-            }, user_id)
-            
+            manager.touch(connection)
+            if _is_ping(data):
+                manager.send_to(connection, {"type": "pong"})
+
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
         logger.info(f"User {user_id} disconnected")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
+    finally:
         manager.disconnect(websocket, user_id)
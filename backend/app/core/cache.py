@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache with per-entry expiry and LRU eviction.
+
+    Values are shared across requests in the same worker, so store plain
+    serialized data (dicts/lists), never ORM instances bound to a session.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate) -> None:
+        """Drop every entry whose key matches predicate(key)."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# ---------------------------------------------------
+# Doctor dashboard caches
+# ---------------------------------------------------
+# The open pool is identical for every doctor, so one entry serves all polls.
+# Keyed by (limit, *validator): the pool's change validator, as in the ETag.
+open_pool_cache = TTLCache(float(os.getenv("OPEN_POOL_CACHE_TTL", "10")), maxsize=16)
+# my_cases / closed_cases first pages, keyed by (doctor_id, limit, *validator).
+doctor_cases_cache = TTLCache(float(os.getenv("DOCTOR_CASES_CACHE_TTL", "5")), maxsize=4096)
+
+
+def invalidate_open_pool() -> None:
+    """Call after a case enters or leaves the open pool (submit, accept, review)."""
+    open_pool_cache.clear()
+
+
+def invalidate_doctor_dashboard(doctor_id: Optional[int] = None) -> None:
+    """Call after a doctor's assigned or closed cases change; None clears all doctors."""
+    if doctor_id is None:
+        doctor_cases_cache.clear()
+    else:
+        doctor_cases_cache.delete_where(lambda key: key[0] == doctor_id)
+
+
+# ---------------------------------------------------
+# Current-user resolution cache
+# ---------------------------------------------------
+# Column snapshots of authenticated users, keyed by (username, token iat).
+current_user_cache = TTLCache(float(os.getenv("CURRENT_USER_CACHE_TTL", "30")), maxsize=10000)
+
+
+def invalidate_user(username: str) -> None:
+    """Call after a user's profile, role or verification state changes."""
+    current_user_cache.delete_where(lambda key: key[0] == username)
+
+
+# ---------------------------------------------------
+# Read-your-writes window for replica routing
+# ---------------------------------------------------
+# Token subjects that made a successful write recently; their reads go to the
+# primary until the replica has had time to catch up. Per process, like the
+# caches above: with several workers behind a load balancer, raise the window
+# or use sticky sessions.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+recent_writers = TTLCache(READ_YOUR_WRITES_SECONDS, maxsize=50000)
+
+
+def mark_recent_write(subject: str) -> None:
+    """Record that subject just wrote, opening its read-your-writes window."""
+    recent_writers.set(subject, True)
+
+
+def wrote_recently(subject: Optional[str]) -> bool:
+    return subject is not None and recent_writers.get(subject) is not None
@@ -1,6 +1,8 @@
 # app/core/database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from fastapi import Request
 import os
 
 # Read DATABASE_URL from env; fallback to SQLite for local development
@@ -9,14 +11,123 @@ DATABASE_URL = os.getenv(
     "sqlite:///./medifusion.db"
 )
 
+# Optional read replica for read-only endpoints; unset means all reads use the primary.
+# Locally, point it at a second SQLite file or PostgreSQL instance to exercise the routing.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Connection pool (PostgreSQL and other server databases)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))        # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))      # drop connections older than this (s)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"     # test connections on checkout
+
+# SQLite pragmas, applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")     # WAL: readers don't block on writers
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")    # safe with WAL, far fewer fsyncs than FULL
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+def to_async_url(url: str) -> str:
+    """Map a sync DATABASE_URL to its async driver: aiosqlite for SQLite, asyncpg for PostgreSQL."""
+    scheme, sep, rest = url.partition("://")
+    driver = scheme.split("+")[0]
+    if driver == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if driver in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and (":memory:" in url or url.split("://", 1)[1] in ("", "/"))
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """create_engine keyword arguments for the given database URL."""
+    if is_sqlite(url):
+        # SQLite has no server-side pool to tune; just give writers a busy timeout
+        connect_args = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if not is_async:
+            connect_args["check_same_thread"] = False
+        return {"connect_args": connect_args}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def apply_sqlite_pragmas(
+    dbapi_connection,
+    journal_mode: str = SQLITE_JOURNAL_MODE,
+    synchronous: str = SQLITE_SYNCHRONOUS,
+    busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+    mmap_size: int = SQLITE_MMAP_SIZE,
+):
+    cursor = dbapi_connection.cursor()
+    try:
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if synchronous:
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    finally:
+        cursor.close()
+
+
+def register_sqlite_pragmas(sync_engine, url: str):
+    """Apply the SQLite pragmas on connect (no-op for other databases)."""
+    if not is_sqlite(url):
+        return
+
+    # WAL needs a file on disk; in-memory databases keep their default journal
+    journal_mode = None if is_sqlite_memory(url) else SQLITE_JOURNAL_MODE
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, journal_mode=journal_mode)
+
+
 # echo=True while developing is useful (SQL printed). Turn off in prod.
-# For SQLite, add connect_args to handle threading
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+engine = create_engine(DATABASE_URL, echo=False, future=True, **engine_options(DATABASE_URL))
+register_sqlite_pragmas(engine, DATABASE_URL)
 
 # SessionLocal class
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, class_=Session)
 
+# Read replica engine/sessions (falls back to the primary engine)
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        DATABASE_REPLICA_URL, echo=False, future=True, **engine_options(DATABASE_REPLICA_URL)
+    )
+    register_sqlite_pragmas(replica_engine, DATABASE_REPLICA_URL)
+else:
+    replica_engine = engine
+ReplicaSessionLocal = sessionmaker(bind=replica_engine, autoflush=False, autocommit=False, class_=Session)
+
+# Async engine/sessions for `async def` routes, so DB round trips don't block the event loop.
+# expire_on_commit=False: attributes must stay loaded after commit, since lazy
+# refreshes can't run implicitly under asyncio.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, echo=False, **engine_options(ASYNC_DATABASE_URL, is_async=True)
+)
+register_sqlite_pragmas(async_engine.sync_engine, ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
+)
+
 # Base for models
 Base = declarative_base()
 
@@ -27,3 +138,19 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Async dependency for FastAPI (use from `async def` routes only)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependency for read-only endpoints: the replica, except while the caller is
+# inside its read-your-writes window (request.state.read_from_primary, set by
+# the middleware in main.py). Never write through this session.
+def get_read_db(request: Request):
+    use_primary = getattr(request.state, "read_from_primary", False)
+    db = SessionLocal() if use_primary else ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,10 +1,18 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import asyncio
 import bcrypt
+import os
+import threading
+import time
 
+from app.core.cache import current_user_cache, invalidate_user
 from app.core.database import get_db
 from app.models.user import User
 
@@ -14,42 +22,93 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours (was 60 minutes)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt directly."""
+# ---------------------------------------------------
+# Password hashing pool
+# ---------------------------------------------------
+# bcrypt runs on its own small thread pool (bcrypt releases the GIL), so a
+# login burst queues here instead of starving the AnyIO pool every sync
+# endpoint shares. Requests beyond workers + queue get a 503.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds", "Time spent in bcrypt per operation", ["operation"]
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth", "Password hash operations waiting for a worker"
+)
+
+
+def _password_bytes(password) -> bytes:
     # Ensure password is a string
     if not isinstance(password, str):
         password = str(password)
-    
-    print(f"DEBUG: Hashing password of length {len(password)}")
-    
     # Bcrypt has a 72 byte limit
-    password_bytes = password.encode('utf-8')
-    if len(password_bytes) > 72:
-        print("DEBUG: Truncating password")
-        password_bytes = password_bytes[:72]
-    
-    # Hash using bcrypt directly
-    hashed = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+    return password.encode('utf-8')[:72]
+
+
+def _bcrypt_hash(password) -> str:
+    hashed = bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
     return hashed.decode('utf-8')
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password using bcrypt directly."""
-    # Ensure password is a string
-    if not isinstance(plain_password, str):
-        plain_password = str(plain_password)
-        
-    password_bytes = plain_password.encode('utf-8')
-    if len(password_bytes) > 72:
-        password_bytes = password_bytes[:72]
-        
-    # Verify using bcrypt directly
+
+def _bcrypt_verify(plain_password, hashed_password) -> bool:
     # hashed_password must be bytes for bcrypt
     if isinstance(hashed_password, str):
-        hashed_password_bytes = hashed_password.encode('utf-8')
-    else:
-        hashed_password_bytes = hashed_password
-        
-    return bcrypt.checkpw(password_bytes, hashed_password_bytes)
+        hashed_password = hashed_password.encode('utf-8')
+    return bcrypt.checkpw(_password_bytes(plain_password), hashed_password)
+
+
+def _submit_hash_job(operation: str, fn, *args):
+    """Queue a bcrypt call on the dedicated pool, enforcing the queue limit."""
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service busy, please retry shortly",
+        )
+    PASSWORD_HASH_QUEUE_DEPTH.inc()
+
+    def run():
+        PASSWORD_HASH_QUEUE_DEPTH.dec()
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+            _hash_slots.release()
+
+    return _hash_executor.submit(run)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password using bcrypt (blocking; prefer hash_password_async in async code)."""
+    return _submit_hash_job("hash", _bcrypt_hash, password).result()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password using bcrypt (blocking; prefer verify_password_async in async code)."""
+    return _submit_hash_job("verify", _bcrypt_verify, plain_password, hashed_password).result()
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the bcrypt pool without blocking the event loop."""
+    return await asyncio.wrap_future(_submit_hash_job("hash", _bcrypt_hash, password))
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the bcrypt pool without blocking the event loop."""
+    return await asyncio.wrap_future(
+        _submit_hash_job("verify", _bcrypt_verify, plain_password, hashed_password)
+    )
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when a stored hash was made with a different work factor than BCRYPT_ROUNDS."""
+    # bcrypt hashes look like $2b$12$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError, AttributeError):
+        return False
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     """Create a JWT access token."""
@@ -60,7 +119,8 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    to_encode.update({"exp": expire})
+    # iat scopes the current-user cache to this token
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -73,12 +133,36 @@ def decode_access_token(token: str):
     except JWTError:
         return None
 
+def token_subject(authorization: str | None):
+    """The "sub" of a valid "Bearer <token>" Authorization header, else None."""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    payload = decode_access_token(authorization.split(" ", 1)[1])
+    return payload.get("sub") if payload else None
+
+
+def _snapshot_user(user: User) -> dict:
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def _attach_cached_user(db: Session, snapshot: dict) -> User:
+    """Rebuild a cached user as a persistent instance of this request's session, without SQL."""
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
-    """Get the current user from a JWT token."""
+    """
+    Get the current user from a JWT token.
+
+    FastAPI resolves this once per request even when require_role() also
+    depends on it; across requests the user row is served from a short-TTL
+    cache keyed by (username, token iat), invalidated whenever the user changes.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -95,6 +179,11 @@ def get_current_user(
             detail="Invalid or expired token",
         )
 
+    cache_key = (username, payload.get("iat"))
+    snapshot = current_user_cache.get(cache_key)
+    if snapshot is not None:
+        return _attach_cached_user(db, snapshot)
+
     user = db.query(User).filter(User.username == username).first()
 
     if user is None:
@@ -103,4 +192,16 @@ def get_current_user(
             detail="User not found",
         )
 
+    current_user_cache.set(cache_key, _snapshot_user(user))
     return user
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_changed_users(session, flush_context):
+    """Drop cached users whose profile, role or verification state was written."""
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            history = inspect(obj).attrs.username.history
+            for username in (history.deleted or []) + [obj.username]:
+                if username:
+                    invalidate_user(username)
@@ -1,61 +1,299 @@
-from typing import Dict, List
-from fastapi import WebSocket
+"""
+Per-user WebSocket notifications.
+
+Every connection gets a bounded outbound queue drained by its own writer
+task, so sending never waits on a client: send_personal_message() and
+broadcast() serialize the message once and only enqueue it. A slow or
+stuck client only ever delays itself.
+
+When a client's queue is full (WS_SEND_QUEUE_SIZE messages behind), the
+WS_SLOW_CONSUMER_POLICY applies:
+
+  drop_oldest   discard its oldest queued message to make room (default;
+                notifications are hints to refetch, the newest matter most)
+  disconnect    close it with 1013 (try again later); the client reconnects
+
+A send that fails or takes longer than WS_SEND_TIMEOUT_SECONDS removes the
+connection from its writer task, without involving the sender.
+
+Messages go out through the pub/sub backplane (app.core.ws_backplane), so
+send_personal_message() reaches the user's sockets in every API worker,
+not only this one; the backplane calls back into deliver() here. Besides
+its user, a connection can join groups (all doctors share the open pool),
+addressed with send_group_message().
+
+Liveness: every WS_PING_INTERVAL_SECONDS the server sends {"type": "ping"}
+to each connection, and clients answer {"type": "pong"}. A connection
+that has sent nothing for WS_IDLE_TIMEOUT_SECONDS is half-open or gone,
+and is closed with 1001. At most WS_MAX_CONNECTIONS_PER_USER sockets are
+kept per user (a new one replaces the oldest, which is closed with 4001)
+and WS_MAX_CONNECTIONS per process (beyond that, new ones get 1013).
+"""
+import asyncio
 import json
 import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+from prometheus_client import Counter, Gauge
+
+from app.core.ws_backplane import Backplane, create_backplane, group_topic, user_topic
 
 logger = logging.getLogger(__name__)
 
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10")) or None
+WS_PING_INTERVAL_SECONDS = float(os.getenv("WS_PING_INTERVAL_SECONDS", "25"))
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "60"))
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "5"))
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+
+# Close codes
+IDLE_CLOSE_CODE = 1001           # going away: no traffic within the idle timeout
+SLOW_CONSUMER_CLOSE_CODE = 1013  # try again later: fell behind, or the server is full
+REPLACED_CLOSE_CODE = 4001       # the user opened more than WS_MAX_CONNECTIONS_PER_USER
+
+WS_CONNECTIONS_OPEN = Gauge(
+    "ws_connections_open", "WebSocket connections open in this process"
+)
+WS_CONNECTIONS_EVICTED = Counter(
+    "ws_connections_evicted", "WebSocket connections closed or refused by the server", ["reason"]
+)
+WS_MESSAGES = Counter(
+    "ws_messages", "WebSocket messages sent, received, or dropped for slow clients", ["direction"]
+)
+
+
+class Connection:
+    """One registered socket: its outbound queue and the task draining it."""
+
+    __slots__ = ("websocket", "user_id", "topics", "queue", "task", "dropped", "last_seen")
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int, groups: Iterable[str] = ()):
+        self.websocket = websocket
+        self.user_id = user_id
+        # Backplane topics this connection receives: its user, then its groups
+        self.topics = (user_topic(user_id),) + tuple(group_topic(name) for name in groups)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: asyncio.Task = None
+        self.dropped = 0  # messages discarded under drop_oldest
+        self.last_seen = time.monotonic()  # last message from the client
+
+
 class ConnectionManager:
-    def __init__(self):
-        # Map user_id to list of active WebSocket connections
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Accept and register a new WebSocket connection."""
+    def __init__(
+        self,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        policy: str = WS_SLOW_CONSUMER_POLICY,
+        send_timeout: float = WS_SEND_TIMEOUT_SECONDS,
+        backplane: Optional[Backplane] = None,
+        ping_interval: float = WS_PING_INTERVAL_SECONDS,
+        idle_timeout: float = WS_IDLE_TIMEOUT_SECONDS,
+        max_per_user: int = WS_MAX_CONNECTIONS_PER_USER,
+        max_connections: int = WS_MAX_CONNECTIONS,
+    ):
+        if policy not in ("drop_oldest", "disconnect"):
+            raise ValueError(f"Unknown slow consumer policy {policy!r} (expected drop_oldest or disconnect)")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.max_per_user = max_per_user
+        self.max_connections = max_connections
+        # Map user_id to that user's live connections, keyed by socket, oldest first
+        self.active_connections: Dict[int, Dict[WebSocket, Connection]] = {}
+        # Map group topic to its members' connections
+        self.group_connections: Dict[str, Dict[WebSocket, Connection]] = {}
+        self.connection_count = 0
+        self.backplane = backplane if backplane is not None else create_backplane()
+        self._subscribed: Set[str] = set()  # topics whose backplane channel we listen on
+        self._subscription_lock = asyncio.Lock()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket, user_id: int, groups: Iterable[str] = ()) -> Optional[Connection]:
+        """
+        Accept and register a new WebSocket connection, enforcing the
+        connection limits. Returns None when it was refused (and closed).
+        """
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+        if self.connection_count >= self.max_connections:
+            logger.warning(f"Refusing WebSocket for user {user_id}: {self.connection_count} connections open")
+            WS_CONNECTIONS_EVICTED.labels("capacity").inc()
+            await self._close(websocket, SLOW_CONSUMER_CLOSE_CODE, "Server at capacity")
+            return None
+        existing = self.active_connections.get(user_id, {})
+        while len(existing) >= self.max_per_user:
+            self.evict(next(iter(existing.values())), REPLACED_CLOSE_CODE, "Too many connections", "user_limit")
+            existing = self.active_connections.get(user_id, {})
+        return await self.register(websocket, user_id, groups)
+
+    async def register(self, websocket: WebSocket, user_id: int, groups: Iterable[str] = ()) -> Connection:
+        """Register an already accepted socket, start its writer task and listen on its topics."""
+        connection = Connection(websocket, user_id, self.queue_size, groups)
+        connection.task = asyncio.create_task(self._writer(connection))
+        self.active_connections.setdefault(user_id, {})[websocket] = connection
+        for topic in connection.topics[1:]:
+            self.group_connections.setdefault(topic, {})[websocket] = connection
+        self.connection_count += 1
+        WS_CONNECTIONS_OPEN.inc()
         logger.info(f"WebSocket connected for user {user_id}. Total connections: {len(self.active_connections[user_id])}")
-    
+        if self._heartbeat is None and self.ping_interval:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        await self.backplane.start(self.deliver)
+        async with self._subscription_lock:
+            for topic in connection.topics:
+                if topic not in self._subscribed and self._local(topic):
+                    await self.backplane.subscribe(topic)
+                    self._subscribed.add(topic)
+        return connection
+
+    def _local(self, topic: str) -> Dict[WebSocket, Connection]:
+        """This process's connections on a user or group topic."""
+        if topic.startswith("user:"):
+            return self.active_connections.get(int(topic[len("user:"):]), {})
+        return self.group_connections.get(topic, {})
+
+    async def _release(self, topics: Iterable[str]):
+        """Stop listening on topics once their last local connection has gone."""
+        async with self._subscription_lock:
+            for topic in topics:
+                if topic in self._subscribed and not self._local(topic):
+                    self._subscribed.discard(topic)
+                    try:
+                        await self.backplane.unsubscribe(topic)
+                    except Exception as e:
+                        logger.error(f"Backplane unsubscribe failed for {topic}: {e!r}")
+
     def disconnect(self, websocket: WebSocket, user_id: int):
-        """Remove a WebSocket connection."""
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-                logger.info(f"WebSocket disconnected for user {user_id}. Remaining: {len(self.active_connections[user_id])}")
-            
-            # Clean up empty lists
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-    
+        """Remove a WebSocket connection and stop its writer. Safe to call twice."""
+        connections = self.active_connections.get(user_id)
+        if not connections:
+            return
+        connection = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[user_id]
+        if connection is None:
+            return
+        emptied = [] if connections else [connection.topics[0]]
+        for topic in connection.topics[1:]:
+            members = self.group_connections.get(topic, {})
+            members.pop(websocket, None)
+            if not members:
+                self.group_connections.pop(topic, None)
+                emptied.append(topic)
+        if emptied:
+            asyncio.create_task(self._release(emptied))
+        self.connection_count -= 1
+        WS_CONNECTIONS_OPEN.dec()
+        if connection.task is not None and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+        logger.info(f"WebSocket disconnected for user {user_id}. Remaining: {len(connections)}")
+
+    def evict(self, connection: Connection, code: int, reason: str, label: str):
+        """Drop a connection the server gave up on and close it in the background."""
+        logger.warning(f"Closing WebSocket for user {connection.user_id}: {reason}")
+        WS_CONNECTIONS_EVICTED.labels(label).inc()
+        self.disconnect(connection.websocket, connection.user_id)
+        asyncio.create_task(self._close(connection.websocket, code, reason))
+
+    def touch(self, connection: Connection):
+        """Record inbound traffic from the client; it is alive."""
+        connection.last_seen = time.monotonic()
+        WS_MESSAGES.labels("received").inc()
+
+    async def _heartbeat_loop(self):
+        """Ping every connection each interval and evict the ones gone quiet."""
+        ping = json.dumps({"type": "ping"})
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            cutoff = time.monotonic() - self.idle_timeout
+            for connections in list(self.active_connections.values()):
+                for connection in list(connections.values()):
+                    if connection.last_seen < cutoff:
+                        self.evict(connection, IDLE_CLOSE_CODE, "Idle timeout", "idle")
+                    else:
+                        self._enqueue(connection, ping)
+
+    async def _writer(self, connection: Connection):
+        """Drain one connection's queue; a failed or stuck send drops the connection."""
+        websocket = connection.websocket
+        sent = WS_MESSAGES.labels("sent")
+        try:
+            while True:
+                message = await connection.queue.get()
+                async with asyncio.timeout(self.send_timeout):
+                    await websocket.send_text(message)
+                sent.inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to user {connection.user_id}: {e!r}")
+            WS_CONNECTIONS_EVICTED.labels("send_failed").inc()
+            self.disconnect(websocket, connection.user_id)
+
+    def _enqueue(self, connection: Connection, message: str) -> None:
+        try:
+            connection.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.policy == "drop_oldest":
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+            connection.dropped += 1
+            WS_MESSAGES.labels("dropped").inc()
+            return
+        self.evict(connection, SLOW_CONSUMER_CLOSE_CODE, "Too slow", "slow")
+
+    async def _close(self, websocket: WebSocket, code: int, reason: str):
+        try:
+            async with asyncio.timeout(self.send_timeout):
+                await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass  # already gone
+
+    def send_to(self, connection: Connection, message: dict) -> None:
+        """Queue a message for this one local connection only (replies, greetings)."""
+        self._enqueue(connection, json.dumps(message))
+
+    def deliver(self, topic: Optional[str], message_json: str) -> None:
+        """Queue a message from the backplane for this process's connections on topic (None: all)."""
+        if topic is None:
+            targets = [c for connections in self.active_connections.values() for c in connections.values()]
+        else:
+            targets = list(self._local(topic).values())
+        for connection in targets:
+            self._enqueue(connection, message_json)
+
+    async def publish(self, topic: Optional[str], message: dict):
+        """Send a message to every connection on a backplane topic, in any worker."""
+        await self.backplane.publish(topic, json.dumps(message))
+
     async def send_personal_message(self, message: dict, user_id: int):
-        """Send a message to all connections of a specific user."""
-        if user_id in self.active_connections:
-            message_json = json.dumps(message)
-            disconnected = []
-            
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(message_json)
-                except Exception as e:
-                    logger.error(f"Error sending message to user {user_id}: {e}")
-                    disconnected.append(connection)
-            
-            # Clean up failed connections
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
-    
+        """Send a message to all connections of a specific user, in any worker."""
+        await self.publish(user_topic(user_id), message)
+
+    async def send_group_message(self, message: dict, group: str):
+        """Send a message to every connection in a group (e.g. "doctors"), in any worker."""
+        await self.publish(group_topic(group), message)
+
     async def broadcast(self, message: dict):
-        """Send a message to all active connections."""
-        message_json = json.dumps(message)
+        """Send a message to all active connections, in every worker."""
+        await self.publish(None, message)
+
+    async def close(self):
+        """Drop every local connection and leave the backplane (app shutdown)."""
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
         for user_id, connections in list(self.active_connections.items()):
-            for connection in connections[:]:  # Copy list to avoid modification during iteration
-                try:
-                    await connection.send_text(message_json)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to user {user_id}: {e}")
-                    self.disconnect(connection, user_id)
+            for websocket in list(connections):
+                self.disconnect(websocket, user_id)
+        await self.backplane.close()
 
 # Global instance
 manager = ConnectionManager()
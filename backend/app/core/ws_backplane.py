@@ -0,0 +1,264 @@
+"""
+Pub/sub backplane for WebSocket notifications.
+
+A WebSocket lives in one uvicorn worker, but notifications are raised in
+any worker (and in Celery). The ConnectionManager therefore never delivers
+directly: it publishes to a topic on the backplane, and the backplane
+hands the message to whichever processes hold a connection on that topic.
+
+Topics are "user:<id>" (every connection of one user) and "group:<name>"
+(e.g. group:doctors, every connected doctor); None means everyone.
+
+Two backplanes, picked with WS_BACKPLANE:
+
+  memory  in-process only (default). Enough for a single API worker, and
+          every ConnectionManager in the process shares it, so tests can
+          run several "workers" side by side.
+  redis   Redis pub/sub at WS_BACKPLANE_URL (default REDIS_URL). Each
+          process subscribes to medifusion:ws:<topic> for the topics of
+          its local connections, plus medifusion:ws:broadcast, so a
+          message only travels to the processes that can deliver it.
+
+Each topic also has a sequence counter (next_sequence), so clients can
+tell when they missed a message and should resync.
+
+Messages are published already serialized, so they are encoded once
+however many sockets receive them. Processes without a running event loop
+and connections (Celery workers, scripts) publish with publish_sync().
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, Iterable, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+WS_BACKPLANE = os.getenv("WS_BACKPLANE", "memory")
+WS_BACKPLANE_URL = os.getenv("WS_BACKPLANE_URL", os.getenv("REDIS_URL", "redis://redis:6379/0"))
+
+CHANNEL_PREFIX = "medifusion:ws:"
+BROADCAST_CHANNEL = CHANNEL_PREFIX + "broadcast"
+SEQUENCE_PREFIX = CHANNEL_PREFIX + "seq:"
+
+# deliver(topic, message_json); topic None means every local connection
+Deliver = Callable[[Optional[str], str], None]
+
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def group_topic(name: str) -> str:
+    return f"group:{name}"
+
+
+def channel_for(topic: Optional[str]) -> str:
+    return BROADCAST_CHANNEL if topic is None else CHANNEL_PREFIX + topic
+
+
+def _channel_topic(channel: str) -> Optional[str]:
+    if channel == BROADCAST_CHANNEL:
+        return None
+    return channel[len(CHANNEL_PREFIX):]
+
+
+class Backplane:
+    async def start(self, deliver: Deliver) -> None:
+        """Begin delivering received messages to deliver. Idempotent."""
+        raise NotImplementedError
+
+    async def subscribe(self, topic: str) -> None:
+        """This process now holds connections on topic."""
+        raise NotImplementedError
+
+    async def unsubscribe(self, topic: str) -> None:
+        raise NotImplementedError
+
+    async def publish(self, topic: Optional[str], message_json: str) -> None:
+        """Route a message to topic's connections in every process (None: everyone's)."""
+        raise NotImplementedError
+
+    async def next_sequence(self, topic: str) -> int:
+        """Allocate the next sequence number of topic (1, 2, ...)."""
+        raise NotImplementedError
+
+    async def current_sequences(self, topics: Iterable[str]) -> Dict[str, int]:
+        """The last sequence number allocated for each topic (0 if none yet)."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+# Shared by every MemoryBackplane in the process: channel -> deliver callbacks,
+# and topic -> last sequence number
+_memory_subscribers: Dict[str, Set[Deliver]] = {}
+_memory_sequences: Dict[str, int] = {}
+
+
+class MemoryBackplane(Backplane):
+    def __init__(
+        self,
+        subscribers: Optional[Dict[str, Set[Deliver]]] = None,
+        sequences: Optional[Dict[str, int]] = None,
+    ):
+        self.subscribers = _memory_subscribers if subscribers is None else subscribers
+        self.sequences = _memory_sequences if sequences is None else sequences
+        self.deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver) -> None:
+        if self.deliver is None:
+            self.deliver = deliver
+            self.subscribers.setdefault(BROADCAST_CHANNEL, set()).add(deliver)
+
+    async def subscribe(self, topic: str) -> None:
+        self.subscribers.setdefault(channel_for(topic), set()).add(self.deliver)
+
+    async def unsubscribe(self, topic: str) -> None:
+        subscribers = self.subscribers.get(channel_for(topic))
+        if subscribers is not None:
+            subscribers.discard(self.deliver)
+            if not subscribers:
+                del self.subscribers[channel_for(topic)]
+
+    async def publish(self, topic: Optional[str], message_json: str) -> None:
+        for deliver in list(self.subscribers.get(channel_for(topic), ())):
+            deliver(topic, message_json)
+
+    async def next_sequence(self, topic: str) -> int:
+        self.sequences[topic] = self.sequences.get(topic, 0) + 1
+        return self.sequences[topic]
+
+    async def current_sequences(self, topics: Iterable[str]) -> Dict[str, int]:
+        return {topic: self.sequences.get(topic, 0) for topic in topics}
+
+    async def close(self) -> None:
+        if self.deliver is not None:
+            for subscribers in self.subscribers.values():
+                subscribers.discard(self.deliver)
+            self.deliver = None
+
+
+class RedisBackplane(Backplane):
+    # Wait between reconnect attempts after the Redis connection is lost
+    RECONNECT_SECONDS = 1.0
+    # How long start() waits for the first subscription before carrying on
+    CONNECT_TIMEOUT_SECONDS = 5.0
+
+    def __init__(self, url: str = WS_BACKPLANE_URL, client: Optional[aioredis.Redis] = None):
+        self.redis = client if client is not None else aioredis.Redis.from_url(url)
+        self.channels: Set[str] = set()  # topic channels this process wants
+        self.pubsub = None  # the live subscription, None while (re)connecting
+        self.deliver: Optional[Deliver] = None
+        self.listener: Optional[asyncio.Task] = None
+        self.ready = asyncio.Event()
+
+    async def start(self, deliver: Deliver) -> None:
+        if self.listener is None:
+            self.deliver = deliver
+            self.listener = asyncio.create_task(self._listen())
+        try:
+            await asyncio.wait_for(self.ready.wait(), self.CONNECT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            # Carry on: wanted channels are subscribed once the listener connects
+            logger.warning("WebSocket backplane not connected yet")
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(BROADCAST_CHANNEL, *self.channels)
+                self.pubsub = pubsub
+                self.ready.set()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        channel = message["channel"].decode()
+                        self.deliver(_channel_topic(channel), message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"WebSocket backplane connection lost, reconnecting: {e!r}")
+                await asyncio.sleep(self.RECONNECT_SECONDS)
+            finally:
+                self.pubsub = None
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+
+    async def subscribe(self, topic: str) -> None:
+        channel = channel_for(topic)
+        self.channels.add(channel)
+        if self.pubsub is not None:  # otherwise subscribed on reconnect
+            await self.pubsub.subscribe(channel)
+
+    async def unsubscribe(self, topic: str) -> None:
+        channel = channel_for(topic)
+        self.channels.discard(channel)
+        if self.pubsub is not None:
+            await self.pubsub.unsubscribe(channel)
+
+    async def publish(self, topic: Optional[str], message_json: str) -> None:
+        await self.redis.publish(channel_for(topic), message_json)
+
+    async def next_sequence(self, topic: str) -> int:
+        return await self.redis.incr(SEQUENCE_PREFIX + topic)
+
+    async def current_sequences(self, topics: Iterable[str]) -> Dict[str, int]:
+        topics = list(topics)
+        values = await self.redis.mget([SEQUENCE_PREFIX + topic for topic in topics]) if topics else []
+        return {topic: int(value or 0) for topic, value in zip(topics, values)}
+
+    async def close(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+            try:
+                await self.listener
+            except asyncio.CancelledError:
+                pass
+            self.listener = None
+        await self.redis.close()
+
+
+def create_backplane(kind: str = WS_BACKPLANE) -> Backplane:
+    if kind == "redis":
+        return RedisBackplane()
+    if kind == "memory":
+        return MemoryBackplane()
+    raise ValueError(f"Unknown WS_BACKPLANE {kind!r} (expected memory or redis)")
+
+
+# ---------------------------------------------------
+# Publishing from outside the API (Celery)
+# ---------------------------------------------------
+_sync_client: Optional[redis.Redis] = None
+
+
+def _redis_sync() -> Optional[redis.Redis]:
+    """Client for synchronous publishers; None with the memory backplane (no API process to reach)."""
+    global _sync_client
+    if WS_BACKPLANE != "redis":
+        return None
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(WS_BACKPLANE_URL)
+    return _sync_client
+
+
+def publish_sync(topic: str, build: Callable[[int], dict]) -> bool:
+    """
+    Publish build(seq) to topic from synchronous code, with the topic's next
+    sequence number. Returns False (and sends nothing) with the memory backplane.
+    """
+    client = _redis_sync()
+    if client is None:
+        logger.debug(f"WS_BACKPLANE={WS_BACKPLANE}: message for {topic} not sent")
+        return False
+    seq = client.incr(SEQUENCE_PREFIX + topic)
+    client.publish(channel_for(topic), json.dumps(build(seq)))
+    return True
+
@@ -15,19 +15,35 @@ import logging
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
 from fastapi.openapi.utils import get_openapi
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.models.user import User
 from app.models.base import Base
-from app.core.database import engine, get_db
+from app.core.database import engine, get_db, get_read_db
+from app.core.cache import mark_recent_write, wrote_recently
+from app.core.security import token_subject
+from app.utils.file_handler import MAX_UPLOAD_BYTES
+from app.utils.image_pool import InvalidImageError, prepare_image_async, shutdown_image_pool
+from starlette.concurrency import run_in_threadpool
+import app.services.stats_service  # registers the case stats rollup listeners
+from app.services.stats_service import ensure_stats_rollup
+from app.services.search_service import ensure_search_index
+from app.services.imaging_service import ensure_imaging_schema
+from app.services.prediction_backfill import ensure_prediction_schema
+from app.services.upload_sessions import ensure_upload_session_schema
 from app.api.auth.routes import router as auth_router
 from app.api.patient.routes import router as patient_router
 from app.api.doctor.routes import router as doctor_router
 from app.api.admin.routes import router as admin_router
 from app.api.websocket.routes import router as websocket_router
+from app.core.websocket_manager import manager as websocket_manager
 from app.api.chat.routes import router as chat_router
-# from app.api.lab.routes import router as lab_router  # EXCLUDED FOR NOW
+from app.api.media.routes import router as media_router
+from app.api.predict.routes import router as predict_router
+from app.api.uploads.routes import router as uploads_router
+from app.api.lab.routes import router as lab_router
 
 # ---------------------------------------------------
 # AI Functions (Real Models)
@@ -63,6 +79,8 @@ app.add_middleware(
     allow_credentials=False,  # Must be False when using wildcard
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset pagination cursor, conditional GET validator, media range responses, resumable uploads
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges", "Upload-Offset", "Upload-Length"],
 )
 
 # Custom CORS middleware as fallback
@@ -84,6 +102,34 @@ async def add_cors_headers(request, call_next):
     return response
 
 
+# Read-your-writes: after a user's successful write, route that user's
+# get_read_db reads to the primary until the replica has caught up.
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+@app.middleware("http")
+async def route_reads_after_writes(request, call_next):
+    subject = token_subject(request.headers.get("authorization"))
+    request.state.read_from_primary = wrote_recently(subject)
+
+    response = await call_next(request)
+
+    if subject and request.method not in SAFE_METHODS and response.status_code < 400:
+        mark_recent_write(subject)
+    return response
+
+
+# Reject uploads that announce an oversized body before the multipart parser
+# spools them; chunked bodies are still capped by stream_upload_to_disk.
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 1024 * 1024  # multipart framing and form fields
+
+@app.middleware("http")
+async def limit_request_size(request, call_next):
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+        return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+    return await call_next(request)
+
+
 # ---------------------------------------------------
 # Database setup
 # ---------------------------------------------------
@@ -97,6 +143,11 @@ try:
         logger.info("✅ Database reset complete")
     else:
         Base.metadata.create_all(bind=engine)
+    ensure_prediction_schema(engine)
+    ensure_search_index(engine, rebuild=DEV_MODE)
+    ensure_imaging_schema(engine)
+    ensure_upload_session_schema(engine)
+    ensure_stats_rollup(engine)
 except Exception as e:
     logger.error("❌ Database setup error: %s", e)
 
@@ -109,7 +160,13 @@ app.include_router(doctor_router, prefix="/doctor", tags=["Doctor"])
 app.include_router(admin_router, prefix="/admin", tags=["Admin"])
 app.include_router(websocket_router, tags=["WebSocket"])
 app.include_router(chat_router)
-# app.include_router(lab_router, prefix="/lab", tags=["Lab"])  # EXCLUDED FOR NOW
+app.include_router(media_router, prefix="/media", tags=["Media"])
+app.include_router(predict_router)
+app.include_router(uploads_router, prefix="/uploads", tags=["Uploads"])
+app.include_router(lab_router, prefix="/lab", tags=["Lab"])
+
+app.router.on_shutdown.append(shutdown_image_pool)  # stop the image decode workers
+app.router.on_shutdown.append(websocket_manager.close)  # leave the WebSocket backplane
 
 # ---------------------------------------------------
 # AI Test Models
@@ -151,10 +208,17 @@ app.openapi = custom_openapi
 # ---------------------------------------------------
 # Actual AI Endpoints
 # ---------------------------------------------------
+async def prepare_upload(file: UploadFile):
+    """Validate and downscale an uploaded image on the process pool (422 if it isn't one)."""
+    try:
+        return await prepare_image_async(await file.read())
+    except InvalidImageError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
 @app.post("/predict-xray")
 async def predict_xray(file: UploadFile):
-    data = await file.read()
-    return {"prediction": analyze_image_bytes(data)}
+    image = await prepare_upload(file)
+    return {"prediction": await run_in_threadpool(analyze_image_bytes, image)}
 
 @app.post("/analyze-prescription")
 async def analyze_prescription_endpoint(file: UploadFile):
@@ -162,8 +226,8 @@ async def analyze_prescription_endpoint(file: UploadFile):
     Analyze uploaded prescription/medicine image.
     """
     from app.ai.predictor import analyze_prescription
-    data = await file.read()
-    return {"analysis": analyze_prescription(data)}
+    image = await prepare_upload(file)
+    return {"analysis": await run_in_threadpool(analyze_prescription, image)}
 
 @app.post("/predict-symptoms")
 async def predict_symptoms(symptoms: str = Form(...)):
@@ -200,7 +264,7 @@ async def summarize_medical_report(
 # Public Endpoints
 # ---------------------------------------------------
 @app.get("/doctors")
-def get_doctors(db: Session = Depends(get_db)):
+def get_doctors(db: Session = Depends(get_read_db)):
     """Fetch all registered doctors."""
     doctors = db.query(User).filter(User.role == "doctor").all()
     return [
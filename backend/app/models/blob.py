@@ -0,0 +1,27 @@
+# app/models/blob.py
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String
+
+from .base import Base
+
+
+class StoredBlob(Base):
+    """
+    One uploaded file, stored once under its SHA-256 (see app.services.blob_store).
+
+    ref_count is the number of stored references ("sha256:<hex>" values in
+    patient_cases / lab_reports) pointing at it. Blobs that drop to zero are
+    deleted by the garbage collector after a grace period.
+    """
+    __tablename__ = "blobs"
+    __table_args__ = (
+        Index("ix_blobs_unreferenced", "ref_count", "updated_at"),
+    )
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String, nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
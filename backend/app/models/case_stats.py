@@ -0,0 +1,22 @@
+# app/models/case_stats.py
+from sqlalchemy import Column, Integer, String, Float, UniqueConstraint
+from .base import Base, IdMixin
+
+class CaseStatsRollup(Base, IdMixin):
+    """
+    Running counters over patient_cases, one row per (dimension, bucket).
+
+    Dimensions: "total" (bucket "all"), "status" (bucket = case status) and
+    "disease" (bucket = pneumonia / normal / other, X-ray cases only).
+    Maintained by app.services.stats_service on every case flush.
+    """
+    __tablename__ = "case_stats_rollup"
+    __table_args__ = (
+        UniqueConstraint("dimension", "bucket", name="uq_case_stats_rollup_dimension_bucket"),
+    )
+
+    dimension = Column(String, nullable=False)
+    bucket = Column(String, nullable=False)
+    case_count = Column(Integer, nullable=False, default=0)
+    severity_sum = Column(Float, nullable=False, default=0.0)
+    severity_count = Column(Integer, nullable=False, default=0)
@@ -1,12 +1,12 @@
-from sqlalchemy import Column, Integer, String, JSON, Float, Boolean, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, JSON, Float, Boolean, DateTime, Index
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime
 from .base import Base
 
-class PatientCase(Base):
-    __tablename__ = "patient_cases"
 
-    id = Column(Integer, primary_key=True, index=True)
+class PatientCaseColumns:
+    """Case columns shared by the live table and the archive (see ArchivedPatientCase)."""
+
     patient_name = Column(String, nullable=False)
     patient_contact = Column(String, nullable=True)
     uploaded_file = Column(String, nullable=True)
@@ -15,6 +15,17 @@ class PatientCase(Base):
 
     xray_result = Column(JSON, nullable=True)
     symptom_result = Column(JSON, nullable=True)
+
+    # Denormalized from the AI results above (see extract_prediction_fields)
+    top_label = Column(String, nullable=True)   # lowercased, e.g. "pneumonia"
+    top_prob = Column(Float, nullable=True)
+    urgency = Column(String, nullable=True)     # high / medium / low (symptom analysis)
+
+    # From DICOM uploads (see app.utils.dicom.extract_metadata); NULL for plain images
+    modality = Column(String, nullable=True)    # e.g. "CR", "DX", "CT"
+    body_part = Column(String, nullable=True)   # BodyPartExamined, e.g. "CHEST"
+    study_date = Column(DateTime, nullable=True)
+    imaging_metadata = Column(JSON, nullable=True)
     
     # New fields for pulmonary workflow
     severity_score = Column(Float, nullable=True, default=0.0)
@@ -41,5 +52,77 @@ class PatientCase(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
+
+class PatientCase(PatientCaseColumns, Base):
+    __tablename__ = "patient_cases"
+    __table_args__ = (
+        # Composite indexes backing keyset pagination of the case lists
+        Index("ix_patient_cases_patient_created", "patient_name", "created_at", "id"),
+        Index("ix_patient_cases_doctor_created", "assigned_doctor_id", "reviewed_by_doctor", "created_at", "id"),
+        Index("ix_patient_cases_doctor_updated", "assigned_doctor_id", "reviewed_by_doctor", "updated_at", "id"),
+        Index("ix_patient_cases_pool_created", "status", "assigned_doctor_id", "created_at", "id"),
+        # Open-pool ETag validator: count + max(updated_at) as an index-only scan
+        Index("ix_patient_cases_pool_updated", "status", "assigned_doctor_id", "updated_at"),
+        Index("ix_patient_cases_lab_created", "assigned_lab_tech_id", "created_at", "id"),
+        # Prediction filters, e.g. label = 'pneumonia' this week with prob > 0.8
+        Index("ix_patient_cases_prediction", "top_label", "created_at", "top_prob"),
+        Index("ix_patient_cases_urgency", "urgency", "created_at"),
+        # Never hand out an id again once it was used: archived cases keep
+        # theirs, and plain SQLite rowids restart from max(id) + 1
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+
     # Relationship to Report (commented out - Report model not implemented)
     # reports = relationship("Report", back_populates="case")
+
+    @validates("xray_result", "symptom_result")
+    def _sync_prediction_fields(self, key, value):
+        """Keep the denormalized prediction columns in step with the JSON results."""
+        xray_result = value if key == "xray_result" else self.xray_result
+        symptom_result = value if key == "symptom_result" else self.symptom_result
+        self.top_label, self.top_prob, self.urgency = extract_prediction_fields(xray_result, symptom_result)
+        return value
+
+
+class ArchivedPatientCase(PatientCaseColumns, Base):
+    """
+    Cold storage for cases closed longer than ARCHIVE_AFTER_DAYS, moved here by
+    app.services.archive_service. Rows keep their original id; read-only.
+    """
+    __tablename__ = "patient_cases_archive"
+    __table_args__ = (
+        # Patient history (my-cases) and the doctor's closed-case count
+        Index("ix_patient_cases_archive_patient_created", "patient_name", "created_at", "id"),
+        Index("ix_patient_cases_archive_doctor", "assigned_doctor_id", "reviewed_by_doctor"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+def extract_prediction_fields(xray_result, symptom_result):
+    """
+    Pull (top_label, top_prob, urgency) out of the AI result blobs.
+    The X-ray prediction wins over the symptom one; urgency only comes from symptoms.
+    Supports both the Gemini format (top_label/top_prob) and the old one (label/prob).
+    """
+    primary = xray_result or symptom_result or {}
+    label = primary.get("top_label") or primary.get("label")
+    prob = primary.get("top_prob")
+    if prob is None:
+        prob = primary.get("prob")
+
+    urgency = (symptom_result or {}).get("urgency")
+
+    try:
+        prob = float(prob) if prob is not None else None
+    except (TypeError, ValueError):
+        prob = None
+
+    return (
+        label.strip().lower() if isinstance(label, str) and label.strip() else None,
+        prob,
+        urgency.strip().lower() if isinstance(urgency, str) and urgency.strip() else None,
+    )
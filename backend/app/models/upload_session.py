@@ -0,0 +1,38 @@
+# app/models/upload_session.py
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String
+
+from .base import Base
+
+
+class UploadSession(Base):
+    """
+    A resumable upload in progress (see app.services.upload_sessions).
+
+    Bytes received so far live in a part file; offset is how many of them
+    have been acknowledged, and chain_hash is the rolling hash over the
+    acknowledged chunks. Completed sessions keep their case_id until they
+    expire, so a finalize whose response was lost can simply be repeated.
+    """
+    __tablename__ = "upload_sessions"
+    __table_args__ = (
+        Index("ix_upload_sessions_expires", "expires_at"),
+    )
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    purpose = Column(String, nullable=False)        # xray / lab_document
+    filename = Column(String, nullable=True)
+    content_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=False)       # declared total size
+    offset = Column(BigInteger, nullable=False, default=0)
+    chain_hash = Column(String(64), nullable=False)
+    sha256 = Column(String(64), nullable=True)      # optional client-declared hash of the whole file
+    status = Column(String, nullable=False, default="open")  # open / finalizing / completed
+    case_id = Column(Integer, nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # a chunk is being written
+    lock_token = Column(String(32), nullable=True)  # which request holds that lease
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -16,6 +16,13 @@ class CaseOut(BaseModel):
     symptoms: Optional[str]
     xray_result: Optional[Dict]       # Matches Case.xray_result
     symptom_result: Optional[Dict]    # Matches Case.symptom_result
+    top_label: Optional[str] = None   # Denormalized from the AI results
+    top_prob: Optional[float] = None
+    urgency: Optional[str] = None
+    modality: Optional[str] = None    # DICOM uploads only
+    body_part: Optional[str] = None
+    study_date: Optional[datetime] = None
+    imaging_metadata: Optional[Dict] = None
     status: str
     created_at: datetime              # When case was created
     severity_score: Optional[float]   # AI-generated severity (0-10)
@@ -35,3 +42,26 @@ class CaseOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+class DoctorCaseOut(BaseModel):
+    """Slim case row for the doctor dashboard lists (cards and review panel)."""
+    id: int
+    patient_name: str
+    patient_contact: Optional[str] = None
+    symptoms: Optional[str] = None
+    xray_result: Optional[Dict] = None
+    symptom_result: Optional[Dict] = None
+    status: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    severity_score: Optional[float] = None
+    doctor_notes: Optional[str] = None
+    diagnosis: Optional[str] = None
+    assigned_doctor_id: Optional[int] = None
+    test_status: Optional[str] = None
+    test_ordered: Optional[bool] = False
+    ordered_test_type: Optional[str] = None
+    report_file: Optional[str] = None
+
+    class Config:
+        from_attributes = True
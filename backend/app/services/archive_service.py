@@ -0,0 +1,127 @@
+"""
+Move long-closed cases out of patient_cases into patient_cases_archive.
+
+A case is closed once the doctor has reviewed it and it reached "completed";
+after ARCHIVE_AFTER_DAYS without changes it is copied to the archive table
+and deleted from the live one, in small id-ordered batches with a pause
+between them so the job never holds the write lock for long.
+
+The move uses Core INSERT ... SELECT / DELETE statements, which bypass the
+ORM flush listeners on purpose: archived cases still count in the
+case_stats_rollup totals, and rebuild_rollup() reads both tables.
+
+Runs daily from Celery beat (see app.workers.tasks) or by hand:
+    python -m app.services.archive_service [--days 90] [--batch-size 500] [--dry-run]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.models.patient_case import ArchivedPatientCase, PatientCase
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_BATCH_PAUSE_SECONDS = float(os.getenv("ARCHIVE_BATCH_PAUSE_SECONDS", "0.5"))
+# Upper bound on batches per run (0 = until done); the next run picks up the rest
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", "200"))
+
+_COLUMNS = [column.name for column in PatientCase.__table__.columns]
+
+
+def closed_case_criteria(cutoff: datetime):
+    return [
+        PatientCase.reviewed_by_doctor == True,
+        PatientCase.status == "completed",
+        PatientCase.updated_at < cutoff,
+    ]
+
+
+def archive_closed_cases(
+    db: Session,
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pause_seconds: float = ARCHIVE_BATCH_PAUSE_SECONDS,
+    max_batches: int = ARCHIVE_MAX_BATCHES,
+    dry_run: bool = False,
+) -> int:
+    """Archive closed cases older than the cutoff; returns how many were moved (or would be)."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    criteria = closed_case_criteria(cutoff)
+
+    # patient_cases tables created before sqlite_autoincrement hand out
+    # max(id) + 1, so archiving the newest row would let a new case reuse
+    # its id. Never move the max id.
+    max_id = db.query(func.max(PatientCase.id)).scalar()
+    if max_id is None:
+        return 0
+    criteria.append(PatientCase.id < max_id)
+
+    if dry_run:
+        return db.query(func.count(PatientCase.id)).filter(*criteria).scalar()
+
+    live = PatientCase.__table__
+    archive = ArchivedPatientCase.__table__
+
+    moved = 0
+    batches = 0
+    last_id = 0
+    while not max_batches or batches < max_batches:
+        ids = [
+            case_id for (case_id,) in db.query(PatientCase.id)
+            .filter(PatientCase.id > last_id, *criteria)
+            .order_by(PatientCase.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+
+        connection = db.connection()
+        connection.execute(
+            insert(archive).from_select(
+                _COLUMNS + ["archived_at"],
+                select(*(live.c[name] for name in _COLUMNS), literal(datetime.utcnow()))
+                .where(live.c.id.in_(ids))
+            )
+        )
+        connection.execute(delete(live).where(live.c.id.in_(ids)))
+        db.commit()
+
+        moved += len(ids)
+        batches += 1
+        last_id = ids[-1]
+        print(f"… archived {moved} cases (last id {last_id})")
+
+        if len(ids) < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    return moved
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal, engine
+    from app.models.base import Base
+
+    parser = argparse.ArgumentParser(description="Archive long-closed patient cases")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=ARCHIVE_BATCH_PAUSE_SECONDS)
+    parser.add_argument("--max-batches", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine, tables=[ArchivedPatientCase.__table__])
+    db = SessionLocal()
+    try:
+        total = archive_closed_cases(
+            db, args.days, args.batch_size, args.pause, args.max_batches, args.dry_run
+        )
+        verb = "would be archived" if args.dry_run else "archived"
+        print(f"✅ {total} cases {verb}")
+    finally:
+        db.close()
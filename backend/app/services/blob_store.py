@@ -0,0 +1,355 @@
+"""
+Content-addressed upload store with reference counting.
+
+Every upload is stored once under its SHA-256; re-uploading the same film
+adds a reference instead of another copy. Records keep a "sha256:<hex>"
+reference in their file column (patient_cases.uploaded_file/report_file,
+lab_reports.file_path), and the blobs table counts those references.
+Values without the prefix are legacy container paths and still resolve.
+
+Two backends, picked with STORAGE_BACKEND:
+
+  local   files under BLOB_DIR (default UPLOAD_DIR/blobs), fanned out as ab/cd/<hash>
+  s3      any S3-compatible store (AWS, MinIO) via boto3: S3_BUCKET,
+          S3_ENDPOINT_URL, S3_PREFIX plus the usual AWS_* credentials
+
+With s3 the API and Celery containers no longer need a shared upload
+directory: workers fetch blobs by hash.
+
+Unreferenced blobs are removed by collect_garbage() once they have been at
+zero for BLOB_GC_GRACE_SECONDS. The same pass deletes stored objects older
+than the grace period that have no blobs row at all: store_upload puts the
+object before the caller commits, so a rolled-back upload leaves one behind.
+Runs from Celery beat, or by hand:
+    python -m app.services.blob_store gc [--grace 3600]
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import UPLOAD_DIR
+from app.models.blob import StoredBlob
+from app.utils.file_handler import StoredUpload, open_upload_buffer
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # only needed for STORAGE_BACKEND=s3
+    boto3 = None
+    ClientError = None
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(UPLOAD_DIR, "blobs"))
+S3_BUCKET = os.getenv("S3_BUCKET", "medifusion-uploads")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. http://minio:9000; unset for AWS
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs/")
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+BLOB_REF_PREFIX = "sha256:"
+_SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+
+def blob_ref(sha256: str) -> str:
+    return f"{BLOB_REF_PREFIX}{sha256}"
+
+
+def is_blob_ref(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(BLOB_REF_PREFIX)
+
+
+def blob_key(sha256: str) -> str:
+    """Storage key, fanned out so no directory/prefix holds every blob."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+# ---------------------------------------------------
+# Backends
+# ---------------------------------------------------
+class StorageBackend:
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def put(self, key: str, src_path: str) -> None:
+        """Store the file at src_path under key. The source may be consumed (moved)."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def iter_keys(self, modified_before: datetime) -> Iterator[str]:
+        """Keys of stored blobs last written before modified_before (naive UTC)."""
+        raise NotImplementedError
+
+    @contextmanager
+    def local_path(self, key: str):
+        """A local filesystem path holding the blob's content, valid inside the block."""
+        raise NotImplementedError
+
+    def presigned_url(self, key: str, expires_in: int) -> Optional[str]:
+        """Time-limited direct download URL, for backends that can serve clients themselves."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put(self, key: str, src_path: str) -> None:
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            os.replace(src_path, dest)  # atomic when BLOB_DIR is on the upload filesystem
+        except OSError:
+            partial = f"{dest}.{os.getpid()}.part"
+            shutil.copyfile(src_path, partial)
+            os.replace(partial, dest)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self, modified_before: datetime) -> Iterator[str]:
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not _SHA256_RE.fullmatch(name):
+                    continue  # e.g. a copy still in progress
+                path = os.path.join(dirpath, name)
+                try:
+                    modified = datetime.utcfromtimestamp(os.path.getmtime(path))
+                except FileNotFoundError:
+                    continue
+                if modified < modified_before:
+                    yield blob_key(name)
+
+    @contextmanager
+    def local_path(self, key: str):
+        yield self.path(key)
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, src_path: str) -> None:
+        # upload_file streams from disk and switches to multipart for large files
+        self.client.upload_file(src_path, self.bucket, self._key(key))
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def iter_keys(self, modified_before: datetime) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                name = obj["Key"].rsplit("/", 1)[-1]
+                if _SHA256_RE.fullmatch(name) and obj["LastModified"].replace(tzinfo=None) < modified_before:
+                    yield blob_key(name)
+
+    def presigned_url(self, key: str, expires_in: int) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=expires_in
+        )
+
+    @contextmanager
+    def local_path(self, key: str):
+        fd, path = tempfile.mkstemp(prefix="blob-", dir=UPLOAD_DIR)
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), path)
+            yield path
+        finally:
+            os.remove(path)
+
+
+@lru_cache(maxsize=1)
+def get_storage() -> StorageBackend:
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL)
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (expected local or s3)")
+    return LocalStorage(BLOB_DIR)
+
+
+# ---------------------------------------------------
+# Reference counting
+# ---------------------------------------------------
+def acquire_blob(db: Session, sha256: str, size: int, content_type: Optional[str], refs: int = 1) -> bool:
+    """
+    Add refs references to a blob, creating its row if needed. Returns True
+    when the row was created, i.e. the content may not be in storage yet.
+    """
+    increment = (
+        update(StoredBlob)
+        .where(StoredBlob.sha256 == sha256)
+        .values(ref_count=StoredBlob.ref_count + refs, updated_at=datetime.utcnow())
+    )
+    if db.execute(increment).rowcount:
+        return False
+    try:
+        with db.begin_nested():
+            db.add(StoredBlob(sha256=sha256, size=size, content_type=content_type, ref_count=refs))
+        return True
+    except IntegrityError:  # created concurrently
+        db.execute(increment)
+        return False
+
+
+def release_blob(db: Session, ref: Optional[str], refs: int = 1) -> None:
+    """Drop references to a stored file. Legacy paths and None are ignored."""
+    if not is_blob_ref(ref):
+        return
+    db.execute(
+        update(StoredBlob)
+        .where(StoredBlob.sha256 == ref[len(BLOB_REF_PREFIX):])
+        .values(ref_count=StoredBlob.ref_count - refs, updated_at=datetime.utcnow())
+    )
+
+
+async def store_upload(db: AsyncSession, stored: StoredUpload, refs: int = 1) -> str:
+    """
+    Move a streamed upload into the blob store and take refs references to
+    it in the caller's transaction. Returns the "sha256:<hex>" reference to
+    save on the record; the temporary upload file is always removed.
+
+    The object is stored before the caller commits; if the transaction rolls
+    back, collect_garbage() removes it once it has no row past the grace period.
+    """
+    storage = get_storage()
+    key = blob_key(stored.sha256)
+    try:
+        uploaded = False
+        if not await run_in_threadpool(storage.exists, key):
+            await run_in_threadpool(storage.put, key, stored.path)
+            uploaded = True
+        created = await db.run_sync(acquire_blob, stored.sha256, stored.size, stored.content_type, refs)
+        if created and not uploaded:
+            # The garbage collector removed it between our check and the insert
+            # (it deletes row and object in one transaction, which our insert waited on)
+            await run_in_threadpool(storage.put, key, stored.path)
+    finally:
+        if os.path.exists(stored.path):
+            os.remove(stored.path)
+    return blob_ref(stored.sha256)
+
+
+@contextmanager
+def open_stored_file(ref: str):
+    """
+    Memory map of a stored file, by blob reference or legacy path. With the
+    s3 backend the blob is downloaded to a temporary file first.
+    """
+    if not is_blob_ref(ref):
+        with open_upload_buffer(ref) as buffer:
+            yield buffer
+        return
+    with get_storage().local_path(blob_key(ref[len(BLOB_REF_PREFIX):])) as path:
+        with open_upload_buffer(path) as buffer:
+            yield buffer
+
+
+def stored_file_exists(ref: Optional[str]) -> bool:
+    if not ref:
+        return False
+    if is_blob_ref(ref):
+        return get_storage().exists(blob_key(ref[len(BLOB_REF_PREFIX):]))
+    return os.path.exists(ref)
+
+
+def collect_garbage(db: Session, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> int:
+    """
+    Delete blobs that have had no references for grace_seconds, and stored
+    objects older than that with no row; returns how many.
+    """
+    storage = get_storage()
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    candidates = db.execute(
+        select(StoredBlob.sha256).where(StoredBlob.ref_count <= 0, StoredBlob.updated_at < cutoff)
+    ).scalars().all()
+
+    removed = 0
+    for sha256 in candidates:
+        # Re-check under the row lock: an upload may have re-referenced it since
+        deleted = db.execute(
+            delete(StoredBlob).where(StoredBlob.sha256 == sha256, StoredBlob.ref_count <= 0)
+        ).rowcount
+        if deleted:
+            storage.delete(blob_key(sha256))
+            removed += 1
+        db.commit()
+
+    return removed + _sweep_orphaned_objects(db, storage, cutoff)
+
+
+def _sweep_orphaned_objects(db: Session, storage: StorageBackend, cutoff: datetime, batch_size: int = 500) -> int:
+    """Delete stored objects written before cutoff that no blobs row accounts for."""
+    removed = 0
+    keys = storage.iter_keys(cutoff)
+    while True:
+        batch = {key.rsplit("/", 1)[-1]: key for _, key in zip(range(batch_size), keys)}
+        if not batch:
+            return removed
+        known = set(db.execute(
+            select(StoredBlob.sha256).where(StoredBlob.sha256.in_(list(batch)))
+        ).scalars())
+        db.commit()
+        for sha256, key in batch.items():
+            if sha256 not in known:
+                storage.delete(key)
+                removed += 1
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal, engine
+    from app.models.base import Base
+
+    parser = argparse.ArgumentParser(description="Blob store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gc = sub.add_parser("gc", help="delete unreferenced blobs")
+    gc.add_argument("--grace", type=int, default=BLOB_GC_GRACE_SECONDS, help="seconds at zero references")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine, tables=[StoredBlob.__table__])
+    db = SessionLocal()
+    try:
+        print(f"✅ {collect_garbage(db, args.grace)} unreferenced blobs removed")
+    finally:
+        db.close()
@@ -0,0 +1,145 @@
+"""
+Structured case events for the live dashboards.
+
+Rather than a "something changed" string that makes every dashboard
+refetch its lists, each change to a case is pushed as a delta:
+
+    {"type": "case_event", "event": "case_accepted", "case_id": 12,
+     "changes": {"status": "submitted", "assigned_doctor_id": 3, ...},
+     "stream": "user:7", "seq": 41, "message": "Your case has been accepted by Dr. ..."}
+
+changes holds the fields the event touched, serialized like CaseOut (for
+the patient) or DoctorCaseOut (for doctors); events that add a case to a
+list carry all of them. The optional message is for a toast.
+
+Events go to the patient's stream (user:<id>, every user whose my-cases
+list shows the case) and, where doctors' lists change, to one doctor's
+stream or to group:doctors for the open pool. seq counts per stream: a
+client that sees a gap, or reconnects and finds a different seq in the
+welcome message, refetches its list once.
+
+  case_created         a new case (upload, symptoms, prediction, lab document)
+  case_submitted       patient sent it to a doctor or the open pool
+  case_accepted        a doctor took it from the pool
+  case_released        the assignment expired unreviewed; back to the open pool
+  case_reviewed        the doctor's review (closed, or waiting for the lab)
+  lab_status_changed   test ordered, booked, scheduled, in progress, completed
+  case_processed       the Celery worker finished the AI analysis
+
+Publishing never fails the request that made the change; errors are logged.
+"""
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+import anyio.from_thread
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.websocket_manager import manager
+from app.core.ws_backplane import group_topic, publish_sync, user_topic
+from app.models.user import User
+from app.schemas.case_schema import CaseOut, DoctorCaseOut
+
+logger = logging.getLogger(__name__)
+
+DOCTORS_GROUP = "doctors"  # every doctor's connections; the open pool is shared
+
+ASSIGNMENT_FIELDS = ("status", "assigned_doctor_id", "assigned_at")
+REVIEW_FIELDS = ("status", "reviewed_by_doctor", "diagnosis", "doctor_notes", "severity_score", "updated_at")
+LAB_FIELDS = ("status", "test_status", "test_ordered", "ordered_test_type", "report_file", "lab_notes",
+              "xray_result", "severity_score")
+ANALYSIS_FIELDS = ("status", "xray_result", "symptom_result", "severity_score", "top_label", "top_prob",
+                   "urgency", "modality", "body_part", "study_date", "imaging_metadata")
+
+
+def case_delta(case, fields: Optional[Iterable[str]] = None, schema=CaseOut) -> dict:
+    """JSON-ready fields of a case as schema serializes them (all of them when fields is None)."""
+    data = schema.model_validate(case, from_attributes=True).model_dump(mode="json")
+    if fields is None:
+        return data
+    return {field: data[field] for field in fields if field in data}
+
+
+def patient_user_ids(db: Session, patient_name: Optional[str]) -> List[int]:
+    """Users whose my-cases list shows a case with this patient_name (by username or full name)."""
+    if not patient_name:
+        return []
+    return db.execute(
+        select(User.id).where(or_(User.username == patient_name, User.full_name == patient_name))
+    ).scalars().all()
+
+
+def _targets(
+    db: Session,
+    case,
+    fields: Optional[Iterable[str]],
+    message: Optional[str],
+    to_doctor: Optional[int],
+    to_pool: bool,
+) -> List[Tuple[str, dict]]:
+    """(stream, changes + message) for each recipient; sync, so it can lazy-load."""
+    targets = []
+    changes = case_delta(case, fields)
+    for user_id in patient_user_ids(db, case.patient_name):
+        targets.append((user_topic(user_id), {"changes": changes, "message": message}))
+    if to_doctor or to_pool:
+        topic = group_topic(DOCTORS_GROUP) if to_pool else user_topic(to_doctor)
+        targets.append((topic, {"changes": case_delta(case, fields, DoctorCaseOut), "message": None}))
+    return targets
+
+
+def _message(event: str, case_id: int, stream: str, seq: int, body: dict) -> dict:
+    message = {"type": "case_event", "event": event, "case_id": case_id,
+               "changes": body["changes"], "stream": stream, "seq": seq}
+    if body["message"]:
+        message["message"] = body["message"]
+    return message
+
+
+async def _publish(event: str, case_id: int, targets: List[Tuple[str, dict]]) -> None:
+    for stream, body in targets:
+        seq = await manager.backplane.next_sequence(stream)
+        await manager.publish(stream, _message(event, case_id, stream, seq, body))
+
+
+async def emit_case_event(
+    db: AsyncSession,
+    event: str,
+    case,
+    fields: Optional[Iterable[str]] = None,
+    message: Optional[str] = None,
+    to_doctor: Optional[int] = None,
+    to_pool: bool = False,
+) -> None:
+    """
+    Push a case change to the patient, and to one doctor (to_doctor) or
+    every doctor (to_pool). Call after the commit.
+    """
+    try:
+        targets = await db.run_sync(_targets, case, fields, message, to_doctor, to_pool)
+        await _publish(event, case.id, targets)
+    except Exception as e:
+        logger.error(f"Case event {event} for case {case.id} not sent: {e!r}")
+
+
+def emit_case_event_sync(
+    db: Session,
+    event: str,
+    case,
+    fields: Optional[Iterable[str]] = None,
+    message: Optional[str] = None,
+    to_doctor: Optional[int] = None,
+    to_pool: bool = False,
+) -> None:
+    """emit_case_event() for sync routes (on the threadpool) and Celery tasks."""
+    try:
+        targets = _targets(db, case, fields, message, to_doctor, to_pool)
+        try:
+            anyio.from_thread.run(_publish, event, case.id, targets)
+        except RuntimeError:
+            # Not called from the API's threadpool (Celery): publish directly
+            for stream, body in targets:
+                publish_sync(stream, lambda seq: _message(event, case.id, stream, seq, body))
+    except Exception as e:
+        logger.error(f"Case event {event} for case {case.id} not sent: {e!r}")
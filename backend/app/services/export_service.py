@@ -0,0 +1,234 @@
+"""
+Streaming bulk export of patient cases as NDJSON, CSV or Parquet.
+
+Rows are read with a server-side cursor (stream_results + yield_per) and
+written out one batch at a time, so memory stays flat regardless of how
+many cases are exported. The AI result blobs are flattened into fixed
+columns (xray_label, xray_prob, symptom_label, ...) so every format has
+the same schema.
+
+Parquet needs the optional pyarrow package.
+
+Used by GET /admin/export and from the command line:
+    python -m app.services.export_service --format csv --since 2026-01-01 > cases.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.patient_case import ArchivedPatientCase, PatientCase
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Plain columns, in export order. Free-text symptoms/notes are included for
+# research use; contact details are not.
+_CASE_COLUMNS = [
+    "id", "patient_name", "status", "created_at", "updated_at",
+    "symptoms", "severity_score", "diagnosis", "doctor_notes", "reviewed_by_doctor",
+    "assigned_doctor_id", "assigned_at", "test_status", "test_ordered",
+    "ordered_test_type", "assigned_lab_tech_id",
+    "top_label", "top_prob", "urgency",
+]
+_AI_COLUMNS = ["xray_label", "xray_prob", "symptom_label", "symptom_prob", "symptom_urgency"]
+
+EXPORT_COLUMNS = _CASE_COLUMNS + _AI_COLUMNS + ["archived"]
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def _prediction(result) -> tuple:
+    """(label, prob) from an AI result, accepting the Gemini and the old format."""
+    if not isinstance(result, dict):
+        return None, None
+    label = result.get("top_label") or result.get("label")
+    prob = result.get("top_prob")
+    if prob is None:
+        prob = result.get("prob")
+    try:
+        prob = float(prob) if prob is not None else None
+    except (TypeError, ValueError):
+        prob = None
+    return label, prob
+
+
+def flatten_case(row, archived: bool) -> dict:
+    """One export record: plain columns plus the flattened AI result fields."""
+    record = {name: getattr(row, name) for name in _CASE_COLUMNS}
+    record["xray_label"], record["xray_prob"] = _prediction(row.xray_result)
+    record["symptom_label"], record["symptom_prob"] = _prediction(row.symptom_result)
+    symptom_result = row.symptom_result if isinstance(row.symptom_result, dict) else {}
+    record["symptom_urgency"] = symptom_result.get("urgency")
+    record["archived"] = archived
+    return record
+
+
+def iter_case_records(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[str] = None,
+    include_archived: bool = True,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[list[dict]]:
+    """Yield batches of flattened case records, oldest first, streaming from the database."""
+    models = [(PatientCase, False)]
+    if include_archived:
+        models.append((ArchivedPatientCase, True))
+
+    for model, archived in models:
+        stmt = select(*(getattr(model, name) for name in _CASE_COLUMNS + ["xray_result", "symptom_result"]))
+        if since:
+            stmt = stmt.where(model.created_at >= since)
+        if until:
+            stmt = stmt.where(model.created_at < until)
+        if status:
+            stmt = stmt.where(model.status == status)
+        stmt = stmt.order_by(model.created_at, model.id)
+
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+        for partition in result.partitions():
+            yield [flatten_case(row, archived) for row in partition]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def iter_ndjson(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(record, default=_json_default) + "\n" for record in batch).encode("utf-8")
+
+
+def iter_csv(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("id", pa.int64()), ("patient_name", pa.string()), ("status", pa.string()),
+        ("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us")),
+        ("symptoms", pa.string()), ("severity_score", pa.float64()),
+        ("diagnosis", pa.string()), ("doctor_notes", pa.string()),
+        ("reviewed_by_doctor", pa.bool_()), ("assigned_doctor_id", pa.int64()),
+        ("assigned_at", pa.timestamp("us")), ("test_status", pa.string()),
+        ("test_ordered", pa.bool_()), ("ordered_test_type", pa.string()),
+        ("assigned_lab_tech_id", pa.int64()),
+        ("top_label", pa.string()), ("top_prob", pa.float64()), ("urgency", pa.string()),
+        ("xray_label", pa.string()), ("xray_prob", pa.float64()),
+        ("symptom_label", pa.string()), ("symptom_prob", pa.float64()),
+        ("symptom_urgency", pa.string()), ("archived", pa.bool_()),
+    ])
+
+
+def iter_parquet(batches: Iterable[list[dict]]) -> Iterator[bytes]:
+    """One Parquet row group per batch, flushed to the client as soon as it is written."""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Footer
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+WRITERS = {"ndjson": iter_ndjson, "csv": iter_csv, "parquet": iter_parquet}
+
+
+def stream_export(db: Session, fmt: str, **filters) -> Iterator[bytes]:
+    """Encoded export chunks for the given format and iter_case_records filters."""
+    return WRITERS[fmt](iter_case_records(db, **filters))
+
+
+if __name__ == "__main__":
+    from app.core.database import ReplicaSessionLocal
+
+    parser = argparse.ArgumentParser(description="Export patient cases")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--status")
+    parser.add_argument("--no-archived", action="store_true", help="skip patient_cases_archive")
+    parser.add_argument("--out", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not parquet_available():
+        print("Parquet export requires pyarrow (pip install pyarrow)", file=sys.stderr)
+        sys.exit(1)
+
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    db = ReplicaSessionLocal()
+    try:
+        for chunk in stream_export(
+            db, args.format, since=args.since, until=args.until,
+            status=args.status, include_archived=not args.no_archived
+        ):
+            out.write(chunk)
+    finally:
+        db.close()
+        if args.out:
+            out.close()
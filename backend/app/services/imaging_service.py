@@ -0,0 +1,32 @@
+"""
+Imaging columns on patient cases (modality, body part, study date and the
+rest of the DICOM metadata), filled from DICOM uploads.
+
+The columns are nullable and only ever written by new uploads, so there is
+nothing to backfill: ensure_imaging_schema() just adds them to existing
+live and archive tables. It runs at API startup and is idempotent.
+"""
+from sqlalchemy import inspect, text
+
+from app.models.patient_case import ArchivedPatientCase, PatientCase
+
+_IMAGING_COLUMNS = {
+    "modality": "VARCHAR",
+    "body_part": "VARCHAR",
+    "study_date": "TIMESTAMP",
+    "imaging_metadata": "JSON",
+}
+
+
+def ensure_imaging_schema(engine) -> None:
+    """Add the imaging columns to patient_cases and its archive if they are missing."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in (PatientCase.__tablename__, ArchivedPatientCase.__tablename__):
+            if not inspector.has_table(table):
+                continue  # create_all makes it with the columns
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            for name, sql_type in _IMAGING_COLUMNS.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type}"))
+                    print(f"✅ Added column {table}.{name}")
@@ -0,0 +1,103 @@
+"""
+Downscaled derivatives of uploaded images for dashboards and case lists.
+
+Each image blob gets a thumbnail and a preview JPEG, generated once after
+upload (a background task that decodes on the image process pool) and cached on disk under MEDIA_CACHE_DIR,
+keyed by content hash, so duplicate uploads share them. Anything missing
+from the cache (older uploads, a fresh API container) is generated on
+first request. DICOM files are windowed to 8 bits first (app.utils.dicom).
+Non-image uploads such as PDF reports have no derivatives.
+"""
+import logging
+import os
+from typing import Optional
+
+import PIL.Image
+
+from app.config import UPLOAD_DIR
+from app.services.blob_store import BLOB_REF_PREFIX, get_storage, blob_key, is_blob_ref
+from app.utils.file_handler import open_upload_buffer
+from app.utils.dicom import is_dicom, read_dicom
+from app.utils.image_pool import IMAGE_MAX_PIXELS, IMAGE_MAX_SIDE, run_in_image_pool, to_display_mode
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(UPLOAD_DIR, "derived"))
+
+# Longest side in pixels
+VARIANTS = {"thumb": 256, "preview": 1024}
+JPEG_QUALITY = 82
+
+
+def derivative_path(sha256: str, variant: str) -> str:
+    return os.path.join(MEDIA_CACHE_DIR, sha256[:2], f"{sha256}-{variant}.jpg")
+
+
+def _render(image: PIL.Image.Image, variant: str, out_path: str) -> PIL.Image.Image:
+    size = VARIANTS[variant]
+    derived = to_display_mode(image)
+    derived = derived.copy() if derived is image else derived
+    derived.thumbnail((size, size), PIL.Image.Resampling.LANCZOS)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    partial = f"{out_path}.{os.getpid()}.part"
+    derived.save(partial, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    os.replace(partial, out_path)
+    return derived
+
+
+def _render_missing(image: PIL.Image.Image, sha256: str, missing) -> None:
+    # Largest first, so each smaller variant is resampled from the previous one
+    source = image
+    for variant in sorted(missing, key=VARIANTS.get, reverse=True):
+        source = _render(source, variant, derivative_path(sha256, variant))
+
+
+def generate_derivatives(sha256: str, source_path: str, variants=tuple(VARIANTS)) -> bool:
+    """Render the missing variants of one image; False when it isn't a decodable image."""
+    missing = [variant for variant in variants if not os.path.exists(derivative_path(sha256, variant))]
+    if not missing:
+        return True
+    try:
+        if is_dicom(source_path):
+            image, _ = read_dicom(
+                source_path, VARIANTS["preview"], max_pixels=IMAGE_MAX_PIXELS, max_edge=IMAGE_MAX_SIDE
+            )
+            _render_missing(image, sha256, missing)
+            return True
+        with open_upload_buffer(source_path) as buffer, PIL.Image.open(buffer) as image:
+            # JPEG can decode at a reduced scale, far cheaper than full size
+            image.draft(image.mode, (VARIANTS["preview"], VARIANTS["preview"]))
+            image.load()
+            _render_missing(image, sha256, missing)
+        return True
+    except (PIL.UnidentifiedImageError, PIL.Image.DecompressionBombError, OSError, ValueError) as e:
+        logger.info("No derivatives for %s: %s", sha256, e)
+        return False
+
+
+def _generate_for_blob(sha256: str) -> None:
+    # Runs in an image pool worker
+    with get_storage().local_path(blob_key(sha256)) as path:
+        generate_derivatives(sha256, path)
+
+
+async def generate_derivatives_for_ref(ref: Optional[str]) -> None:
+    """Background task run after an upload is stored; decodes on the image pool, not in the API."""
+    if not is_blob_ref(ref):
+        return
+    sha256 = ref[len(BLOB_REF_PREFIX):]
+    try:
+        await run_in_image_pool(_generate_for_blob, sha256)
+    except Exception as e:
+        logger.error("Generating derivatives for %s failed: %s", sha256, e)
+
+
+def ensure_derivative(sha256: str, variant: str) -> Optional[str]:
+    """Cached derivative path, rendering it first if needed; None for non-images."""
+    path = derivative_path(sha256, variant)
+    if os.path.exists(path):
+        return path
+    with get_storage().local_path(blob_key(sha256)) as source:
+        if not generate_derivatives(sha256, source):
+            return None
+    return path
@@ -0,0 +1,106 @@
+"""
+Backfill the denormalized prediction columns (top_label, top_prob, urgency)
+on patient_cases from the xray_result / symptom_result JSON.
+
+New and updated cases are kept in sync by PatientCase's validator; this job
+covers rows written before the columns existed, walking the table in id
+order in small batches. The columns and indexes themselves are added at
+startup (ensure_prediction_schema, called from app.main).
+
+Usage:
+    python -m app.services.prediction_backfill [--batch-size 500]
+"""
+import argparse
+
+from sqlalchemy import inspect, text, update, bindparam
+from sqlalchemy.orm import Session
+
+from app.models.patient_case import PatientCase, extract_prediction_fields
+
+_NEW_COLUMNS = {
+    "top_label": "VARCHAR",
+    "top_prob": "FLOAT",
+    "urgency": "VARCHAR",
+}
+
+
+def ensure_prediction_schema(engine) -> None:
+    """Add the prediction columns and every PatientCase index if they are missing."""
+    inspector = inspect(engine)
+    if not inspector.has_table(PatientCase.__tablename__):
+        return  # create_all makes it with the columns and indexes
+    existing = {col["name"] for col in inspector.get_columns(PatientCase.__tablename__)}
+    with engine.begin() as conn:
+        for name, sql_type in _NEW_COLUMNS.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {PatientCase.__tablename__} ADD COLUMN {name} {sql_type}"))
+                print(f"✅ Added column patient_cases.{name}")
+
+    for index in PatientCase.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def backfill_predictions(db: Session, batch_size: int = 500) -> int:
+    """Populate prediction columns for rows that have AI results but no top_label yet."""
+    stmt = (
+        update(PatientCase.__table__)
+        .where(PatientCase.__table__.c.id == bindparam("case_id"))
+        .values(
+            top_label=bindparam("top_label"),
+            top_prob=bindparam("top_prob"),
+            urgency=bindparam("urgency"),
+            # Not a user-visible change: keep updated_at (and list ordering) as is
+            updated_at=PatientCase.__table__.c.updated_at,
+        )
+    )
+
+    last_id = 0
+    updated = 0
+    while True:
+        rows = (
+            db.query(PatientCase.id, PatientCase.xray_result, PatientCase.symptom_result)
+            .filter(
+                PatientCase.id > last_id,
+                PatientCase.top_label.is_(None),
+                (PatientCase.xray_result.isnot(None)) | (PatientCase.symptom_result.isnot(None))
+            )
+            .order_by(PatientCase.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+
+        params = []
+        for case_id, xray_result, symptom_result in rows:
+            top_label, top_prob, urgency = extract_prediction_fields(xray_result, symptom_result)
+            params.append({
+                "case_id": case_id,
+                "top_label": top_label,
+                "top_prob": top_prob,
+                "urgency": urgency,
+            })
+
+        db.connection().execute(stmt, params)
+        db.commit()
+
+        updated += len(rows)
+        last_id = rows[-1].id
+        print(f"… backfilled {updated} cases (last id {last_id})")
+
+    return updated
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Backfill denormalized prediction columns")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        total = backfill_predictions(db, args.batch_size)
+        print(f"✅ Prediction backfill complete: {total} cases updated")
+    finally:
+        db.close()
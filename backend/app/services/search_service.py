@@ -0,0 +1,201 @@
+"""
+Indexed patient search for the lab dashboard.
+
+SQLite uses an FTS5 table (users_fts) kept in sync with users by triggers;
+PostgreSQL uses pg_trgm GIN indexes on username / full_name, which the
+database maintains itself. Either way, signups and profile updates are
+searchable as soon as they commit, with no application-side bookkeeping.
+
+Other databases fall back to a plain ILIKE scan.
+
+Create (or rebuild) the index with:
+    python -m app.services.search_service rebuild
+"""
+import re
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# bm25 ranking is applied to at most this many matching patients. Very broad prefixes
+# ("jo") can match tens of thousands of users and ranking them all costs
+# tens of ms; by the time the term is specific enough for ranking to matter,
+# the match set is below the cap and the order is exact.
+SEARCH_RANK_CANDIDATES = 1000
+
+_SQLITE_SCHEMA = [
+    # External-content table: the text lives in users, the FTS table only holds the index.
+    # prefix='2 3' adds prefix indexes so short "jo*" queries don't walk the whole term list.
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        username, full_name,
+        content='users', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, username, full_name)
+        VALUES (new.id, new.username, coalesce(new.full_name, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, username, full_name)
+        VALUES ('delete', old.id, old.username, coalesce(old.full_name, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, full_name ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, username, full_name)
+        VALUES ('delete', old.id, old.username, coalesce(old.full_name, ''));
+        INSERT INTO users_fts(rowid, username, full_name)
+        VALUES (new.id, new.username, coalesce(new.full_name, ''));
+    END
+    """,
+]
+
+_POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (lower(username) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_full_name_trgm ON users USING gin (lower(full_name) gin_trgm_ops)",
+]
+
+
+def ensure_search_index(engine, rebuild: bool = False) -> None:
+    """Create the search index for the engine's dialect if it is missing."""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            created = not conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")
+            ).first()
+            for statement in _SQLITE_SCHEMA:
+                conn.execute(text(statement))
+            if created or rebuild:
+                # Index the users that existed before the triggers did
+                conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+        elif dialect == "postgresql":
+            for statement in _POSTGRES_SCHEMA:
+                conn.execute(text(statement))
+
+
+def _words(term: str) -> list[str]:
+    """Lowercased search words, split the same way on every backend."""
+    return re.findall(r"[\w.\-]+", term.lower())
+
+
+def _fts_query(term: str):
+    """
+    Turn free text into an FTS5 query: every word must match as a prefix,
+    e.g. 'john sm' -> '"john"* "sm"*'. Quoting keeps user input from being
+    parsed as FTS syntax; usernames like 'john_sm' become a phrase prefix.
+    """
+    words = _words(term)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _words_clause(words: list[str]) -> tuple[str, dict]:
+    """SQL requiring every word in username or full_name, with its bind params."""
+    clauses, params = [], {}
+    for i, word in enumerate(words):
+        clauses.append(f"(lower(username) LIKE :word{i} OR lower(full_name) LIKE :word{i})")
+        params[f"word{i}"] = "%" + _like_escape(word) + "%"
+    return " AND ".join(clauses), params
+
+
+def search_patients(db: Session, term: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+    """
+    Best-matching patients for a search box, as plain dicts
+    (id, username, full_name, email), at most `limit` of them.
+    """
+    term = (term or "").strip()
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    if not term:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        query = _fts_query(term)
+        if not query:
+            return []
+        # Filter by role before the candidate cap, so other roles can't crowd patients out
+        rows = db.execute(
+            text("""
+                SELECT id, username, full_name, email
+                FROM (
+                    SELECT u.id, u.username, u.full_name, u.email, users_fts.rank AS rank
+                    FROM users_fts
+                    JOIN users u ON u.id = users_fts.rowid
+                    WHERE users_fts MATCH :query AND u.role = 'patient'
+                    LIMIT :candidates
+                ) AS matches
+                ORDER BY rank
+                LIMIT :limit
+            """),
+            {"query": query, "candidates": SEARCH_RANK_CANDIDATES, "limit": limit},
+        )
+    elif dialect == "postgresql":
+        # Every word must match, as on SQLite; prefix matches of the whole
+        # term rank first, then trigram similarity for fuzzy hits
+        words = _words(term)
+        if not words:
+            return []
+        match, params = _words_clause(words)
+        rows = db.execute(
+            text(f"""
+                SELECT id, username, full_name, email
+                FROM users
+                WHERE role = 'patient' AND {match}
+                ORDER BY
+                    (lower(username) LIKE :prefix OR lower(full_name) LIKE :prefix) DESC,
+                    greatest(similarity(lower(username), :term),
+                             similarity(lower(coalesce(full_name, '')), :term)) DESC,
+                    id
+                LIMIT :limit
+            """),
+            {
+                **params,
+                "term": term.lower(),
+                "prefix": _like_escape(term.lower()) + "%",
+                "limit": limit,
+            },
+        )
+    else:
+        words = _words(term)
+        if not words:
+            return []
+        match, params = _words_clause(words)
+        rows = db.execute(
+            text(f"""
+                SELECT id, username, full_name, email
+                FROM users
+                WHERE role = 'patient' AND {match}
+                ORDER BY username
+                LIMIT :limit
+            """),
+            {**params, "limit": limit},
+        )
+
+    return [dict(row._mapping) for row in rows]
+
+
+def _like_escape(value: str) -> str:
+    # Backslash is PostgreSQL's default LIKE escape character
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+if __name__ == "__main__":
+    from app.core.database import engine
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python -m app.services.search_service rebuild")
+        sys.exit(1)
+
+    ensure_search_index(engine, rebuild=True)
+    print("✅ Patient search index ready")
@@ -0,0 +1,255 @@
+"""
+Incrementally maintained case statistics for the admin dashboard.
+
+Every flush that inserts, updates or deletes a PatientCase applies the
+matching +/- deltas to case_stats_rollup inside the same transaction, so
+/admin/stats reads a handful of counter rows instead of scanning cases.
+Moving cases to the archive table (archive_service) leaves the counters as is.
+
+Importing this module registers the session listeners; anything that writes
+cases (API, Celery worker, scripts) must import it.
+
+The API seeds the counters at startup while the rollup table is empty
+(ensure_stats_rollup). Rebuild them from scratch with:
+    python -m app.services.stats_service rebuild
+"""
+from collections import defaultdict
+import sys
+
+from sqlalchemy import event, inspect, update, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.case_stats import CaseStatsRollup
+from app.models.patient_case import ArchivedPatientCase, PatientCase
+
+TOTAL = ("total", "all")
+_TRACKED_ATTRS = ("status", "xray_result", "severity_score")
+
+
+def disease_bucket(xray_result):
+    """Map an X-ray prediction to the admin dashboard disease bucket."""
+    if not xray_result:
+        return None
+    label = (xray_result.get("top_label") or xray_result.get("label") or "").lower()
+    if "pneumonia" in label:
+        return "pneumonia"
+    if "normal" in label:
+        return "normal"
+    return "other"
+
+
+def _contribution(status, xray_result, severity_score, sign):
+    """Counter deltas for one case: {(dimension, bucket): [count, sev_sum, sev_count]}."""
+    deltas = {}
+    sev_sum = (severity_score or 0.0) * sign
+    sev_count = sign if severity_score is not None else 0
+
+    deltas[TOTAL] = [sign, sev_sum, sev_count]
+    deltas[("status", status or "none")] = [sign, 0.0, 0]
+    bucket = disease_bucket(xray_result)
+    if bucket:
+        deltas[("disease", bucket)] = [sign, 0.0, 0]
+    return deltas
+
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+def _merge(into, deltas):
+    for key, (count, sev_sum, sev_count) in deltas.items():
+        acc = into[key]
+        acc[0] += count
+        acc[1] += sev_sum
+        acc[2] += sev_count
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_case_deltas(session, flush_context, instances):
+    pending = session.info.setdefault("case_stats_deltas", defaultdict(lambda: [0, 0.0, 0]))
+
+    for obj in session.new:
+        if isinstance(obj, PatientCase):
+            # Column defaults are not applied yet: status "new", severity 0.0
+            severity = obj.severity_score if obj.severity_score is not None else 0.0
+            _merge(pending, _contribution(obj.status or "new", obj.xray_result, severity, 1))
+
+    for obj in session.deleted:
+        if isinstance(obj, PatientCase):
+            state = inspect(obj)
+            _merge(pending, _contribution(
+                *(_old_value(state, attr) if state.attrs[attr].history.has_changes() else getattr(obj, attr)
+                  for attr in _TRACKED_ATTRS), -1
+            ))
+
+    for obj in session.dirty:
+        if not isinstance(obj, PatientCase):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[attr].history.has_changes() for attr in _TRACKED_ATTRS):
+            continue
+        _merge(pending, _contribution(*(_old_value(state, attr) for attr in _TRACKED_ATTRS), -1))
+        _merge(pending, _contribution(obj.status, obj.xray_result, obj.severity_score, 1))
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_case_deltas(session, flush_context):
+    pending = session.info.pop("case_stats_deltas", None)
+    if not pending:
+        return
+    connection = session.connection()
+    for (dimension, bucket), (count, sev_sum, sev_count) in pending.items():
+        if not (count or sev_sum or sev_count):
+            continue
+        apply_delta(connection, dimension, bucket, count, sev_sum, sev_count)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_case_deltas(session, previous_transaction):
+    session.info.pop("case_stats_deltas", None)
+
+
+def apply_delta(connection, dimension, bucket, count, sev_sum, sev_count):
+    """Atomically add a delta to one rollup row, creating it if missing."""
+    table = CaseStatsRollup.__table__
+    values = dict(
+        dimension=dimension, bucket=bucket,
+        case_count=count, severity_sum=sev_sum, severity_count=sev_count
+    )
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["dimension", "bucket"],
+            set_={
+                "case_count": table.c.case_count + stmt.excluded.case_count,
+                "severity_sum": table.c.severity_sum + stmt.excluded.severity_sum,
+                "severity_count": table.c.severity_count + stmt.excluded.severity_count,
+            },
+        )
+        connection.execute(stmt)
+        return
+
+    result = connection.execute(
+        update(table)
+        .where(table.c.dimension == dimension, table.c.bucket == bucket)
+        .values(
+            case_count=table.c.case_count + count,
+            severity_sum=table.c.severity_sum + sev_sum,
+            severity_count=table.c.severity_count + sev_count,
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(**values))
+
+
+# Make assignments load the previous value so deltas can subtract it even
+# when the attribute was expired (e.g. after a commit) before being set.
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+for _attr in _TRACKED_ATTRS:
+    event.listen(getattr(PatientCase, _attr), "set", _load_old_value, active_history=True)
+
+
+def read_stats(db: Session) -> dict:
+    """Admin dashboard statistics straight from the rollup counters."""
+    rows = db.query(CaseStatsRollup).all()
+
+    total_cases = 0
+    average_severity = 0.0
+    status_breakdown = {}
+    disease_counts = {"pneumonia": 0, "normal": 0, "other": 0}
+
+    for row in rows:
+        if (row.dimension, row.bucket) == TOTAL:
+            total_cases = row.case_count
+            if row.severity_count:
+                average_severity = row.severity_sum / row.severity_count
+        elif row.dimension == "status" and row.case_count:
+            status_breakdown[row.bucket] = row.case_count
+        elif row.dimension == "disease":
+            disease_counts[row.bucket] = row.case_count
+
+    return {
+        "total_cases": total_cases,
+        "status_breakdown": status_breakdown,
+        "disease_distribution": disease_counts,
+        "average_severity": round(average_severity, 2)
+    }
+
+
+def rebuild_rollup(db: Session) -> None:
+    """
+    Recompute every counter from patient_cases and patient_cases_archive in one transaction.
+    Run it after manual SQL edits.
+    """
+    db.execute(delete(CaseStatsRollup))
+    connection = db.connection()
+
+    total, sev_sum, sev_count = 0, 0.0, 0
+    status_counts = defaultdict(int)
+    disease_counts = defaultdict(int)
+
+    # Archived cases are still cases: the dashboard totals include them
+    for model in (PatientCase, ArchivedPatientCase):
+        count, model_sev_sum, model_sev_count = db.query(
+            func.count(model.id),
+            func.coalesce(func.sum(model.severity_score), 0.0),
+            func.count(model.severity_score),
+        ).one()
+        total += count
+        sev_sum += model_sev_sum
+        sev_count += model_sev_count
+
+        for status, count in db.query(model.status, func.count(model.id)).group_by(model.status):
+            status_counts[status or "none"] += count
+
+        xray_rows = (
+            db.query(model.xray_result)
+            .filter(model.xray_result.isnot(None))
+            .yield_per(1000)
+        )
+        for (xray_result,) in xray_rows:
+            bucket = disease_bucket(xray_result)
+            if bucket:
+                disease_counts[bucket] += 1
+
+    apply_delta(connection, *TOTAL, total, sev_sum, sev_count)
+    for status, count in status_counts.items():
+        apply_delta(connection, "status", status, count, 0.0, 0)
+    for bucket, count in disease_counts.items():
+        apply_delta(connection, "disease", bucket, count, 0.0, 0)
+
+    db.commit()
+
+
+def ensure_stats_rollup(engine) -> None:
+    """Seed the counters from the cases when the rollup table is new or empty."""
+    with Session(bind=engine) as db:
+        if db.query(CaseStatsRollup.id).first() is None:
+            rebuild_rollup(db)
+
+
+if __name__ == "__main__":
+    from app.core.database import SessionLocal, engine
+    from app.models.base import Base
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("Usage: python -m app.services.stats_service rebuild")
+        sys.exit(1)
+
+    Base.metadata.create_all(bind=engine, tables=[CaseStatsRollup.__table__, ArchivedPatientCase.__table__])
+    db = SessionLocal()
+    try:
+        rebuild_rollup(db)
+        print("✅ Case statistics rollup rebuilt")
+    finally:
+        db.close()
@@ -0,0 +1,381 @@
+"""
+Resumable chunked uploads for large imaging files on unreliable connections.
+
+Protocol (routes in app.api.uploads):
+
+  POST   /uploads                      create a session: purpose, filename, size[, sha256]
+  PUT    /uploads/{id}                 one chunk as the raw body, at the Upload-Offset header;
+                                       optional Upload-Checksum: sha256 <hex> of the chunk
+  GET    /uploads/{id}                 progress: offset and rolling hash (also on HEAD)
+  POST   /uploads/{id}/finalize        hand the assembled file to case creation + AI
+  DELETE /uploads/{id}                 abort
+
+Each chunk is written straight into the session's part file at its offset
+and only acknowledged (offset advanced) once it is complete and, if the
+client sent one, its checksum matches. An interrupted chunk is truncated
+away; the client asks for the offset and resends from there.
+
+The rolling hash chains the chunk digests, chain = sha256(chain || sha256(chunk)),
+starting from 64 zeros, so a resuming client can confirm the server holds
+exactly the prefix it sent. Finalize computes the content SHA-256 for the
+blob store in one sequential read, and checks it against the declared one.
+
+Only one chunk per session is written at a time: a chunk claims the session
+row with a short lease (locked_until), which also works across API workers.
+Each claim has its own lock_token. The lease is renewed while the chunk
+streams, and the acknowledging UPDATE and the truncate of a failed chunk
+only happen while the token still holds it, so a request stalled past its
+lease cannot touch bytes another request has since had acknowledged.
+Finalize takes the same kind of lease, longer (FINALIZE_LEASE_SECONDS): if
+the process dies mid-finalize, the session does not stay "finalizing"
+forever; once the lease has lapsed, finalize can be retried and DELETE
+aborts it.
+Sessions expire after UPLOAD_SESSION_TTL_SECONDS; expire_upload_sessions()
+(Celery beat) removes them and their part files.
+"""
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+import aiofiles
+from fastapi import HTTPException
+from sqlalchemy import delete, inspect, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import UPLOAD_DIR
+from app.models.upload_session import UploadSession
+from app.utils.file_handler import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, StoredUpload
+
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(UPLOAD_DIR, "sessions"))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+# Chunk size suggested to clients, and the most one PUT may carry
+UPLOAD_SESSION_CHUNK_BYTES = int(os.getenv("UPLOAD_SESSION_CHUNK_BYTES", str(4 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(16 * 1024 * 1024)))
+# How long a chunk may hold the session before another PUT can take over,
+# and how often a streaming chunk renews that lease
+CHUNK_LEASE_SECONDS = 120
+CHUNK_LEASE_RENEW_SECONDS = 30
+# How long a finalize (hashing, case creation) may take before another request can retry it
+FINALIZE_LEASE_SECONDS = 600
+
+EMPTY_CHAIN = "0" * 64
+
+
+def chain_hash(previous: str, chunk_digest: bytes) -> str:
+    return hashlib.sha256(bytes.fromhex(previous) + chunk_digest).hexdigest()
+
+
+def part_path(session_id: str) -> str:
+    return os.path.join(UPLOAD_SESSION_DIR, f"{session_id}.part")
+
+
+def ensure_upload_session_schema(engine) -> None:
+    """Add lock_token to an upload_sessions table created before it existed."""
+    inspector = inspect(engine)
+    if not inspector.has_table(UploadSession.__tablename__):
+        return  # create_all makes it with the column
+    existing = {col["name"] for col in inspector.get_columns(UploadSession.__tablename__)}
+    if "lock_token" not in existing:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {UploadSession.__tablename__} ADD COLUMN lock_token VARCHAR(32)"))
+        print(f"✅ Added column {UploadSession.__tablename__}.lock_token")
+
+
+def _parse_checksum(header: Optional[str]) -> Optional[str]:
+    """'sha256 <hex>' -> hex digest; None when absent."""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(" ")
+    if algorithm.lower() != "sha256" or len(value.strip()) != 64:
+        raise HTTPException(status_code=400, detail="Upload-Checksum must be 'sha256 <hex digest>'")
+    return value.strip().lower()
+
+
+async def create_session(
+    db: AsyncSession,
+    user_id: int,
+    purpose: str,
+    size: int,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    sha256: Optional[str] = None,
+) -> UploadSession:
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"File too large (limit {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"
+        )
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        purpose=purpose,
+        filename=filename,
+        content_type=content_type,
+        size=size,
+        offset=0,
+        chain_hash=EMPTY_CHAIN,
+        sha256=sha256.lower() if sha256 else None,
+        status="open",
+        expires_at=datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS),
+    )
+    os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+    async with aiofiles.open(part_path(session.id), "wb"):
+        pass
+    db.add(session)
+    await db.commit()
+    return session
+
+
+async def get_session(db: AsyncSession, session_id: str, user_id: int) -> UploadSession:
+    session = (await db.execute(
+        select(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.user_id == user_id)
+        .execution_options(populate_existing=True)  # after our own UPDATEs
+    )).scalars().first()
+    if not session or session.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+async def _renew_lease(db: AsyncSession, session_id: str, token: str) -> bool:
+    """Extend this claim's lease; False if another request has taken the session over."""
+    renewed = (await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.lock_token == token)
+        .values(locked_until=datetime.utcnow() + timedelta(seconds=CHUNK_LEASE_SECONDS))
+    )).rowcount
+    await db.commit()
+    return bool(renewed)
+
+
+async def write_chunk(
+    db: AsyncSession, session_id: str, user_id: int, offset: int, chunks, checksum: Optional[str] = None
+) -> UploadSession:
+    """
+    Append one chunk (an async iterator of bytes, e.g. request.stream())
+    at offset. Returns the session with its new offset and chain hash.
+    """
+    expected_digest = _parse_checksum(checksum)
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    claimed = (await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == user_id,
+            UploadSession.status == "open",
+            UploadSession.offset == offset,
+            UploadSession.expires_at > now,
+            or_(UploadSession.locked_until.is_(None), UploadSession.locked_until < now),
+        )
+        .values(locked_until=now + timedelta(seconds=CHUNK_LEASE_SECONDS), lock_token=token)
+    )).rowcount
+    await db.commit()
+    if not claimed:
+        session = await get_session(db, session_id, user_id)
+        if session.status != "open":
+            raise HTTPException(status_code=409, detail=f"Upload is {session.status}")
+        if session.offset != offset:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload offset mismatch: server has {session.offset} bytes",
+                headers={"Upload-Offset": str(session.offset)},
+            )
+        raise HTTPException(status_code=409, detail="Another chunk is being written to this upload")
+
+    session = await get_session(db, session_id, user_id)
+    limit = min(session.size - offset, UPLOAD_MAX_CHUNK_BYTES)
+    digest = hashlib.sha256()
+    written = 0
+    acknowledged = False
+    renewed_at = time.monotonic()
+    try:
+        if limit == 0:
+            raise HTTPException(status_code=409, detail="Upload is complete; finalize it")
+        # Unbuffered: nothing of this chunk can reach the file after the lease is lost
+        async with aiofiles.open(part_path(session_id), "r+b", buffering=0) as out:
+            await out.seek(offset)
+            async for data in chunks:
+                written += len(data)
+                if written > limit:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Chunk too large: at most {limit} bytes fit at offset {offset}",
+                    )
+                # Renewed well inside the lease, so after a stall longer than
+                # the lease this check runs before anything is written
+                if time.monotonic() - renewed_at >= CHUNK_LEASE_RENEW_SECONDS:
+                    if not await _renew_lease(db, session_id, token):
+                        raise HTTPException(status_code=409, detail="Chunk lease expired; resend it")
+                    renewed_at = time.monotonic()
+                digest.update(data)
+                await out.write(data)
+        if expected_digest and digest.hexdigest() != expected_digest:
+            raise HTTPException(status_code=422, detail="Chunk checksum mismatch; resend it")
+
+        acknowledged = bool((await db.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == session_id,
+                UploadSession.lock_token == token,
+                UploadSession.offset == offset,
+            )
+            .values(
+                offset=offset + written,
+                chain_hash=chain_hash(session.chain_hash, digest.digest()),
+                locked_until=None,
+                lock_token=None,
+            )
+        )).rowcount)
+        await db.commit()
+        if not acknowledged:
+            raise HTTPException(status_code=409, detail="Chunk lease expired; resend it")
+        return await get_session(db, session_id, user_id)
+    finally:
+        if not acknowledged:
+            await db.rollback()
+            # Only while this claim still holds the session: the renewal
+            # covers the truncate, then the lease is released
+            if await _renew_lease(db, session_id, token):
+                await run_in_threadpool(os.truncate, part_path(session_id), offset)
+                await db.execute(
+                    update(UploadSession)
+                    .where(UploadSession.id == session_id, UploadSession.lock_token == token)
+                    .values(locked_until=None, lock_token=None)
+                )
+                await db.commit()
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _finalize_in_progress(now: datetime):
+    """SQL condition: a finalize holds the session and its lease has not lapsed."""
+    return (
+        (UploadSession.status == "finalizing")
+        & UploadSession.locked_until.isnot(None)
+        & (UploadSession.locked_until >= now)
+    )
+
+
+async def begin_finalize(db: AsyncSession, session_id: str, user_id: int) -> tuple[StoredUpload, str]:
+    """
+    Mark a fully received session as finalizing under a lease and return
+    its assembled file as a StoredUpload for the usual case-creation path,
+    with the lock_token that complete_finalize / reopen_after_failure take.
+    A finalize whose lease lapsed (the process died) is taken over.
+    """
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    claimed = (await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == user_id,
+            UploadSession.offset == UploadSession.size,
+            or_(UploadSession.status == "open", UploadSession.status == "finalizing"),
+            or_(UploadSession.locked_until.is_(None), UploadSession.locked_until < now),
+        )
+        .values(status="finalizing", locked_until=now + timedelta(seconds=FINALIZE_LEASE_SECONDS), lock_token=token)
+    )).rowcount
+    await db.commit()
+    session = await get_session(db, session_id, user_id)
+    if not claimed:
+        if session.status == "open" and session.offset != session.size:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {session.offset} of {session.size} bytes received",
+                headers={"Upload-Offset": str(session.offset)},
+            )
+        if session.status == "open":
+            raise HTTPException(status_code=409, detail="Another chunk is being written to this upload")
+        raise HTTPException(status_code=409, detail=f"Upload is {session.status}")
+
+    path = part_path(session_id)
+    if not os.path.exists(path):
+        # An earlier finalize died after handing the file over; nothing left to retry
+        await abort_session(db, session_id)
+        raise HTTPException(status_code=410, detail="Upload was interrupted while finalizing; upload it again")
+    sha256 = await run_in_threadpool(_sha256_file, path)
+    if session.sha256 and sha256 != session.sha256:
+        await abort_session(db, session_id)
+        raise HTTPException(status_code=422, detail="Assembled file does not match the declared sha256")
+    stored = StoredUpload(path=path, size=session.size, sha256=sha256, content_type=session.content_type)
+    return stored, token
+
+
+async def complete_finalize(db: AsyncSession, session_id: str, case_id: int) -> None:
+    await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session_id)
+        .values(status="completed", case_id=case_id, locked_until=None, lock_token=None)
+    )
+    await db.commit()
+
+
+async def reopen_after_failure(db: AsyncSession, session_id: str, token: str) -> None:
+    """
+    Case creation failed: abort if the file was consumed or rejected, else
+    allow a retry. Does nothing if another finalize has taken the session over.
+    """
+    await db.rollback()
+    owned = (UploadSession.id == session_id) & (UploadSession.lock_token == token)
+    if os.path.exists(part_path(session_id)):
+        await db.execute(
+            update(UploadSession).where(owned).values(status="open", locked_until=None, lock_token=None)
+        )
+        await db.commit()
+    elif (await db.execute(select(UploadSession.id).where(owned))).first():
+        await abort_session(db, session_id)
+
+
+async def cancel_session(db: AsyncSession, session_id: str, user_id: int) -> None:
+    """DELETE /uploads/{id}: abort unless a finalize holds a live lease on it."""
+    deleted = (await db.execute(
+        delete(UploadSession).where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == user_id,
+            ~_finalize_in_progress(datetime.utcnow()),
+        )
+    )).rowcount
+    await db.commit()
+    if not deleted:
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+    try:
+        await run_in_threadpool(os.remove, part_path(session_id))
+    except FileNotFoundError:
+        pass
+
+
+async def abort_session(db: AsyncSession, session_id: str) -> None:
+    try:
+        await run_in_threadpool(os.remove, part_path(session_id))
+    except FileNotFoundError:
+        pass
+    await db.execute(delete(UploadSession).where(UploadSession.id == session_id))
+    await db.commit()
+
+
+def expire_upload_sessions(db: Session) -> int:
+    """Delete expired sessions and their part files; returns how many."""
+    expired = db.execute(
+        select(UploadSession.id).where(UploadSession.expires_at < datetime.utcnow())
+    ).scalars().all()
+    for session_id in expired:
+        try:
+            os.remove(part_path(session_id))
+        except FileNotFoundError:
+            pass
+    if expired:
+        db.execute(delete(UploadSession).where(UploadSession.id.in_(expired)))
+        db.commit()
+    return len(expired)
@@ -0,0 +1,259 @@
+"""
+DICOM decoding for the upload pipeline (PACS exports).
+
+Only the header is parsed by pydicom; Pixel Data is left on disk and read
+through a memory map, so a multi-frame study costs the pages of the one
+frame we use, at the stride we downsample with, not the whole file. The
+middle frame is taken as the representative slice. Modality values
+(rescale slope/intercept) are windowed to 8 bits with the file's VOI
+window, or with a 0.5-99.5 percentile window when it has none, and
+MONOCHROME1 is inverted so bone is always bright.
+
+Compressed transfer syntaxes (JPEG, JPEG 2000, RLE) are decoded one frame
+at a time by pydicom's pixel handlers, so they load that frame in memory.
+
+pydicom is optional (pip install pydicom); without it DICOM uploads are
+rejected as unsupported like any other unknown format.
+"""
+import io
+import math
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple, Union
+
+import numpy as np
+import PIL.Image
+
+try:
+    import pydicom
+    import pydicom.pixels
+    from pydicom.errors import InvalidDicomError
+    from pydicom.multival import MultiValue
+except ImportError:  # only needed for DICOM uploads
+    pydicom = None
+    InvalidDicomError = None
+    MultiValue = list
+
+DICOM_CONTENT_TYPE = "application/dicom"
+PIXEL_DATA = 0x7FE00010
+DICOM_MAGIC = b"DICM"
+_MAGIC_OFFSET = 128  # after the 128-byte preamble
+
+Source = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+
+class DicomError(ValueError):
+    """The upload is a DICOM file we cannot turn into an image."""
+
+
+def is_dicom(source: Source) -> bool:
+    """True when the source starts with a DICOM Part 10 preamble and magic."""
+    end = _MAGIC_OFFSET + len(DICOM_MAGIC)
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            header = f.read(end)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        header = bytes(source[:end])
+    else:
+        position = source.tell()
+        header = source.read(end)
+        source.seek(position)
+    return header[_MAGIC_OFFSET:end] == DICOM_MAGIC
+
+
+def _first(value, default=None):
+    """First value of a possibly multi-valued element (e.g. WindowCenter)."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, (list, tuple, MultiValue)):
+        return value[0] if len(value) else default
+    return value
+
+
+def _study_datetime(ds) -> Optional[datetime]:
+    date = str(ds.get("StudyDate") or "")
+    if len(date) != 8:
+        return None
+    time = str(ds.get("StudyTime") or "").split(".")[0].ljust(6, "0")[:6]
+    try:
+        return datetime.strptime(date + time, "%Y%m%d%H%M%S")
+    except ValueError:
+        try:
+            return datetime.strptime(date, "%Y%m%d")
+        except ValueError:
+            return None
+
+
+def extract_metadata(ds) -> dict:
+    """
+    Acquisition metadata worth keeping with the case. Patient identifiers
+    (name, ID, birth date) are deliberately left out: the case already
+    belongs to a platform user.
+    """
+    spacing = ds.get("PixelSpacing") or ds.get("ImagerPixelSpacing")
+    study_date = _study_datetime(ds)
+    metadata = {
+        "modality": ds.get("Modality"),
+        "body_part": ds.get("BodyPartExamined"),
+        "study_date": study_date.isoformat() if study_date else None,
+        "study_instance_uid": ds.get("StudyInstanceUID"),
+        "series_instance_uid": ds.get("SeriesInstanceUID"),
+        "study_description": ds.get("StudyDescription"),
+        "series_description": ds.get("SeriesDescription"),
+        "view_position": ds.get("ViewPosition"),
+        "manufacturer": ds.get("Manufacturer"),
+        "model": ds.get("ManufacturerModelName"),
+        "rows": ds.get("Rows"),
+        "columns": ds.get("Columns"),
+        "frames": int(ds.get("NumberOfFrames") or 1),
+        "pixel_spacing_mm": [float(value) for value in spacing] if spacing else None,
+        "bits_stored": ds.get("BitsStored"),
+        "photometric_interpretation": ds.get("PhotometricInterpretation"),
+        "transfer_syntax": str(ds.file_meta.TransferSyntaxUID) if "TransferSyntaxUID" in ds.file_meta else None,
+    }
+    # Drop empty values; plain JSON types instead of pydicom's (UID, IS, DS...)
+    return {key: _plain(value) for key, value in metadata.items() if value not in (None, "")}
+
+
+def _plain(value):
+    if isinstance(value, list):
+        return value
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
+
+
+def window_to_uint8(values: np.ndarray, ds) -> np.ndarray:
+    """Modality LUT (rescale) then a linear VOI window, as in DICOM PS3.3 C.11.2.1.2."""
+    values = values.astype(np.float32)  # the one full-size copy; everything below is in place
+    slope = float(_first(ds.get("RescaleSlope"), 1) or 1)
+    intercept = float(_first(ds.get("RescaleIntercept"), 0) or 0)
+    if slope != 1 or intercept != 0:
+        values *= slope
+        values += intercept
+
+    center = _first(ds.get("WindowCenter"))
+    width = _first(ds.get("WindowWidth"))
+    if center is not None and width is not None and float(width) >= 1:
+        center, width = float(center), float(width)
+        low, high = center - 0.5 - (width - 1) / 2, center - 0.5 + (width - 1) / 2
+    else:
+        low, high = (float(v) for v in np.percentile(values, (0.5, 99.5)))
+    if high <= low:
+        high = low + 1
+
+    values -= low
+    values *= 255.0 / (high - low)
+    out = np.clip(values, 0, 255, out=values).astype(np.uint8)
+    if ds.get("PhotometricInterpretation") == "MONOCHROME1":
+        out = 255 - out
+    return out
+
+
+def _pixel_dtype(ds, little_endian: bool) -> np.dtype:
+    bits = ds.BitsAllocated
+    if bits not in (8, 16, 32):
+        raise DicomError(f"Unsupported DICOM BitsAllocated {bits}")
+    kind = "i" if ds.get("PixelRepresentation", 0) == 1 else "u"
+    return np.dtype(f"{'<' if little_endian else '>'}{kind}{bits // 8}")
+
+
+def _native_frame(source: Source, ds, frame: int, step: int) -> np.ndarray:
+    """One frame of uncompressed Pixel Data, strided, straight from a memory map."""
+    element = ds.get_item(PIXEL_DATA, keep_deferred=True)
+    offset = getattr(element, "value_tell", None)
+    if element.value is not None:  # small enough to have been read with the header
+        source, offset = element.value, 0
+    if offset is None:
+        raise DicomError("DICOM Pixel Data could not be located")
+
+    dtype = _pixel_dtype(ds, ds.file_meta.TransferSyntaxUID.is_little_endian)
+    rows, columns = ds.Rows, ds.Columns
+    samples = ds.get("SamplesPerPixel", 1)
+    frames = int(ds.get("NumberOfFrames") or 1)
+    planar = samples > 1 and ds.get("PlanarConfiguration", 0) == 1
+    shape = (frames, samples, rows, columns) if planar else (frames, rows, columns, samples)
+
+    if isinstance(source, str):
+        buffer = np.memmap(source, dtype=np.uint8, mode="r")
+    else:
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            source = memoryview(source)  # mmap: zero-copy
+        buffer = np.frombuffer(source, dtype=np.uint8)
+    needed = math.prod(shape) * dtype.itemsize
+    if buffer.size < offset + needed:
+        raise DicomError("DICOM Pixel Data is truncated")
+
+    pixels = buffer[offset:offset + needed].view(dtype).reshape(shape)[frame]
+    if planar:
+        pixels = pixels.transpose(1, 2, 0)
+    # Copies only the sampled rows/columns; untouched pages are never read
+    pixels = np.array(pixels[::step, ::step], dtype=dtype.newbyteorder("="))
+
+    stored, allocated = ds.get("BitsStored", ds.BitsAllocated), ds.BitsAllocated
+    if stored < allocated:
+        shift = allocated - stored
+        if dtype.kind == "i":  # sign-extend from the high stored bit
+            pixels = (pixels << shift) >> shift
+        else:
+            pixels = pixels & ((1 << stored) - 1)
+    return pixels
+
+
+def _encapsulated_frame(source: Source, frame: int, step: int) -> np.ndarray:
+    """One frame of compressed Pixel Data, decoded by pydicom's handlers."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif not isinstance(source, str):
+        source.seek(0)
+    try:
+        pixels = pydicom.pixels.pixel_array(source, index=frame, raw=False)
+    except (NotImplementedError, RuntimeError, ValueError) as e:
+        raise DicomError(f"Unsupported DICOM compression: {e}")
+    return np.ascontiguousarray(pixels[::step, ::step])
+
+
+def read_dicom(source: Source, max_side: int, max_pixels: int, max_edge: int) -> Tuple[PIL.Image.Image, dict]:
+    """
+    Decode the representative frame of a DICOM file to an 8-bit image whose
+    longest side is at most max_side. max_pixels/max_edge bound the source
+    frame like the PIL bomb limits do for ordinary images.
+    """
+    if pydicom is None:
+        raise DicomError("DICOM uploads need pydicom (pip install pydicom)")
+    try:
+        # Large values (Pixel Data) are deferred: parsed for offset and length only
+        if isinstance(source, str):
+            ds = pydicom.dcmread(source, defer_size="64 KB")
+        else:
+            stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+            stream.seek(0)
+            ds = pydicom.dcmread(stream, defer_size="64 KB")
+    except (InvalidDicomError, EOFError, OSError, ValueError, KeyError) as e:
+        raise DicomError(f"Unreadable DICOM file: {e}")
+
+    if PIXEL_DATA not in ds:
+        raise DicomError("DICOM file has no image (no Pixel Data)")
+    rows, columns = ds.get("Rows"), ds.get("Columns")
+    if not rows or not columns:
+        raise DicomError("DICOM file has no image dimensions")
+    if max(rows, columns) > max_edge or rows * columns > max_pixels:
+        raise DicomError(f"Image too large: {columns}x{rows}")
+
+    metadata = extract_metadata(ds)
+    frame = metadata["frames"] // 2
+    # Integer stride to between 1x and 2x the target, then a proper resample
+    step = max(1, max(rows, columns) // max_side)
+
+    if ds.file_meta.TransferSyntaxUID.is_encapsulated:
+        pixels = _encapsulated_frame(source, frame, step)
+    else:
+        pixels = _native_frame(source, ds, frame, step)
+
+    if ds.get("SamplesPerPixel", 1) > 1:
+        image = PIL.Image.fromarray(pixels.reshape(pixels.shape[0], pixels.shape[1], -1)[..., :3].astype(np.uint8), "RGB")
+    else:
+        image = PIL.Image.fromarray(window_to_uint8(pixels.reshape(pixels.shape[0], pixels.shape[1]), ds), "L")
+    image.thumbnail((max_side, max_side), PIL.Image.Resampling.LANCZOS)
+    return image, metadata
@@ -0,0 +1,52 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+# Browsers may store the response but must revalidate it (If-None-Match) before reuse
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts) -> str:
+    """
+    Build a weak ETag from validator parts, e.g. (row count, max updated_at)
+    plus anything that changes the representation (user, query parameters).
+    """
+    digest = hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def change_validator(db: Session, model, *criteria) -> tuple:
+    """
+    (row count, max updated_at) over the rows matching criteria. Any insert,
+    update or delete of a matching row changes it (updated_at has onupdate).
+    For large row sets, back it with an index ending in updated_at so this
+    is an index-only scan.
+    """
+    return tuple(
+        db.query(func.count(model.id), func.max(model.updated_at)).filter(*criteria).one()
+    )
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match matches etag (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: Optional[str]) -> Response:
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
@@ -1,14 +1,118 @@
+import hashlib
+import mmap
 import os
+import tempfile
 import uuid
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException
+
 from app.config import UPLOAD_DIR
 
-def save_upload_file(upload_file) -> str:
+# Largest accepted upload; bigger files are rejected with 413 while streaming
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploads that are only analyzed, not stored, stay in memory up to this size
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(8 * 1024 * 1024)))
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    content_type: Optional[str] = None
+
+    def discard(self) -> None:
+        """Remove the file, e.g. when the upload is rejected after streaming."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def stream_upload_to_disk(upload_file, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredUpload:
     """
-    Saves a FastAPI UploadFile to disk and returns saved filename (relative path).
+    Copy an UploadFile to UPLOAD_DIR one chunk at a time, hashing as it goes.
+
+    At most one chunk is held in memory. Uploads larger than max_bytes are
+    rejected with 413 and the partial file is removed.
     """
-    ext = os.path.splitext(upload_file.filename)[1] or ""
+    ext = os.path.splitext(upload_file.filename or "")[1] or ""
     filename = f"{uuid.uuid4().hex}{ext}"
     out_path = os.path.join(UPLOAD_DIR, filename)
-    with open(out_path, "wb") as f:
-        f.write(upload_file.file.read())
-    return out_path
+    part_path = out_path + ".part"
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(part_path, "wb") as out:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large (limit {max_bytes // (1024 * 1024)} MB)",
+                    )
+                digest.update(chunk)
+                await out.write(chunk)
+        await aiofiles.os.rename(part_path, out_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    return StoredUpload(
+        path=out_path, size=size, sha256=digest.hexdigest(), content_type=upload_file.content_type
+    )
+
+
+@asynccontextmanager
+async def spool_upload(
+    upload_file,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    memory_bytes: int = UPLOAD_SPOOL_MEMORY_BYTES,
+):
+    """
+    Copy an UploadFile into a SpooledTemporaryFile for analysis without storing it.
+
+    The copy lives in memory up to memory_bytes and spills to an unlinked
+    temporary file beyond that, so nothing is left on disk even if the
+    process dies. Both the spool and the upload are closed when the block
+    exits. Oversized uploads are rejected with 413.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=memory_bytes)
+    try:
+        size = 0
+        while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large (limit {max_bytes // (1024 * 1024)} MB)",
+                )
+            spool.write(chunk)
+        spool.seek(0)
+        yield spool
+    finally:
+        spool.close()
+        await upload_file.close()
+
+
+@contextmanager
+def open_upload_buffer(path: str):
+    """
+    Read-only memory map of a stored upload, for handing to the AI layer
+    without reading the file into a bytes object. Pages are loaded lazily
+    by the OS and shared with the page cache.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:  # mmap can't map empty files
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
@@ -0,0 +1,105 @@
+import os
+from typing import Mapping, Optional
+
+import anyio
+from fastapi import Request, Response
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    Parse a Range header against a file of `size` bytes.
+
+    Returns (start, end) inclusive for a single satisfiable range, None when
+    the whole file should be sent (no header, or several ranges, which we
+    may legally ignore), or False when the range can't be satisfied (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_text:  # suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(FileResponse):
+    """
+    FileResponse that answers single byte-range requests with 206.
+
+    Whole-file responses go through FileResponse, which hands the path to the
+    server (ASGI pathsend, i.e. sendfile) when the server supports it. Ranges
+    use the zerocopysend extension when offered and chunked reads otherwise.
+    """
+
+    def __init__(self, path: str, byte_range: Optional[tuple] = None, **kwargs):
+        super().__init__(path, stat_result=kwargs.pop("stat_result", None) or os.stat(path), **kwargs)
+        self.headers["accept-ranges"] = "bytes"
+        self.byte_range = byte_range
+        if byte_range:
+            start, end = byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.byte_range:
+            await super().__call__(scope, receive, send)
+            return
+
+        start, end = self.byte_range
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file, "offset": start, "count": end - start + 1,
+                })
+            return
+
+        remaining = end - start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(start)
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def file_response(
+    request: Request,
+    path: str,
+    media_type: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Serve `path`, honouring Range (and If-Range against our ETag) for GET and HEAD."""
+    stat_result = os.stat(path)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    etag = (headers or {}).get("ETag")
+    if request.method in ("GET", "HEAD") and (not if_range or if_range == etag):
+        byte_range = parse_range(request.headers.get("range"), stat_result.st_size)
+    if byte_range is False:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{stat_result.st_size}"})
+    return RangeFileResponse(
+        path, byte_range=byte_range, stat_result=stat_result,
+        media_type=media_type, headers=headers, content_disposition_type="inline",
+    )
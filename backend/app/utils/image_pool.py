@@ -0,0 +1,229 @@
+"""
+CPU-bound image work on a process pool, off the event loop.
+
+prepare_image() opens an upload, validates it (format, dimensions,
+decompression-bomb limits), decodes it fully so truncated files fail here,
+and re-encodes a downscaled copy for the vision model. The model call then
+only ships the small encoded payload; nothing is decoded in the API process.
+DICOM files are recognised by their magic and handled by app.utils.dicom,
+which also returns the acquisition metadata for the case. Other image jobs
+(e.g. rendering thumbnails, app.services.media_service) go through
+run_in_image_pool().
+
+Jobs beyond IMAGE_POOL_WORKERS + IMAGE_POOL_MAX_QUEUE are refused with 503,
+like the password hashing pool. Workers are spawned (not forked) on first
+use, so the pool never inherits the server's threads or sockets. If a
+worker dies (e.g. OOM-killed on a huge image) the pool is broken for good;
+it is replaced and the job that was running gets a 503.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO, Optional, Union
+
+import PIL.Image
+from fastapi import HTTPException, status
+from prometheus_client import Gauge
+
+from app.utils.dicom import DicomError, is_dicom, read_dicom
+
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_POOL_MAX_QUEUE = int(os.getenv("IMAGE_POOL_MAX_QUEUE", "32"))
+# ~10000 x 10000; PIL's own bomb check fires at 2x its limit, this one at 1x
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(100_000_000)))
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "16384"))
+# Longest side sent to the vision model; it downsamples larger images anyway
+MODEL_IMAGE_MAX_SIDE = int(os.getenv("MODEL_IMAGE_MAX_SIDE", "2048"))
+
+ALLOWED_IMAGE_FORMATS = {"PNG", "JPEG", "TIFF", "BMP", "WEBP", "GIF"}
+
+IMAGE_POOL_QUEUE_DEPTH = Gauge(
+    "image_pool_queue_depth", "Image decode jobs submitted and not yet finished"
+)
+
+_slots = threading.BoundedSemaphore(IMAGE_POOL_WORKERS + IMAGE_POOL_MAX_QUEUE)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidImageError(ValueError):
+    """The upload is not an image we accept (unsupported, corrupt or too large)."""
+
+
+@dataclass
+class PreparedImage:
+    """A validated image, re-encoded for the vision model."""
+    mime_type: str
+    data: bytes
+    format: str   # source format, e.g. "PNG" or "DICOM"
+    width: int    # source dimensions
+    height: int
+    metadata: Optional[dict] = None  # DICOM acquisition metadata (see dicom.extract_metadata)
+
+    def as_part(self) -> dict:
+        """Inline blob part for generate_content()."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def case_fields(self) -> dict:
+        """PatientCase column values taken from the image; empty unless it was DICOM."""
+        if not self.metadata:
+            return {}
+        study_date = self.metadata.get("study_date")
+        return {
+            "modality": self.metadata.get("modality"),
+            "body_part": self.metadata.get("body_part"),
+            "study_date": datetime.fromisoformat(study_date) if study_date else None,
+            "imaging_metadata": self.metadata,
+        }
+
+
+def to_display_mode(image: PIL.Image.Image) -> PIL.Image.Image:
+    """8-bit L/RGB as JPEG needs; 16-bit greyscale (common for X-rays) is scaled, not clipped."""
+    if image.mode in ("L", "RGB"):
+        return image
+    if image.mode.startswith("I"):
+        return image.convert("I").point(lambda value: value * (1 / 256)).convert("L")
+    if image.mode in ("F", "LA", "1"):
+        return image.convert("L")
+    return image.convert("RGB")
+
+
+def prepare_image(
+    source: Union[str, bytes, BinaryIO],
+    max_pixels: int = IMAGE_MAX_PIXELS,
+    max_side: int = IMAGE_MAX_SIDE,
+    model_max_side: int = MODEL_IMAGE_MAX_SIDE,
+) -> PreparedImage:
+    """
+    Validate and re-encode an image given as a file path, bytes or a binary
+    file object. Runs in a pool worker; call it directly only from code
+    that may block (e.g. Celery tasks).
+    """
+    PIL.Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        if is_dicom(source):
+            return _prepare_dicom(source, max_pixels, max_side, model_max_side)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", PIL.Image.DecompressionBombWarning)
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                source = io.BytesIO(source)
+            with PIL.Image.open(source) as image:
+                # Everything up to here only read the header
+                if image.format not in ALLOWED_IMAGE_FORMATS:
+                    raise InvalidImageError(f"Unsupported image format: {image.format}")
+                width, height = image.size
+                if max(width, height) > max_side:
+                    raise InvalidImageError(f"Image too large: {width}x{height} (max side {max_side})")
+
+                image.draft(image.mode, (model_max_side, model_max_side))  # JPEG: decode at reduced scale
+                image.load()
+                derived = to_display_mode(image)
+                derived = derived.copy() if derived is image else derived
+                derived.thumbnail((model_max_side, model_max_side), PIL.Image.Resampling.LANCZOS)
+
+                out = io.BytesIO()
+                derived.save(out, "JPEG", quality=90)
+                return PreparedImage("image/jpeg", out.getvalue(), image.format, width, height)
+    except InvalidImageError:
+        raise
+    except (PIL.Image.DecompressionBombWarning, PIL.Image.DecompressionBombError) as e:
+        raise InvalidImageError(f"Image too large: {e}")
+    except PIL.UnidentifiedImageError:
+        # PIL's message names the server-side path
+        raise InvalidImageError("Unreadable image: not a recognised image file")
+    except (OSError, ValueError, SyntaxError) as e:
+        raise InvalidImageError(f"Unreadable image: {e}")
+
+
+def _prepare_dicom(source, max_pixels: int, max_side: int, model_max_side: int) -> PreparedImage:
+    try:
+        image, metadata = read_dicom(source, model_max_side, max_pixels=max_pixels, max_edge=max_side)
+    except DicomError as e:
+        raise InvalidImageError(str(e))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return PreparedImage(
+        "image/jpeg", out.getvalue(), "DICOM", metadata.get("columns"), metadata.get("rows"), metadata
+    )
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _replace_broken_executor(broken: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died; the next job starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:  # not already replaced by a concurrent job
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _release(_future) -> None:
+    IMAGE_POOL_QUEUE_DEPTH.dec()
+    _slots.release()
+
+
+async def run_in_image_pool(fn, *args):
+    """
+    fn(*args) on the process pool; fn must be a module-level function.
+    Raises a 503 HTTPException when the pool's queue is full.
+    """
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing busy, please retry shortly",
+        )
+    IMAGE_POOL_QUEUE_DEPTH.inc()
+    try:
+        executor = _get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # Broken by an earlier job; this one never ran, so retry on a new pool
+            _replace_broken_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(fn, *args)
+    except BaseException:
+        _release(None)
+        raise
+    # Release on completion, not when the awaiting request goes away
+    future.add_done_callback(_release)
+    try:
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        _replace_broken_executor(executor)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image processing failed, please retry",
+        )
+
+
+async def prepare_image_async(source: Union[str, bytes]) -> PreparedImage:
+    """
+    prepare_image() on the process pool. Raises InvalidImageError for bad
+    images and a 503 HTTPException when the pool's queue is full.
+    """
+    return await run_in_image_pool(prepare_image, source)
+
+
+def shutdown_image_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
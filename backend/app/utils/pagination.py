@@ -0,0 +1,105 @@
+import base64
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """
+    Encode the (sort value, id) of the last row on a page into an opaque cursor.
+    """
+    raw = f"{sort_value.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor produced by encode_cursor back into (sort value, id).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        sort_raw, id_raw = raw.rsplit("|", 1)
+        return datetime.fromisoformat(sort_raw), int(id_raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def keyset_filter(sort_col, id_col, cursor: Optional[str]):
+    """
+    Build the seek predicate for rows strictly after the cursor in
+    (sort_col DESC, id_col DESC) order, or None when there is no cursor.
+    """
+    if not cursor:
+        return None
+    last_sort, last_id = decode_cursor(cursor)
+    return or_(
+        sort_col < last_sort,
+        and_(sort_col == last_sort, id_col < last_id),
+    )
+
+
+def split_page(rows, limit: int, sort_key: str, id_key: str = "id"):
+    """
+    Trim a page fetched with limit + 1 rows and derive the next cursor.
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_key), getattr(last, id_key))
+    return rows, next_cursor
+
+
+def keyset_paginate(query, sort_col, id_col, limit: int, cursor: Optional[str] = None):
+    """
+    Apply keyset (seek) pagination to a query ordered newest-first on (sort_col, id_col).
+
+    Rather than OFFSET, the cursor carries the last (sort value, id) seen, so every
+    page is a range scan on the composite index no matter how deep the client pages.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    seek = keyset_filter(sort_col, id_col, cursor)
+    if seek is not None:
+        query = query.filter(seek)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(sort_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    return split_page(rows, limit, sort_col.key, id_col.key)
+
+
+def keyset_paginate_union(sources, limit: int, cursor: Optional[str] = None):
+    """
+    Keyset-paginate several queries as if they were one list, e.g. live and
+    archived cases. `sources` is a list of (query, sort_col, id_col) whose
+    sort/id attributes share names; ids must be unique across sources.
+
+    Each source is seeked on its own index for limit + 1 rows and the results
+    are merged newest-first, so the cost per page doesn't grow with the
+    number of rows in any of the tables.
+
+    Returns (rows, next_cursor) like keyset_paginate.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    rows = []
+    for query, sort_col, id_col in sources:
+        seek = keyset_filter(sort_col, id_col, cursor)
+        if seek is not None:
+            query = query.filter(seek)
+        rows.extend(query.order_by(sort_col.desc(), id_col.desc()).limit(limit + 1).all())
+
+    _, sort_col, id_col = sources[0]
+    sort_key, id_key = sort_col.key, id_col.key
+    rows.sort(key=lambda row: (getattr(row, sort_key), getattr(row, id_key)), reverse=True)
+
+    return split_page(rows, limit, sort_key, id_key)
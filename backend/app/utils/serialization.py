@@ -0,0 +1,68 @@
+from functools import lru_cache
+from typing import Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+
+def parse_fields(fields: Optional[str], schema: type[BaseModel], always: Sequence[str] = ("id",)) -> tuple:
+    """
+    Parse a sparse fieldset (?fields=id,status,top_label) against a response schema.
+
+    Returns the selected field names in schema order, or every field when
+    `fields` is empty. Unknown names are a 400 so typos don't silently drop data.
+    """
+    if not fields:
+        return tuple(schema.model_fields)
+
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(requested - set(schema.model_fields))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+
+    requested.update(always)
+    return tuple(name for name in schema.model_fields if name in requested)
+
+
+def project_columns(model, fields: Sequence[str], extra: Sequence[str] = ()) -> list:
+    """
+    ORM columns to SELECT for the given fields, plus any `extra` columns the
+    query itself needs (e.g. keyset sort keys), without duplicates.
+    """
+    names = list(dict.fromkeys([*fields, *extra]))
+    return [getattr(model, name) for name in names]
+
+
+@lru_cache(maxsize=256)
+def _partial_schema(schema: type[BaseModel], fields: tuple) -> type[BaseModel]:
+    """`schema` restricted to `fields` (cached per fieldset)."""
+    return create_model(
+        f"{schema.__name__}Partial",
+        __config__=ConfigDict(from_attributes=True),
+        **{
+            name: (schema.model_fields[name].annotation, schema.model_fields[name])
+            for name in fields
+        },
+    )
+
+
+@lru_cache(maxsize=256)
+def _list_adapter(item_schema: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[item_schema])
+
+
+def list_response(schema: type[BaseModel], fields: tuple, rows, headers: Optional[dict] = None) -> ORJSONResponse:
+    """
+    Validate and serialize a whole list of rows (ORM objects or projected Row
+    tuples) in one TypeAdapter call, rendered with orjson.
+
+    Returning the response directly skips FastAPI's per-item response_model
+    pass, so routes using this declare the schema via `responses=` instead.
+    """
+    item_schema = schema if fields == tuple(schema.model_fields) else _partial_schema(schema, fields)
+    adapter = _list_adapter(item_schema)
+    # Projected Row tuples validate much faster as dicts than through attribute access
+    rows = [row._asdict() if hasattr(row, "_asdict") else row for row in rows]
+    items = adapter.validate_python(rows, from_attributes=True)
+    return ORJSONResponse(adapter.dump_python(items), headers=headers)
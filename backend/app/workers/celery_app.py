@@ -1,16 +1,37 @@
 from celery import Celery
+from celery.schedules import crontab
 import os
 
 # Use container name 'redis' as the host
 redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
 
+# The one Celery app: the API enqueues through it, and both the worker and
+# beat start from it (celery -A app.workers.celery_app.celery worker|beat).
+# include registers the tasks in the worker.
 celery = Celery(
     "medifusion_tasks",
-    broker=redis_url,
-    backend=redis_url,
+    broker=os.getenv("CELERY_BROKER_URL", redis_url),
+    backend=os.getenv("CELERY_RESULT_BACKEND", redis_url),
+    include=["app.workers.tasks"],
 )
 
 # Use absolute import from app.workers
 celery.conf.task_routes = {
     "app.workers.tasks.process_case_task": {"queue": "celery"},
 }
+
+# Periodic jobs, run by the worker
+celery.conf.beat_schedule = {
+    "archive-closed-cases": {
+        "task": "app.workers.tasks.archive_closed_cases_task",
+        "schedule": crontab(hour=int(os.getenv("ARCHIVE_HOUR_UTC", "3")), minute=0),
+    },
+    "collect-unreferenced-blobs": {
+        "task": "app.workers.tasks.collect_blob_garbage_task",
+        "schedule": crontab(minute=30),
+    },
+    "expire-upload-sessions": {
+        "task": "app.workers.tasks.expire_upload_sessions_task",
+        "schedule": crontab(minute=45),
+    },
+}
@@ -1,14 +1,13 @@
-from celery import Celery
-import os
 from app.core.database import SessionLocal
+from app.workers.celery_app import celery
 from app.models.patient_case import PatientCase
+from app.services.case_events import ANALYSIS_FIELDS, emit_case_event_sync
+import app.services.stats_service  # keeps the case stats rollup in sync with worker writes
+from app.services.archive_service import archive_closed_cases
+from app.services.blob_store import collect_garbage, open_stored_file, stored_file_exists
+from app.services.upload_sessions import expire_upload_sessions
 from app.ai.predictor import analyze_image_bytes, analyze_symptoms
-
-celery = Celery(
-    "medifusion_tasks",
-    broker="redis://redis:6379/0",
-    backend="redis://redis:6379/1",
-)
+from app.utils.image_pool import prepare_image
 
 def calculate_severity(xray_result, symptom_result):
     """
@@ -47,11 +46,13 @@ def process_case_task(case_id: int):
 
         # Run AI predictions if not already done
         if not case.xray_result and case.uploaded_file:
-            # Use analyze_image_bytes which requires bytes
-            if os.path.exists(case.uploaded_file):
-                with open(case.uploaded_file, "rb") as f:
-                    image_bytes = f.read()
-                case.xray_result = analyze_image_bytes(image_bytes)
+            # Fetched by content hash from the blob store (legacy rows hold a path)
+            if stored_file_exists(case.uploaded_file):
+                with open_stored_file(case.uploaded_file) as image_buffer:
+                    image = prepare_image(image_buffer)  # also decodes DICOM
+                case.xray_result = analyze_image_bytes(image)
+                for field, value in image.case_fields().items():
+                    setattr(case, field, value)
             else:
                 print(f"File not found: {case.uploaded_file}")
             
@@ -63,9 +64,51 @@ def process_case_task(case_id: int):
         
         case.status = "processed"
         db.commit()
+
+        # Tell the patient's open dashboards, in whichever API worker holds them
+        emit_case_event_sync(
+            db, "case_processed", case, ANALYSIS_FIELDS, message="The AI analysis of your case is ready"
+        )
         return case_id
     except Exception as e:
         print(f"Error processing case {case_id}: {e}")
         db.rollback()
     finally:
         db.close()
+
+@celery.task
+def archive_closed_cases_task():
+    """Nightly move of long-closed cases to patient_cases_archive (throttled batches)."""
+    db = SessionLocal()
+    try:
+        return archive_closed_cases(db)
+    except Exception as e:
+        print(f"Error archiving closed cases: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+@celery.task
+def collect_blob_garbage_task():
+    """Hourly removal of uploads no case or report references any more."""
+    db = SessionLocal()
+    try:
+        return collect_garbage(db)
+    except Exception as e:
+        print(f"Error collecting unreferenced blobs: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+@celery.task
+def expire_upload_sessions_task():
+    """Hourly cleanup of resumable uploads past their TTL, finished or not."""
+    db = SessionLocal()
+    try:
+        return expire_upload_sessions(db)
+    except Exception as e:
+        print(f"Error expiring upload sessions: {e}")
+        db.rollback()
+    finally:
+        db.close()
@@ -0,0 +1,111 @@
+"""
+Case list serialization benchmark: ORM objects + response_model vs.
+projected rows + bulk TypeAdapter + orjson.
+
+Loads --rows cases from a fresh SQLite database and times, end to end
+(query + validation + JSON body):
+
+  before   db.query(PatientCase) -> FastAPI response_model=list[CaseOut] -> JSONResponse
+  after    projected CaseOut columns -> list_response() (TypeAdapter + ORJSONResponse)
+  sparse   same, with ?fields=id,status,created_at,top_label
+
+Usage (from backend/):
+    python benchmarks/bench_case_list_serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="medifusion-bench-uploads-"))
+warnings.filterwarnings("ignore")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.base import Base
+from app.models.patient_case import PatientCase
+from app.schemas.case_schema import CaseOut
+from app.utils.serialization import list_response, parse_fields, project_columns
+
+
+def populate(Session, rows):
+    with Session() as db:
+        db.bulk_save_objects([
+            PatientCase(
+                patient_name=f"patient{i % 500}",
+                patient_contact=f"patient{i}@example.com",
+                status="submitted",
+                symptoms="persistent cough, fever and shortness of breath for three days " * 3,
+                xray_result={"top_label": "Pneumonia", "top_prob": 0.91, "findings": "Right lower lobe opacity " * 10},
+                symptom_result={"label": "Pneumonia", "prob": 0.7, "urgency": "high", "reasoning": "x" * 400},
+                severity_score=0.8,
+                doctor_notes="Reviewed, recommend follow-up chest X-ray in two weeks. " * 5,
+                top_label="pneumonia", top_prob=0.91, urgency="high",
+            )
+            for i in range(rows)
+        ])
+        db.commit()
+
+
+def before(Session, field):
+    with Session() as db:
+        cases = db.query(PatientCase).order_by(PatientCase.created_at.desc()).all()
+        content = asyncio.run(serialize_response(field=field, response_content=cases))
+        return JSONResponse(content).body
+
+
+def after(Session, fields):
+    with Session() as db:
+        rows = (
+            db.query(*project_columns(PatientCase, fields, extra=("created_at", "id")))
+            .order_by(PatientCase.created_at.desc())
+            .all()
+        )
+        return list_response(CaseOut, fields, rows).body
+
+
+def measure(label, fn, repeat):
+    samples = []
+    body = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<8} median {statistics.median(samples):8.1f}ms   min {min(samples):8.1f}ms   body {len(body) / 1e6:6.2f}MB")
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="medifusion-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine, tables=[PatientCase.__table__])
+    Session = sessionmaker(bind=engine)
+    populate(Session, args.rows)
+
+    field = create_response_field(name="Response", type_=list[CaseOut])
+    all_fields = parse_fields(None, CaseOut)
+    sparse_fields = parse_fields("id,status,created_at,top_label", CaseOut)
+
+    print(f"Serializing {args.rows:,} cases ({args.repeat} runs each)\n")
+    old = measure("before", lambda: before(Session, field), args.repeat)
+    new = measure("after", lambda: after(Session, all_fields), args.repeat)
+    sparse = measure("sparse", lambda: after(Session, sparse_fields), args.repeat)
+    print(f"\nspeedup: {old / new:.1f}x full fieldset, {old / sparse:.1f}x sparse fieldset")
+
+
+if __name__ == "__main__":
+    main()
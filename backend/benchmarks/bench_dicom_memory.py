@@ -0,0 +1,155 @@
+"""
+Peak memory of turning a large DICOM study into the model's input image.
+
+Writes a synthetic multi-frame study (--frames x --side x --side, 16-bit,
+uncompressed) and a single large radiograph to a temp directory, then
+decodes each one in a fresh child process, two ways:
+
+  before   pydicom.dcmread() + ds.pixel_array, the obvious approach: the
+           whole study is read into memory, then one frame is windowed
+  after    prepare_image() from app.utils.image_pool: header only, then one
+           frame of Pixel Data through a memory map at the downsampling stride
+
+Reported per run: peak anonymous RSS (heap; what the container limit sees
+first), peak total RSS (VmHWM, which also counts the mapped file pages
+that were touched) and wall time. Linux only (reads /proc/self/status).
+
+Usage (from backend/):
+    python benchmarks/bench_dicom_memory.py [--frames 100] [--side 2048]
+"""
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def status_kb(field: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def write_study(path: str, frames: int, rows: int, columns: int) -> None:
+    """A 16-bit MONOCHROME2 study, Pixel Data streamed frame by frame so writing it stays small."""
+    import numpy as np
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    meta = FileMetaDataset()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.12.1"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.Modality, ds.BodyPartExamined = "DX", "CHEST"
+    ds.StudyDate, ds.StudyInstanceUID = "20240131", generate_uid()
+    ds.Rows, ds.Columns, ds.NumberOfFrames = rows, columns, frames
+    ds.SamplesPerPixel, ds.PhotometricInterpretation = 1, "MONOCHROME2"
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 12, 11, 0
+    ds.WindowCenter, ds.WindowWidth = 2048, 4096
+    ds.save_as(path, enforce_file_format=True)
+
+    gradient = (np.linspace(0, 4095, columns, dtype=np.float32)[None, :] * np.ones((rows, 1), np.float32))
+    frame_bytes = rows * columns * 2
+    with open(path, "ab") as f:
+        # (7FE0,0010) OW, explicit VR little endian: tag, VR, 2 reserved bytes, 4-byte length
+        f.write(struct.pack("<HH2s2xI", 0x7FE0, 0x0010, b"OW", frame_bytes * frames))
+        for index in range(frames):
+            f.write(((gradient + index) % 4096).astype("<u2").tobytes())
+
+
+def decode(mode: str, path: str) -> dict:
+    import PIL.Image
+
+    if mode == "before":
+        import numpy as np
+        import pydicom
+
+        from app.utils.dicom import window_to_uint8
+        from app.utils.image_pool import MODEL_IMAGE_MAX_SIDE
+
+        baseline = status_kb("RssAnon")
+        peak = {"kb": baseline}
+        sampler = _sample(peak)
+        started = time.perf_counter()
+        ds = pydicom.dcmread(path)
+        pixels = ds.pixel_array
+        frame = pixels[len(pixels) // 2] if pixels.ndim == 3 else pixels
+        image = PIL.Image.fromarray(window_to_uint8(np.asarray(frame), ds), "L")
+        image.thumbnail((MODEL_IMAGE_MAX_SIDE, MODEL_IMAGE_MAX_SIDE))
+    else:
+        from app.utils.image_pool import prepare_image
+
+        baseline = status_kb("RssAnon")
+        peak = {"kb": baseline}
+        sampler = _sample(peak)
+        started = time.perf_counter()
+        prepare_image(path)
+    elapsed = time.perf_counter() - started
+    sampler.set()
+    return {
+        "anon_mb": (max(peak["kb"], status_kb("RssAnon")) - baseline) / 1024,
+        "hwm_mb": status_kb("VmHWM") / 1024,
+        "seconds": elapsed,
+    }
+
+
+def _sample(peak: dict) -> threading.Event:
+    stop = threading.Event()
+
+    def run():
+        while not stop.is_set():
+            peak["kb"] = max(peak["kb"], status_kb("RssAnon"))
+            time.sleep(0.001)
+
+    threading.Thread(target=run, daemon=True).start()
+    return stop
+
+
+def run_child(mode: str, path: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--side", type=int, default=2048)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(decode(*args.child)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="medifusion-bench-dicom-") as tmp:
+        studies = {
+            f"{args.frames}x{args.side}^2 study": (os.path.join(tmp, "study.dcm"), args.frames, args.side, args.side),
+            "4300x3500 radiograph": (os.path.join(tmp, "radiograph.dcm"), 1, 4300, 3500),
+        }
+        for path, frames, rows, columns in studies.values():
+            write_study(path, frames, rows, columns)
+
+        print(f"{'input':<24} {'size':>8}   {'route':<7} {'heap peak':>10} {'RSS peak':>10} {'time':>8}")
+        for label, (path, *_) in studies.items():
+            size = os.path.getsize(path) / 1e6
+            for mode in ("before", "after"):
+                result = run_child(mode, path)
+                print(f"{label:<24} {size:6.0f}MB   {mode:<7} {result['anon_mb']:8.0f}MB "
+                      f"{result['hwm_mb']:8.0f}MB {result['seconds']:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Event-loop lag while large images are uploaded: decode on the loop vs. the process pool.
+
+Runs a small API in a child process with two upload routes. Both stream the
+file to disk first. A background task in the server sleeps 10ms in a loop
+and records how late it wakes up, which is the event-loop lag every other
+request on that worker would see.
+
+  before   decode, downscale and re-encode with PIL in the request
+           coroutine, then the (simulated) vision call, all on the loop,
+           which is what analyze_image_with_text used to do
+  after    prepare_image_async() on the process pool, then the vision call
+           via run_in_threadpool
+
+The vision model round trip is simulated with a --model-latency-ms sleep.
+
+Usage (from backend/):
+    python benchmarks/bench_image_pool_event_loop.py [--megapixels 25] [--concurrency 8] [--rounds 3]
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="medifusion-bench-uploads-"))
+os.environ.setdefault("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024))
+
+import httpx
+
+PORT = 8768
+BASE_URL = f"http://127.0.0.1:{PORT}"
+TICK = 0.01
+
+
+def serve(model_latency: float):
+    import logging
+
+    import PIL.Image
+    import uvicorn
+    from fastapi import FastAPI, File, UploadFile
+    from starlette.concurrency import run_in_threadpool
+
+    from app.utils.file_handler import open_upload_buffer, stream_upload_to_disk
+    from app.utils.image_pool import MODEL_IMAGE_MAX_SIDE, prepare_image_async, to_display_mode
+
+    logging.disable(logging.CRITICAL)
+    app = FastAPI()
+    lags = []
+
+    async def monitor():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(time.perf_counter() - started - TICK)
+
+    async def start_monitor():
+        asyncio.get_running_loop().create_task(monitor())
+
+    app.router.on_startup.append(start_monitor)
+
+    def vision_call(_image):
+        time.sleep(model_latency)
+        return {"top_label": "Normal"}
+
+    @app.post("/before")
+    async def before(file: UploadFile = File(...)):
+        stored = await stream_upload_to_disk(file)
+        with open_upload_buffer(stored.path) as buffer, PIL.Image.open(buffer) as image:
+            image.load()
+            derived = to_display_mode(image).copy()
+            derived.thumbnail((MODEL_IMAGE_MAX_SIDE, MODEL_IMAGE_MAX_SIDE))
+            derived.save(io.BytesIO(), "JPEG", quality=90)
+        result = vision_call(derived)
+        stored.discard()
+        return result
+
+    @app.post("/after")
+    async def after(file: UploadFile = File(...)):
+        stored = await stream_upload_to_disk(file)
+        image = await prepare_image_async(stored.path)
+        result = await run_in_threadpool(vision_call, image)
+        stored.discard()
+        return result
+
+    @app.post("/reset")
+    async def reset():
+        lags.clear()
+        return {}
+
+    @app.get("/lags")
+    async def get_lags():
+        return {"lags": lags}
+
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="critical")
+
+
+def make_png(megapixels: float) -> bytes:
+    import PIL.Image
+
+    side = int((megapixels * 1e6) ** 0.5)
+    # A smooth gradient with noise compresses like a real film, not like random bytes
+    gradient = PIL.Image.linear_gradient("L").resize((side, side))
+    noise = PIL.Image.effect_noise((side, side), 24)
+    buffer = io.BytesIO()
+    PIL.Image.blend(gradient, noise, 0.3).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def upload(client, route, data):
+    response = await client.post(f"{BASE_URL}/{route}", files={"file": ("xray.png", data, "image/png")})
+    response.raise_for_status()
+
+
+async def run_route(route, data, concurrency, rounds):
+    async with httpx.AsyncClient(timeout=600) as client:
+        await upload(client, route, data)  # warm up (spawns the pool workers)
+        await client.post(f"{BASE_URL}/reset")
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*(upload(client, route, data) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        lags = (await client.get(f"{BASE_URL}/lags")).json()["lags"]
+    return sorted(lag * 1000 for lag in lags), elapsed
+
+
+def wait_for_server(process):
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("benchmark server exited")
+        try:
+            httpx.get(f"{BASE_URL}/lags", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("benchmark server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, default=25)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--model-latency-ms", type=float, default=200)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.model_latency_ms / 1000)
+        return
+
+    data = make_png(args.megapixels)
+    print(f"{args.concurrency} concurrent uploads of a {args.megapixels:g}MP PNG ({len(data) / 1e6:.1f}MB), "
+          f"{args.rounds} rounds, model latency {args.model_latency_ms:g}ms\n")
+    print(f"{'route':<7} {'lag p50':>9} {'p99':>9} {'max':>9}   {'uploads/s':>9}")
+    for route in ("before", "after"):
+        process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "--serve",
+            "--model-latency-ms", str(args.model_latency_ms),
+        ])
+        try:
+            wait_for_server(process)
+            lags, elapsed = asyncio.run(run_route(route, data, args.concurrency, args.rounds))
+        finally:
+            process.terminate()
+            process.wait()
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+        print(f"{route:<7} {statistics.median(lags):7.1f}ms {p99:7.1f}ms {lags[-1]:7.1f}ms   "
+              f"{args.concurrency * args.rounds / elapsed:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Patient search benchmark: FTS5 index vs. the old ILIKE scan.
+
+Fills a fresh SQLite database with --users synthetic users (90% patients),
+builds the users_fts index through search_service.ensure_search_index and
+times search_patients() for a mix of first-name, surname, prefix and
+username queries. The old '%term%' ILIKE query is timed once per term for
+comparison.
+
+Usage (from backend/):
+    python benchmarks/bench_patient_search.py [--users 1000000] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="medifusion-bench-uploads-"))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import apply_sqlite_pragmas
+from app.models.base import Base
+from app.models.user import User
+from app.services.search_service import ensure_search_index, search_patients
+
+FIRST_NAMES = [
+    "james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "william",
+    "elizabeth", "david", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah",
+    "charles", "karen", "priya", "arjun", "swathi", "rahul", "ananya", "vikram", "lakshmi",
+    "wei", "mei", "hiroshi", "yuki", "fatima", "omar", "aisha", "carlos", "sofia", "mateo",
+    "lucia", "olga", "ivan", "noah", "emma", "liam", "olivia", "ava", "mia", "lucas", "amara",
+]
+SYLLABLES = ["ka", "ra", "smi", "th", "son", "lee", "pa", "tel", "ng", "wa", "gar", "cia",
+             "mar", "tin", "ez", "ro", "dri", "guez", "ku", "mar", "ch", "ow", "dh", "ury"]
+
+QUERIES = ["john", "jo", "smith", "sm", "priya ka", "olivia ro", "user12345", "zzzz"]
+
+
+def surname(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def populate(engine, count, rng):
+    Base.metadata.create_all(engine, tables=[User.__table__])
+    batch = []
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        for i in range(count):
+            first = rng.choice(FIRST_NAMES)
+            last = surname(rng)
+            if i % 1000 == 0:
+                last = "Smith"
+            batch.append((
+                f"user{i}", "x", f"{first.capitalize()} {last}",
+                "patient" if rng.random() < 0.9 else "doctor", f"user{i}@example.com",
+            ))
+            if len(batch) == 50000:
+                cursor.executemany(
+                    "INSERT INTO users (username, password, full_name, role, email) VALUES (?, ?, ?, ?, ?)",
+                    batch,
+                )
+                batch.clear()
+        if batch:
+            cursor.executemany(
+                "INSERT INTO users (username, password, full_name, role, email) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def time_ms(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="medifusion-bench-"), "search.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, journal_mode="WAL", synchronous="NORMAL",
+                             busy_timeout_ms=5000, mmap_size=256 * 1024 * 1024)
+
+    rng = random.Random(42)
+    seconds, _ = time_ms(lambda: populate(engine, args.users, rng))
+    print(f"Inserted {args.users:,} users in {seconds / 1000:.1f}s")
+    seconds, _ = time_ms(lambda: ensure_search_index(engine))
+    print(f"Built users_fts in {seconds / 1000:.1f}s\n")
+
+    Session = sessionmaker(bind=engine)
+    print(f"{'query':<12} {'hits':>5} {'fts p50':>9} {'fts p99':>9} {'ilike':>9}")
+    with Session() as db:
+        for term in QUERIES:
+            samples = []
+            for _ in range(args.repeat):
+                ms, hits = time_ms(lambda: search_patients(db, term, args.limit))
+                samples.append(ms)
+            samples.sort()
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+            # Old query: LIMIT stops early on common terms, rare terms scan every row
+            ilike_ms, _ = time_ms(lambda: db.execute(
+                text("SELECT id FROM users WHERE role = 'patient' AND "
+                     "(username LIKE :p OR full_name LIKE :p) LIMIT :limit"),
+                {"p": f"%{term}%", "limit": args.limit},
+            ).all())
+            print(f"{term:<12} {len(hits):>5} {statistics.median(samples):>8.2f}ms {p99:>8.2f}ms {ilike_ms:>8.2f}ms")
+
+    # The trigger path: a signup is searchable as soon as it commits
+    with Session() as db:
+        db.add(User(username="brandnew_patient", password="x", full_name="Zebulon Quux", role="patient"))
+        db.commit()
+        ms, hits = time_ms(lambda: search_patients(db, "zebu", args.limit))
+        print(f"\nNew signup found: {bool(hits)} ({ms:.2f}ms)")
+
+
+if __name__ == "__main__":
+    main()
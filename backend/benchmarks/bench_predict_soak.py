@@ -0,0 +1,185 @@
+"""
+Soak test for POST /predict/image: no file descriptor or disk growth.
+
+Starts the API in-process on a throwaway SQLite database and keeps
+--concurrency clients posting X-rays for --duration seconds, alternating
+small images (analyzed from memory) and large ones (above
+UPLOAD_SPOOL_MEMORY_BYTES, so they spill to a temp file). Every few seconds
+it samples the process's open file descriptors, the files and bytes in the
+temp and upload directories, and RSS. All of them should stay flat. The old
+route left one NamedTemporaryFile behind per request.
+
+The Gemini call is replaced by a local PIL decode of the same buffer, so
+the run needs no network and still touches every byte. Pass --real-ai to
+keep the real call (needs GEMINI_API_KEY).
+
+Usage (from backend/):
+    python benchmarks/bench_predict_soak.py [--duration 60] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="medifusion-bench-")
+_spill_dir = os.path.join(_tmpdir, "tmp")
+os.makedirs(_spill_dir)
+os.environ["TMPDIR"] = _spill_dir
+tempfile.tempdir = _spill_dir
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/bench.db"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmpdir, "uploads")
+os.environ.pop("DEV_MODE", None)
+
+import logging
+import httpx
+import PIL.Image
+import uvicorn
+
+logging.disable(logging.CRITICAL)
+PORT = 8767
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+def local_decode(image, prompt: str) -> str:
+    with PIL.Image.open(image) as decoded:
+        decoded.load()
+        return json.dumps({"top_label": "Normal", "top_prob": 0.5, "size": decoded.size})
+
+
+def make_image(side: int) -> bytes:
+    buffer = io.BytesIO()
+    PIL.Image.frombytes("L", (side, side), os.urandom(side * side)).save(buffer, "PNG", compress_level=0)
+    return buffer.getvalue()
+
+
+def dir_usage(path: str) -> tuple:
+    files = total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+                files += 1
+            except FileNotFoundError:
+                pass
+    return files, total
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def sample(upload_dir: str) -> dict:
+    tmp_files, tmp_bytes = dir_usage(_spill_dir)
+    upload_files, upload_bytes = dir_usage(upload_dir)
+    return {
+        "fds": len(os.listdir("/proc/self/fd")),
+        "tmp_files": tmp_files, "tmp_mb": tmp_bytes / 1e6,
+        "upload_files": upload_files, "upload_mb": upload_bytes / 1e6,
+        "rss_mb": rss_mb(),
+    }
+
+
+def start_server(app):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=PORT, log_level="critical"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def client_loop(client, headers, images, deadline, counts):
+    i = 0
+    while time.perf_counter() < deadline:
+        image = images[i % len(images)]
+        response = await client.post(
+            f"{BASE_URL}/predict/image", headers=headers, files={"file": ("xray.png", image, "image/png")}
+        )
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        i += 1
+
+
+async def soak(headers, images, duration, concurrency, interval, upload_dir):
+    counts = {}
+    samples = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        tasks = [asyncio.create_task(client_loop(client, headers, images, deadline, counts)) for _ in range(concurrency)]
+        started = time.perf_counter()
+        while not all(task.done() for task in tasks):
+            await asyncio.sleep(interval)
+            samples.append((time.perf_counter() - started, sample(upload_dir)))
+        await asyncio.gather(*tasks)
+    return counts, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=5)
+    parser.add_argument("--real-ai", action="store_true")
+    args = parser.parse_args()
+
+    import app.ai.predictor as predictor
+    if not args.real_ai:
+        predictor.analyze_image_with_text = local_decode
+
+    from app.main import app
+    from app.config import UPLOAD_DIR
+    from app.core.database import SessionLocal
+    from app.core.security import create_access_token, hash_password
+    from app.models.user import User
+    from app.utils.file_handler import UPLOAD_SPOOL_MEMORY_BYTES
+
+    with SessionLocal() as db:
+        db.add(User(username="soak", password=hash_password("x"), role="patient", is_verified=True))
+        db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'soak'})}"}
+
+    # One image held in memory, one large enough to spill
+    small = make_image(512)
+    large = make_image(int((UPLOAD_SPOOL_MEMORY_BYTES * 1.5) ** 0.5))
+    print(f"images: {len(small) / 1e6:.1f}MB (in memory) and {len(large) / 1e6:.1f}MB (spills), "
+          f"spool threshold {UPLOAD_SPOOL_MEMORY_BYTES / 1e6:.1f}MB")
+
+    start_server(app)
+    # Warm up (DB pool, listening socket, spool of each size) before taking the baseline
+    for image in (small, large):
+        httpx.post(f"{BASE_URL}/predict/image", headers=headers, files={"file": ("xray.png", image, "image/png")})
+    baseline = sample(UPLOAD_DIR)
+    counts, samples = asyncio.run(
+        soak(headers, [small, large], args.duration, args.concurrency, args.interval, UPLOAD_DIR)
+    )
+    time.sleep(0.5)
+    final = sample(UPLOAD_DIR)
+
+    print(f"\n{'t(s)':>6} {'fds':>5} {'tmp files':>10} {'tmp MB':>8} {'upload files':>13} {'RSS MB':>8}")
+    rows = [("0", baseline), *((f"{elapsed:.0f}", point) for elapsed, point in samples), ("end", final)]
+    for label, point in rows:
+        print(f"{label:>6} {point['fds']:5d} {point['tmp_files']:10d} {point['tmp_mb']:8.1f} "
+              f"{point['upload_files']:13d} {point['rss_mb']:8.1f}")
+    print(f"\nresponses: {dict(sorted(counts.items()))}")
+
+    leaked = (
+        final["fds"] > baseline["fds"] + args.concurrency + 2  # + keep-alive client sockets
+        or final["tmp_files"] > baseline["tmp_files"]
+        or final["upload_files"] > baseline["upload_files"]
+    )
+    print("LEAK: descriptors or files grew" if leaked else "OK: no descriptor or disk growth")
+    sys.exit(1 if leaked else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Mixed read/write SQLite benchmark comparing connection configurations.
+
+Runs writer threads (inserting/updating patient_cases) alongside reader
+threads (dashboard-style list queries) against a fresh database file for
+each configuration. It reports throughput, p99 latency and how many
+operations failed with "database is locked".
+
+Usage (from backend/):
+    python benchmarks/bench_sqlite_mixed_rw.py [--seconds 10] [--writers 4] [--readers 8]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="medifusion-bench-uploads-"))
+
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import apply_sqlite_pragmas
+from app.models.base import Base
+from app.models.patient_case import PatientCase
+
+CONFIGS = {
+    # Library defaults: rollback journal, synchronous=FULL (every config shares a 100ms connect timeout)
+    "default": None,
+    "wal": dict(journal_mode="WAL", synchronous="NORMAL", busy_timeout_ms=0, mmap_size=0),
+    "wal+busy+mmap": dict(journal_mode="WAL", synchronous="NORMAL", busy_timeout_ms=5000,
+                          mmap_size=256 * 1024 * 1024),
+}
+
+
+def make_engine(path, pragmas):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 0.1})
+    if pragmas:
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, **pragmas)
+    return engine
+
+
+def run(name, pragmas, args):
+    path = os.path.join(tempfile.mkdtemp(prefix="medifusion-bench-"), "bench.db")
+    engine = make_engine(path, pragmas)
+    Base.metadata.create_all(engine, tables=[PatientCase.__table__])
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        db.bulk_save_objects([
+            PatientCase(patient_name=f"patient{i % 500}", status="submitted", symptoms="cough")
+            for i in range(args.rows)
+        ])
+        db.commit()
+
+    stop = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    stats = {"read": [], "write": [], "locked": 0}
+
+    def record(kind, elapsed):
+        with lock:
+            stats[kind].append(elapsed)
+
+    def writer():
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    if random.random() < 0.5:
+                        db.add(PatientCase(patient_name=f"patient{random.randrange(500)}", status="new"))
+                    else:
+                        db.execute(
+                            update(PatientCase)
+                            .where(PatientCase.id == random.randrange(1, args.rows))
+                            .values(status="submitted")
+                        )
+                    db.commit()
+                record("write", time.perf_counter() - started)
+            except OperationalError:
+                with lock:
+                    stats["locked"] += 1
+
+    def reader():
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                with Session() as db:
+                    db.execute(
+                        select(PatientCase.id, PatientCase.status, PatientCase.created_at)
+                        .where(PatientCase.patient_name == f"patient{random.randrange(500)}")
+                        .order_by(PatientCase.created_at.desc())
+                        .limit(50)
+                    ).all()
+                record("read", time.perf_counter() - started)
+            except OperationalError:
+                with lock:
+                    stats["locked"] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    def p99(values):
+        return sorted(values)[int(len(values) * 0.99) - 1] * 1000 if values else float("nan")
+
+    print(f"{name:<15} reads/s={len(stats['read']) / args.seconds:8.0f} "
+          f"writes/s={len(stats['write']) / args.seconds:7.0f} "
+          f"read p99={p99(stats['read']):7.2f}ms write p99={p99(stats['write']):7.2f}ms "
+          f"locked={stats['locked']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, pragmas in CONFIGS.items():
+        run(name, pragmas, args)
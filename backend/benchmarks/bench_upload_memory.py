@@ -0,0 +1,166 @@
+"""
+Upload memory benchmark: buffered vs. streaming upload path.
+
+Runs a small API in a child process with two upload routes and fires
+--concurrency simultaneous uploads of a --size-mb file at each one, sampling
+the server's anonymous RSS (heap, not page cache) every few milliseconds:
+
+  before   await file.read() for the AI, seek(0), write file.file.read() to disk
+  after    stream_upload_to_disk() (1MB chunks, SHA-256, size limit) and an
+           mmap of the saved file from open_upload_buffer() for the AI
+
+The AI call is replaced by an MD5 over the whole buffer, so every byte is
+still touched the way a decoder would. Linux only (reads /proc/self/status).
+
+Usage (from backend/):
+    python benchmarks/bench_upload_memory.py [--size-mb 50] [--concurrency 8] [--rounds 3]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="medifusion-bench-uploads-"))
+os.environ.setdefault("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024))
+
+import httpx
+
+PORT = 8766
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+def rss_anon_kb() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1])
+    return 0
+
+
+def serve():
+    import logging
+    import uuid
+
+    import uvicorn
+    from fastapi import FastAPI, File, UploadFile
+
+    from app.config import UPLOAD_DIR
+    from app.utils.file_handler import open_upload_buffer, stream_upload_to_disk
+
+    logging.disable(logging.CRITICAL)
+    app = FastAPI()
+    peak = {"kb": rss_anon_kb()}
+
+    def sample():
+        while True:
+            peak["kb"] = max(peak["kb"], rss_anon_kb())
+            time.sleep(0.002)
+
+    threading.Thread(target=sample, daemon=True).start()
+
+    def analyze(buffer) -> str:
+        return hashlib.md5(buffer).hexdigest()
+
+    @app.post("/before")
+    async def before(file: UploadFile = File(...)):
+        file_bytes = await file.read()
+        await file.seek(0)
+        path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.bin")
+        with open(path, "wb") as f:
+            f.write(file.file.read())
+        result = analyze(file_bytes)
+        os.remove(path)
+        return {"md5": result}
+
+    @app.post("/after")
+    async def after(file: UploadFile = File(...)):
+        stored = await stream_upload_to_disk(file)
+        with open_upload_buffer(stored.path) as buffer:
+            result = analyze(buffer)
+        os.remove(stored.path)
+        return {"md5": result}
+
+    @app.post("/reset")
+    async def reset():
+        peak["kb"] = rss_anon_kb()
+        return {"kb": peak["kb"]}
+
+    @app.get("/peak")
+    async def get_peak():
+        return {"kb": peak["kb"]}
+
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="critical")
+
+
+async def upload(client: httpx.AsyncClient, route: str, path: str):
+    with open(path, "rb") as f:
+        response = await client.post(f"{BASE_URL}/{route}", files={"file": ("xray.bin", f, "image/png")})
+    response.raise_for_status()
+
+
+async def run_route(route: str, path: str, concurrency: int, rounds: int):
+    async with httpx.AsyncClient(timeout=300) as client:
+        baseline = (await client.post(f"{BASE_URL}/reset")).json()["kb"]
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await asyncio.gather(*(upload(client, route, path) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        peak = (await client.get(f"{BASE_URL}/peak")).json()["kb"]
+    return baseline, peak, elapsed
+
+
+def wait_for_server(process):
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("benchmark server exited")
+        try:
+            httpx.get(f"{BASE_URL}/peak", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("benchmark server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix="medifusion-bench-"), "upload.bin")
+    with open(path, "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    print(f"{args.concurrency} concurrent uploads of {args.size_mb}MB, {args.rounds} rounds per route\n")
+    for route in ("before", "after"):
+        # Fresh server per route so one run's freed-but-retained heap doesn't skew the other
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve"])
+        try:
+            wait_for_server(process)
+            baseline, peak, elapsed = asyncio.run(run_route(route, path, args.concurrency, args.rounds))
+        finally:
+            process.terminate()
+            process.wait()
+        throughput = args.size_mb * args.concurrency * args.rounds / elapsed
+        print(
+            f"{route:<7} peak heap {peak / 1024:7.1f}MB  (+{(peak - baseline) / 1024:7.1f}MB over idle)"
+            f"   {throughput:6.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Broadcast latency to many WebSocket connections with a few slow clients.
+
+Registers --connections simulated sockets with a ConnectionManager; each
+send_text() yields to the event loop like a real socket write, and
+--slow of them take --slow-ms per message (a client on a bad link or
+not reading). Then --rounds broadcasts are sent and, for every fast
+client, the delay from the start of broadcast() until its send_text()
+completed is recorded.
+
+  before   the previous manager, which awaited send_text() on each socket
+           in turn, so every client behind a slow one waited for it
+  after    app.core.websocket_manager (in-memory backplane): broadcast()
+           only enqueues onto each connection's bounded queue;
+           per-connection writer tasks send
+
+Also reported: how long the broadcast() call itself blocked its caller
+(a route handler, in the app).
+
+Usage (from backend/):
+    python benchmarks/bench_ws_broadcast.py [--connections 10000] [--slow 50] [--slow-ms 100]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.websocket_manager import ConnectionManager
+
+
+class SequentialManager:
+    """The manager as it was: one awaited send_text() after another."""
+
+    def __init__(self):
+        self.active_connections = {}
+
+    async def register(self, websocket, user_id):
+        self.active_connections.setdefault(user_id, []).append(websocket)
+
+    async def broadcast(self, message: dict):
+        message_json = json.dumps(message)
+        for connections in self.active_connections.values():
+            for connection in connections:
+                try:
+                    await connection.send_text(message_json)
+                except Exception:
+                    pass
+
+
+class FakeSocket:
+    def __init__(self, delay: float, latencies: list):
+        self.delay = delay
+        self.latencies = latencies
+
+    async def send_text(self, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+            self.latencies.append(time.perf_counter() - json.loads(message)["sent_at"])
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+async def run(mode: str, args) -> dict:
+    manager = SequentialManager() if mode == "before" else ConnectionManager()
+    latencies = []
+    slow_every = args.connections // args.slow if args.slow else 0
+    for user_id in range(args.connections):
+        slow = slow_every and user_id % slow_every == 0
+        await manager.register(FakeSocket(args.slow_ms / 1000 if slow else 0, latencies), user_id)
+    fast = args.connections - args.slow
+
+    blocked = []
+    for _ in range(args.rounds):
+        expected = len(latencies) + fast
+        started = time.perf_counter()
+        await manager.broadcast({"type": "case_update", "sent_at": started})
+        blocked.append(time.perf_counter() - started)
+        while len(latencies) < expected:
+            await asyncio.sleep(0.001)
+
+    if mode == "after":
+        await manager.close()
+
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max": latencies[-1] * 1000,
+        "blocked": statistics.mean(blocked) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--slow", type=int, default=50)
+    parser.add_argument("--slow-ms", type=float, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"{args.connections} connections, {args.slow} slow ({args.slow_ms:.0f}ms per send), "
+          f"{args.rounds} broadcasts; delivery latency to the fast clients:")
+    print(f"{'manager':<8} {'p50':>10} {'p99':>10} {'max':>10} {'broadcast() blocked':>20}")
+    for mode in ("before", "after"):
+        result = asyncio.run(run(mode, args))
+        print(f"{mode:<8} {result['p50']:8.1f}ms {result['p99']:8.1f}ms {result['max']:8.1f}ms "
+              f"{result['blocked']:18.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+WebSocket latency under concurrent database load.
+
+Starts the API in-process on a throwaway SQLite database, keeps one
+WebSocket client pinging /ws/{user_id} (the route answers with a pong), and
+measures round-trip latency first with the server idle and then while many
+clients hammer the async DB routes (accept/review cases). With the async
+engine the event loop keeps serving the socket, so both distributions
+should look alike.
+
+Usage (from backend/):
+    python benchmarks/bench_ws_latency_under_db_load.py [--cases 2000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="medifusion-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmpdir}/bench.db"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmpdir, "uploads")
+os.environ.pop("DEV_MODE", None)
+
+import logging
+import httpx
+import uvicorn
+import websockets
+
+from app.main import app
+from app.core.database import SessionLocal
+from app.core.security import create_access_token, hash_password
+from app.models.patient_case import PatientCase
+from app.models.user import User
+
+logging.disable(logging.CRITICAL)
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+
+
+def seed(n_cases: int):
+    db = SessionLocal()
+    doctor = User(username="bench_doc", password=hash_password("x"), full_name="Bench Doctor",
+                  role="doctor", is_verified=True)
+    db.add(doctor)
+    db.commit()
+    db.bulk_save_objects([
+        PatientCase(patient_name=f"patient{i}", status="submitted", symptoms="cough")
+        for i in range(n_cases)
+    ])
+    db.commit()
+    doctor_id = doctor.id
+    db.close()
+    return doctor_id
+
+
+def start_server():
+    config = uvicorn.Config(app, host="127.0.0.1", port=PORT, log_level="critical")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def measure_ws(user_id: int, token: str, duration: float):
+    latencies = []
+    async with websockets.connect(f"ws://127.0.0.1:{PORT}/ws/{user_id}?token={token}") as ws:
+        await ws.recv()  # welcome message
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await ws.send('{"type": "ping"}')
+            while json.loads(await ws.recv())["type"] != "pong":
+                pass  # server heartbeat or a notification
+            latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0.01)
+    return latencies
+
+
+async def db_load(token: str, case_ids, concurrency: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    queue = asyncio.Queue()
+    for case_id in case_ids:
+        queue.put_nowait(case_id)
+
+    async with httpx.AsyncClient(base_url=BASE_URL, headers=headers, timeout=60) as client:
+        async def worker():
+            while not queue.empty():
+                case_id = queue.get_nowait()
+                await client.post(f"/doctor/cases/{case_id}/accept")
+                await client.post(f"/doctor/review/{case_id}", json={"notes": "bench", "diagnosis": "bench"})
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<12} n={len(latencies):<5} p50={statistics.median(latencies):7.2f}ms "
+          f"p99={p99:7.2f}ms max={latencies[-1]:7.2f}ms")
+
+
+async def main(args):
+    doctor_id = seed(args.cases)
+    start_server()
+    token = create_access_token({"sub": "bench_doc", "role": "doctor"})
+
+    idle = await measure_ws(doctor_id, token, duration=3)
+
+    load_started = time.perf_counter()
+    load = asyncio.create_task(db_load(token, range(1, args.cases + 1), args.concurrency))
+    loaded = await measure_ws(doctor_id, token, duration=3)
+    await load
+    elapsed = time.perf_counter() - load_started
+
+    print(f"DB load: {args.cases} accept+review pairs, {args.concurrency} concurrent clients, {elapsed:.1f}s")
+    summarize("idle", idle)
+    summarize("under load", loaded)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))